@@ -1,68 +1,109 @@
-import os
+import os, time
 import streamlit as st
 from dotenv import load_dotenv
 
-from engine.state import ensure_db, get_totals, get_earnings_df, get_decisions_df, set_setting, get_setting
-from engine.scheduler import SchedulerThread
-from services.income_tracker import summarize_earnings_by_source, earnings_timeseries
-from services.decision_engine import approve_decision, reject_decision
-from connectors.eth_readonly import set_wallet_address, get_wallet_address
+from engine.state import ensure_db, set_setting, remove_wallet, unit_of_work, enqueue_command
+from services.dashboard_data import (get_totals, get_earnings_daily_df, fetch_decisions, get_settings, fetch_wallets,
+                                     list_strategies)
+from services.decision_engine import approve_decisions, reject_decisions
+
+# pandas-heavy helpers, the scheduler, strategies and RPC connectors are imported where they are
+# used, so the first render doesn't wait for them
 
 load_dotenv()
 st.set_page_config(page_title="Passive Income AI — On-Chain", layout="wide")
 
-if "booted" not in st.session_state:
+@st.cache_resource
+def _boot():
+    # once per process, not per browser session. Scans run in engine.worker; the embedded one
+    # only leads when no other worker holds the lease (EMBEDDED_WORKER=false for UI-only replicas)
     ensure_db()
-    st.session_state.booted = True
-    st.session_state.scheduler = SchedulerThread(interval_seconds=int(os.getenv("SCHEDULER_INTERVAL_SECONDS", "300")))
-    st.session_state.scheduler.start()
+    if os.getenv("EMBEDDED_WORKER", "true").lower() == "true":
+        from engine.worker import Worker
+        Worker().start_background()
+    return True
+
+_boot()
 
 st.title("Passive Income AI — On-Chain")
 st.caption("Real on-chain tracking. No passwords, no private keys.")
 
+settings = get_settings()
+
+wallets = fetch_wallets()
+labels = {w[0]: (f"{w[1]} ({w[0][:8]}…{w[0][-4:]})" if w[1] else w[0]) for w in wallets}
+wallet_filter = st.selectbox("Wallet", [None] + list(labels), format_func=lambda a: "All wallets" if a is None else labels[a])
+chains = sorted({r["token"]["chain_id"] for r in list_strategies() if r["token"]})
+chain_filter = None
+if len(chains) > 1:
+    from connectors.eth_readonly import chain_name
+    chain_filter = st.selectbox("Chain", [None] + chains, format_func=lambda c: "All chains" if c is None else chain_name(c))
+
 c1, c2, c3 = st.columns(3)
-totals = get_totals()
-c1.metric("Total Earned (All-Time)", f"${totals['all_time']:.6f}")
-c2.metric("Last 7 Days", f"${totals['last_7']:.6f}")
+totals = get_totals(wallet=wallet_filter, chain_id=chain_filter)
+c1.metric("Total Earned (All-Time)", f"${totals['all_time_usd']:,.2f}")
+c2.metric("Last 7 Days", f"${totals['last_7_usd']:,.2f}")
 c3.metric("Pending Decisions", f"{totals['pending']}")
+if totals["unpriced"]:
+    st.caption(f"{totals['unpriced']} day(s) of earnings have no USD price yet and are not included "
+               "(`python -m engine.prices sync`).")
 
-df = get_earnings_df(days=30)
+df = get_earnings_daily_df(days=30, wallet=wallet_filter, chain_id=chain_filter)
 if not df.empty:
+    from services.income_tracker import summarize_earnings_by_source, daily_timeseries
     st.subheader("Earnings — last 30 days")
-    ts = earnings_timeseries(df)
-    st.line_chart(ts.set_index("date")["amount"])
-    st.subheader("By source")
-    by_src = summarize_earnings_by_source(df)
-    st.bar_chart(by_src.set_index("source")["amount"])
+    ts = daily_timeseries(df, "usd")
+    st.line_chart(ts.set_index("date")["usd"])
+    st.subheader("By source (USD)")
+    by_src = summarize_earnings_by_source(df, "usd")
+    st.bar_chart(by_src.set_index("source")["usd"])
 else:
     st.info("No earnings yet. Save your wallet and run strategies.")
 
 st.divider()
 st.subheader("Decision Queue")
-dec = get_decisions_df(status="pending")
-if dec.empty:
+# keyset pages, newest first: dec_pages holds the before_id of every page visited so far
+pages = st.session_state.setdefault("dec_pages", [None])
+page_size = st.session_state.get("dec_page_size", 50)
+dec = fetch_decisions(status="pending", before_id=pages[-1], limit=page_size)
+if not dec and len(pages) > 1:
+    pages.pop()
+    st.rerun()
+if not dec:
     st.success("No actions need approval right now.")
 else:
-    for _, row in dec.iterrows():
-        with st.container(border=True):
-            st.markdown(f"**{row['strategy']}** proposes: **{row['action']}**")
-            st.caption(f"Created: {row['created_at']}  •  Est. impact: ${row['estimated_value']:.2f}")
-            if row["note"]:
-                st.write(row["note"])
-            b1, b2, _ = st.columns([1,1,6])
-            if b1.button("Approve", key=f"a-{row['id']}"):
-                approve_decision(row["id"])
-                st.rerun()
-            if b2.button("Reject", key=f"r-{row['id']}"):
-                reject_decision(row["id"])
-                st.rerun()
+    st.caption(f"{totals['pending']} pending  •  page {len(pages)}")
+    # plain rows, no pandas; estimated_value is USD, NULL for proposals in a token without a price
+    view = [{"id": r[0], "created_at": r[1], "strategy": r[2], "action": r[3],
+             "estimated_value": "unpriced" if r[6] is None else f"${r[6]:,.2f}", "note": r[7]} for r in dec]
+    picked = st.dataframe(view, hide_index=True, use_container_width=True, on_select="rerun",
+                          selection_mode="multi-row", key=f"dec-{pages[-1]}-{page_size}",
+                          column_config={"estimated_value": st.column_config.TextColumn("Est. impact")})
+    ids = [view[i]["id"] for i in picked.selection.rows]
+    b1, b2, b3, b4, b5, b6 = st.columns([1.2, 1.2, 1.4, 0.8, 0.8, 1.2])
+    if b1.button(f"Approve ({len(ids)})", disabled=not ids):
+        st.toast(f"Approved {approve_decisions(ids)}")
+        st.rerun()
+    if b2.button(f"Reject ({len(ids)})", disabled=not ids):
+        st.toast(f"Rejected {reject_decisions(ids)}")
+        st.rerun()
+    if b3.button(f"Approve page ({len(view)})"):
+        st.toast(f"Approved {approve_decisions([v['id'] for v in view])}")
+        st.rerun()
+    if b4.button("‹ Newer", disabled=len(pages) == 1):
+        pages.pop()
+        st.rerun()
+    if b5.button("Older ›", disabled=len(dec) < page_size):
+        pages.append(int(dec[-1][0]))
+        st.rerun()
+    b6.selectbox("Per page", (25, 50, 100, 250), index=1, key="dec_page_size", label_visibility="collapsed")
 
 with st.sidebar:
     st.header("Settings")
-    auto = get_setting("AUTO_APPROVE_ENABLED", default="false").lower() == "true"
-    cap = float(get_setting("AUTO_APPROVE_THRESHOLD", default="1.0"))
+    auto = settings.get("AUTO_APPROVE_ENABLED", "false").lower() == "true"
+    cap = float(settings.get("AUTO_APPROVE_THRESHOLD", "1.0"))
     n_auto = st.toggle("AI Auto-Approve (cap)", value=auto)
-    n_cap = st.number_input("Auto-Approve cap (units)", value=cap, min_value=0.0, step=0.1)
+    n_cap = st.number_input("Auto-Approve cap (USD)", value=cap, min_value=0.0, step=0.1)
     if (n_auto != auto) or (n_cap != cap):
         set_setting("AUTO_APPROVE_ENABLED", str(n_auto).lower())
         set_setting("AUTO_APPROVE_THRESHOLD", str(n_cap))
@@ -70,28 +111,74 @@ with st.sidebar:
 
     st.divider()
     st.subheader("On-Chain Read-Only")
-    w = st.text_input("Public wallet address (EVM)", value=get_wallet_address(), placeholder="0x...")
-    if st.button("Save wallet address"):
-        set_wallet_address(w.strip())
-        st.toast("Wallet address saved")
+    w = st.text_input("Public wallet address (EVM)", value="", placeholder="0x...")
+    if st.button("Add wallet address"):
+        from connectors.eth_readonly import set_wallet_address
+        try:
+            set_wallet_address(w)
+        except ValueError:
+            st.error("Not a wallet address: expected 0x followed by 40 hex characters.")
+        else:
+            st.toast("Wallet address saved")
+            st.rerun()
+    st.caption(f"Tracking {len(wallets)} wallet(s).")
+    drop = st.multiselect("Stop tracking", list(labels), format_func=lambda a: labels[a])
+    if drop and st.button("Remove selected wallets"):
+        for a in drop:
+            remove_wallet(a)
+        st.toast(f"Removed {len(drop)} wallet(s)")
+        st.rerun()
 
     st.caption("RPC URL (optional). Set RPC_URL env var for persistence.")
 
     st.divider()
     st.subheader("Strategies")
-    st.caption("Toggle which on-chain readers are active.")
-    import strategies.registry as reg
+    st.caption("Toggle which on-chain readers are active. Add tokens with `python -m strategies.registry import`.")
+    rows = [r for r in list_strategies() if r["setting_key"]]
     toggles = {}
-    for key, meta in reg.STRATEGIES_META.items():
-        val = (get_setting(meta['setting_key'], "true").lower()=="true")
-        toggles[key] = st.toggle(meta["label"], value=val)
+    with st.container(height=320 if len(rows) > 8 else None):
+        for row in rows:
+            toggles[row["setting_key"]] = (row["toggle"], st.toggle(row["label"] or row["name"], value=row["toggle"],
+                                                                   key=f"strat-{row['name']}"))
     if st.button("Save strategy toggles"):
-        for key, val in toggles.items():
-            set_setting(reg.STRATEGIES_META[key]['setting_key'], str(val).lower())
+        with unit_of_work():
+            for key, (old, new) in toggles.items():
+                if old != new:
+                    set_setting(key, str(new).lower())
         st.toast("Strategy toggles saved")
 
     if st.button("Run strategies now"):
-        st.session_state.scheduler.nudge()
-        st.toast("Scan triggered")
+        enqueue_command("scan")
+        st.toast("Scan requested")
+    from engine.worker import status as worker_status
+    worker = worker_status()
+    if worker and worker["alive"]:
+        stats = worker["status"].get("stats", {})
+        st.caption(f"Scanner {worker['owner'].rsplit(':', 1)[0]}  •  heartbeat {time.time() - worker['heartbeat_at']:.0f}s ago")
+        if stats.get("cycles"):
+            st.caption(f"Scans: {stats['cycles']}  •  last {stats['last']:.2f}s  •  "
+                       f"p50 {stats['p50']:.2f}s  •  p95 {stats['p95']:.2f}s  •  failures {stats['failures']}")
+    else:
+        st.warning("No scanner is running. Start one with `python -m engine.worker`.")
+
+with st.expander("Diagnostics"):
+    # pandas and the RPC connectors load only once the panel is switched on
+    if st.toggle("Load diagnostics", key="diag"):
+        from services.diagnostics import tables
+        published = worker["status"] if worker and worker["alive"] else {}
+        diag = tables(published.get("metrics"), published.get("endpoints"))
+        for title, key in (("Scheduler cycles", "cycle"), ("Cycle phases", "phases"), ("Strategies", "strategies"),
+                           ("RPC (per method)", "rpc"), ("RPC endpoints", "endpoints"),
+                           ("RPC retries", "retries"), ("Database (per function)", "db")):
+            if not diag[key].empty:
+                st.markdown(f"**{title}**")
+                st.dataframe(diag[key], hide_index=True, use_container_width=True)
+        if st.button("Profile next scan"):
+            enqueue_command("profile")
+            st.toast("The next scan will be profiled")
+        prof = published.get("last_profile")
+        if prof:
+            st.caption(f"Last profile: {prof[0]} (open with snakeviz or pstats)")
+            st.code(prof[1])
 
 st.caption("© Passive Income AI — On-Chain. Public-address only; no passwords collected.")
@@ -0,0 +1,138 @@
+from __future__ import annotations
+import argparse, json, os, random, tempfile, time
+from datetime import datetime, timedelta
+
+import engine.state as state
+from services import dashboard_data
+from services.decision_engine import approve_decisions
+
+# Query timings for the dashboard/scheduler read paths on a synthetic history, plus write
+# throughput and a full dashboard data load (cold and cached):
+#   python -m bench.bench_db --rows 1000000            (indexed, current schema)
+#   python -m bench.bench_db --rows 1000000 --no-index (same data with the secondary indexes dropped)
+#   python -m bench.bench_db --rows 10000,100000,1000000 (one result per table size)
+
+INDEXES = ["ix_earnings_ts", "ix_earnings_source_ts", "ix_earnings_wallet_ts", "ix_decisions_status_id"]
+
+def _earnings_df(days: int = 30):
+    # the raw-row read the dashboard used before the earnings_daily rollup, kept as a baseline
+    import pandas as pd
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    with state._conn() as con:
+        rows = con.execute("SELECT ts, source, amount, note, wallet FROM earnings WHERE ts >= ? ORDER BY ts ASC",
+                           (since,)).fetchall()
+    df = pd.DataFrame(rows, columns=["ts", "source", "amount", "note", "wallet"])
+    df["ts"] = pd.to_datetime(df["ts"])
+    return df
+
+def populate(rows: int, wallets: int = 20, days: int = 730, seed: int = 7):
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    addrs = ["0x" + format(i + 1, "040x") for i in range(wallets)]
+    sources = ["ETH yield", "stETH yield", "rETH yield"]
+    batch = 50_000
+    with state.unit_of_work() as con:
+        for start in range(0, rows, batch):
+            con.executemany(
+                "INSERT INTO earnings(ts, source, amount, note, wallet) VALUES(?,?,?,?,?)",
+                [((now - timedelta(seconds=rnd.randrange(days * 86400))).isoformat(),
+                  rnd.choice(sources), rnd.random() * 1e-3, "", rnd.choice(addrs))
+                 for _ in range(min(batch, rows - start))])
+        con.executemany(
+            "INSERT OR IGNORE INTO balances(day, token, amount, wallet) VALUES(?,?,?,?)",
+            [((now - timedelta(days=d)).date().isoformat(), tok, 1.0, w)
+             for d in range(days) for tok in ("ETH", "stETH", "rETH") for w in addrs])
+        con.executemany(
+            "INSERT INTO decisions(created_at, strategy, action, payload_json, status, estimated_value, note) VALUES(?,?,?,?,?,?,?)",
+            [(now.isoformat(), "bench", "noop", "{}", "pending" if i % 100 == 0 else "approved", 0.0, "")
+             for i in range(max(rows // 10, 1))])
+        state._rebuild_rollups(con)
+    return addrs
+
+def timed(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def dashboard_load(wallet: str | None = None):
+    # everything app.py reads for one page render
+    settings = dashboard_data.get_settings()
+    dashboard_data.fetch_wallets()
+    dashboard_data.get_totals(wallet=wallet)
+    dashboard_data.get_earnings_daily_df(days=30, wallet=wallet)
+    dashboard_data.fetch_decisions(status="pending", limit=50)
+    return settings
+
+def _cold_dashboard_load(wallet: str | None = None):
+    dashboard_data.clear()
+    return dashboard_load(wallet)
+
+def throughput(n: int, fn) -> float:
+    t = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - t)
+
+def run(rows: int, indexed: bool = True, path: str | None = None) -> dict:
+    tmp = None
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "bench.db")
+    state.close_connections()
+    state.DB_PATH = path
+    try:
+        state.ensure_db()
+        addrs = populate(rows)
+        if not indexed:
+            with state.unit_of_work() as con:
+                for ix in INDEXES:
+                    con.execute(f"DROP INDEX IF EXISTS {ix}")
+        with state._conn() as con:
+            con.execute("ANALYZE")
+        today = datetime.utcnow().date().isoformat()
+        results = {
+            "get_totals": timed(state.get_totals),
+            "get_totals_wallet": timed(lambda: state.get_totals(addrs[0])),
+            "get_earnings_30d": timed(lambda: _earnings_df(30)),
+            "get_earnings_daily_30d": timed(lambda: state.get_earnings_daily_df(30)),
+            "fetch_pending_decisions": timed(lambda: state.fetch_decisions("pending")),
+            "fetch_pending_page": timed(lambda: state.fetch_decisions("pending", limit=50)),
+            "get_prev_balance": timed(lambda: state.get_prev_balance("ETH", today, addrs[0])),
+            "upsert_daily_balance": timed(lambda: state.upsert_daily_balance("ETH", 1.0, today, addrs[0])),
+            "dashboard_load_cold": timed(_cold_dashboard_load),
+            "dashboard_load_cold_wallet": timed(lambda: _cold_dashboard_load(addrs[0])),
+            "dashboard_load_cached": timed(dashboard_load),
+        }
+        now = datetime.utcnow().isoformat()
+        rates = {
+            "insert_earning": throughput(500, lambda: [state.insert_earning("bench", 1e-6, wallet=addrs[0], ts=now)
+                                                       for _ in range(500)]),
+            "insert_earnings_batch": throughput(20_000, lambda: state.insert_earnings(
+                [(now, "bench", 1e-6, "", addrs[i % len(addrs)], 1, "ETH") for i in range(20_000)])),
+            "upsert_daily_balances_batch": throughput(len(addrs) * 100, lambda: state.upsert_daily_balances(
+                [((datetime.utcnow() + timedelta(days=d)).date().isoformat(), "BENCH", 1.0, w, None, None, 1)
+                 for d in range(100) for w in addrs])),
+            "iter_earnings": throughput(rows, lambda: sum(len(c) for c in state.iter_earnings())),
+        }
+        pending = [r[0] for r in state.fetch_decisions("pending")]
+        rates["approve_decisions_bulk"] = throughput(len(pending), lambda: approve_decisions(pending))
+        return {"rows": rows, "indexed": indexed, "seconds": results, "rows_per_second": rates}
+    finally:
+        state.close_connections()
+        if tmp is not None:
+            tmp.cleanup()
+
+def main():
+    ap = argparse.ArgumentParser(description="SQLite query benchmark")
+    ap.add_argument("--rows", default="1000000", help="comma-separated table sizes")
+    ap.add_argument("--no-index", action="store_true")
+    ap.add_argument("--db", default=None, help="keep the generated database at this path")
+    args = ap.parse_args()
+    sizes = [int(n) for n in args.rows.split(",") if n.strip()]
+    results = [run(n, indexed=not args.no_index, path=args.db if len(sizes) == 1 else None) for n in sizes]
+    print(json.dumps(results[0] if len(results) == 1 else results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+import argparse, json, os, statistics, tempfile, time
+
+import connectors.eth_readonly as eth
+import engine.scheduler as scheduler
+import engine.state as state
+from bench.mock_node import MockChain, serve
+
+# Times SchedulerThread._cycle end to end (block pin, balance reads, transfer-log sync, DB
+# writes) against the in-process mock node, for a grid of wallet/token counts:
+#   python -m bench.bench_scheduler --wallets 1,10,100,1000 --tokens 1,10,100 [--latency 0.05]
+# Each cycle advances the chain by one day, so every cycle writes balances and earnings. The
+# first cycle is reported separately (token metadata, multicall probe, checkpoints are cold).
+
+def _addr(prefix: int, i: int) -> str:
+    return "0x" + format(prefix, "x") + format(i, "x").rjust(40 - len(format(prefix, "x")), "0")
+
+def run(wallets: int, tokens: int, cycles: int = 3, latency: float = 0.0, rate_limit: float = 0.0,
+        error_rate: float = 0.0, multicall: bool = True, timeout: float = 3600) -> dict:
+    chain = MockChain(multicall=multicall, block=20_000_000)
+    owners = [_addr(0xa, i) for i in range(wallets)]
+    addrs = [_addr(0xb, t) for t in range(tokens)]
+    for t, addr in enumerate(addrs):
+        chain.add_token(addr, f"BENCH{t}")
+        for i, w in enumerate(owners):
+            chain.set_balance(w, 10**18 + i, addr)
+
+    server = serve(chain)
+    tmp = tempfile.TemporaryDirectory()
+    saved = (os.environ.get("RPC_URL"), state.DB_PATH)
+    os.environ["RPC_URL"] = f"http://127.0.0.1:{server.server_port}"
+    state.close_connections()
+    state.DB_PATH = os.path.join(tmp.name, "bench.db")
+    eth.token_meta_cache.clear()
+    eth._pinned.clear()
+    try:
+        state.ensure_db()
+        with state.unit_of_work():
+            for w in owners:
+                state.add_wallet(w)
+            # only the synthetic tokens are tracked (through the regular registry)
+            for key in state.get_tokens():
+                state.set_token_enabled(key, False)
+            state.upsert_tokens([{"key": f"BENCH{t}", "address": addr} for t, addr in enumerate(addrs)])
+        chain.latency, chain.rate_limit, chain.error_rate = latency, rate_limit, error_rate
+        # generous phase timeouts: a large grid point should be measured, not abandoned mid-write
+        sched = scheduler.SchedulerThread(read_timeout=timeout, scan_timeout=timeout)
+        runs = []
+        for c in range(cycles):
+            chain.reset_stats()
+            started = time.perf_counter()
+            error = None
+            try:
+                sched._cycle()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            runs.append(dict(seconds=time.perf_counter() - started, error=error, **chain.stats))
+            # next day: every balance grows a little
+            chain.block += 7200
+            chain.timestamp += 86400
+            for addr in addrs:
+                bal = chain.tokens[addr]["balances"]
+                for w in bal:
+                    bal[w] += 10**15
+        with state._conn() as con:
+            earnings = con.execute("SELECT COUNT(*) FROM earnings").fetchone()[0]
+        warm = [r["seconds"] for r in runs[1:]] or [runs[0]["seconds"]]
+        return {"wallets": wallets, "tokens": tokens, "latency": latency, "rate_limit": rate_limit,
+                "error_rate": error_rate, "multicall": multicall,
+                "first_cycle_s": runs[0]["seconds"], "cycle_s": statistics.median(warm),
+                "reads_per_s": wallets * tokens / statistics.median(warm),
+                "earnings_rows": earnings, "cycles": runs}
+    finally:
+        state.close_connections()
+        state.DB_PATH = saved[1]
+        if saved[0] is None:
+            os.environ.pop("RPC_URL", None)
+        else:
+            os.environ["RPC_URL"] = saved[0]
+        server.shutdown()
+        server.server_close()
+        tmp.cleanup()
+
+def _ints(s: str) -> list[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench.bench_scheduler", description="Scheduler cycle benchmark")
+    ap.add_argument("--wallets", default="1,10,100,1000")
+    ap.add_argument("--tokens", default="1,10,100")
+    ap.add_argument("--cycles", type=int, default=3)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds per HTTP request")
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="requests/second before HTTP 429")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing")
+    ap.add_argument("--no-multicall", action="store_true")
+    args = ap.parse_args(argv)
+    results = [run(w, t, args.cycles, args.latency, args.rate_limit, args.error_rate, not args.no_multicall)
+               for w in _ints(args.wallets) for t in _ints(args.tokens)]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+from __future__ import annotations
+import argparse, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from connectors.eth_readonly import (MULTICALL3, SEL_AGGREGATE3, SEL_BALANCE_OF, SEL_DECIMALS,
+                                     SEL_GET_ETH_BALANCE, SEL_SYMBOL, _word)
+from engine.prices import SEL_LATEST_ROUND
+from engine.transfers import TRANSFER_TOPIC
+
+# Local stand-in for an Ethereum JSON-RPC node. It serves canned ABI-encoded replies for
+# eth_getBalance and ERC-20 balanceOf/decimals/symbol, including through Multicall3
+# aggregate3, so connectors can be exercised offline:
+#   python -m bench.mock_node --port 8545   then   RPC_URL=http://127.0.0.1:8545
+# Provider behaviour can be degraded for benchmarks: a fixed latency per HTTP request, a
+# request-rate limit (HTTP 429 above it), and a fraction of calls failing with a JSON-RPC error.
+
+def _encode_string(s: str) -> str:
+    b = s.encode().hex()
+    return "0x" + _word(32) + _word(len(s.encode())) + b + "0" * ((-len(b)) % 64)
+
+class MockChain:
+    def __init__(self, multicall: bool = True, block: int = 20_000_000, timestamp: int = 1_718_000_000,
+                 block_time: int = 12):
+        self.multicall = multicall
+        self.block = block
+        self.timestamp = timestamp
+        self.block_time = block_time
+        self.eth: dict[str, int] = {}
+        self.tokens: dict[str, dict] = {}
+        self.feeds: dict[str, dict] = {}  # Chainlink-style aggregators: address -> {answer, decimals}
+        self.logs: list[dict] = []
+        self.max_logs = 10_000  # eth_getLogs answers -32005 above this, like hosted providers
+        self.latency = 0.0        # seconds added to every HTTP request
+        self.rate_limit = 0.0     # HTTP requests per second before answering 429; 0 = unlimited
+        self.error_rate = 0.0     # fraction of calls answered with a -32000 error
+        self._rnd = random.Random(0)
+        self._lock = threading.Lock()
+        self._window = (0.0, 0)
+        self.stats = {"requests": 0, "calls": 0, "rate_limited": 0, "errors": 0}
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def _admit(self, calls: int) -> bool:
+        # fixed one-second window, counted per HTTP request
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.rate_limit:
+                now = time.monotonic()
+                start, n = self._window
+                if now - start >= 1.0:
+                    start, n = now, 0
+                if n >= self.rate_limit:
+                    self.stats["rate_limited"] += 1
+                    return False
+                self._window = (start, n + 1)
+            self.stats["calls"] += calls
+            return True
+
+    def _inject_error(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            hit = self._rnd.random() < self.error_rate
+            self.stats["errors"] += hit
+        return hit
+
+    def add_token(self, address: str, symbol: str, decimals: int = 18):
+        self.tokens[address.lower()] = {"symbol": symbol, "decimals": decimals, "balances": {}}
+
+    def add_price_feed(self, address: str, price: float, decimals: int = 8):
+        self.feeds[address.lower()] = {"answer": int(round(price * 10 ** decimals)), "decimals": decimals}
+
+    def set_balance(self, owner: str, amount: int, token: str | None = None):
+        if token is None:
+            self.eth[owner.lower()] = amount
+        else:
+            self.tokens[token.lower()]["balances"][owner.lower()] = amount
+
+    def add_transfer(self, token: str, src: str, dst: str, amount: int, block: int, log_index: int = 0):
+        topic = lambda a: "0x" + "0" * 24 + a[2:].lower()
+        self.logs.append({"address": token.lower(), "blockNumber": hex(block), "logIndex": hex(log_index),
+                          "topics": [TRANSFER_TOPIC, topic(src), topic(dst)], "data": "0x" + _word(amount)})
+
+    def get_logs(self, flt: dict) -> list[dict]:
+        addrs = flt.get("address")
+        addrs = {a.lower() for a in ([addrs] if isinstance(addrs, str) else addrs or [])}
+        lo, hi = self._block_number(flt.get("fromBlock", "latest")), self._block_number(flt.get("toBlock", "latest"))
+        want = flt.get("topics") or []
+        out = []
+        for lg in self.logs:
+            n = int(lg["blockNumber"], 16)
+            if not lo <= n <= hi or (addrs and lg["address"] not in addrs):
+                continue
+            ok = True
+            for i, w in enumerate(want):
+                if w is None:
+                    continue
+                opts = {x.lower() for x in (w if isinstance(w, list) else [w])}
+                if i >= len(lg["topics"]) or lg["topics"][i].lower() not in opts:
+                    ok = False
+                    break
+            if ok:
+                out.append(lg)
+        return out
+
+    def block_timestamp(self, number: int) -> int:
+        return self.timestamp - (self.block - number) * self.block_time
+
+    def _block_number(self, tag) -> int:
+        return self.block if tag in (None, "latest", "pending", "safe", "finalized") else int(tag, 16)
+
+    # Balance of owner at a block; override for histories (the default is constant over time)
+    def balance(self, owner: str, token: str | None, block: int) -> int:
+        if token is None:
+            return self.eth.get(owner, 0)
+        return self.tokens[token]["balances"].get(owner, 0)
+
+    # returns (success, hex returnData)
+    def call(self, to: str, data: str, block: int | None = None) -> tuple[bool, str]:
+        to, sel = to.lower(), data[:10]
+        block = self.block if block is None else block
+        if self.multicall and to == MULTICALL3.lower():
+            if sel == SEL_AGGREGATE3:
+                return True, self._aggregate3(data[10:], block)
+            if sel == SEL_GET_ETH_BALANCE:
+                return True, "0x" + _word(self.balance("0x" + data[-40:].lower(), None, block))
+            return False, "0x"
+        feed = self.feeds.get(to)
+        if feed is not None:
+            if sel == SEL_LATEST_ROUND:
+                # roundId, answer, startedAt, updatedAt, answeredInRound
+                ts = self.block_timestamp(block)
+                return True, "0x" + _word(1) + _word(feed["answer"]) + _word(ts) + _word(ts) + _word(1)
+            if sel == SEL_DECIMALS:
+                return True, "0x" + _word(feed["decimals"])
+            return False, "0x"
+        tok = self.tokens.get(to)
+        if tok is None:
+            return True, "0x"
+        if sel == SEL_BALANCE_OF:
+            return True, "0x" + _word(self.balance("0x" + data[-40:].lower(), to, block))
+        if sel == SEL_DECIMALS:
+            return True, "0x" + _word(tok["decimals"])
+        if sel == SEL_SYMBOL:
+            return True, _encode_string(tok["symbol"])
+        return False, "0x"
+
+    def _aggregate3(self, h: str, block: int) -> str:
+        word = lambda pos: int(h[pos*2:pos*2+64], 16)
+        base = word(0)
+        n = word(base)
+        start = base + 32
+        results = []
+        for i in range(n):
+            t = start + word(start + 32 * i)
+            target = "0x" + h[t*2+24:t*2+64]
+            b = t + word(t + 64)
+            length = word(b)
+            results.append(self.call(target, "0x" + h[(b+32)*2:(b+32+length)*2], block))
+        heads, tails, offset = [], [], 32 * n
+        for ok, ret in results:
+            body = ret[2:]
+            enc = _word(int(ok)) + _word(64) + _word(len(body) // 2) + body + "0" * ((-len(body)) % 64)
+            heads.append(_word(offset))
+            tails.append(enc)
+            offset += len(enc) // 2
+        return "0x" + _word(32) + _word(n) + "".join(heads) + "".join(tails)
+
+    def handle(self, req: dict) -> dict:
+        rid, method, params = req.get("id"), req.get("method"), req.get("params") or []
+        if self._inject_error():
+            return {"jsonrpc": "2.0", "id": rid, "error": {"code": -32000, "message": "internal error (injected)"}}
+        if method == "eth_blockNumber":
+            return {"jsonrpc": "2.0", "id": rid, "result": hex(self.block)}
+        if method == "eth_getBlockByNumber":
+            n = self._block_number(params[0])
+            blk = {"number": hex(n), "timestamp": hex(self.block_timestamp(n))} if 0 <= n <= self.block else None
+            return {"jsonrpc": "2.0", "id": rid, "result": blk}
+        if method == "eth_getBalance":
+            block = self._block_number(params[1] if len(params) > 1 else None)
+            return {"jsonrpc": "2.0", "id": rid, "result": hex(self.balance(params[0].lower(), None, block))}
+        if method == "eth_getCode":
+            has_code = params[0].lower() in self.tokens or (self.multicall and params[0].lower() == MULTICALL3.lower())
+            return {"jsonrpc": "2.0", "id": rid, "result": "0x6080" if has_code else "0x"}
+        if method == "eth_getLogs":
+            logs = self.get_logs(params[0])
+            if len(logs) > self.max_logs:
+                return {"jsonrpc": "2.0", "id": rid,
+                        "error": {"code": -32005, "message": f"query returned more than {self.max_logs} results"}}
+            return {"jsonrpc": "2.0", "id": rid, "result": logs}
+        if method == "eth_call":
+            block = self._block_number(params[1] if len(params) > 1 else None)
+            ok, ret = self.call(params[0]["to"], params[0].get("data", "0x"), block)
+            if not ok:
+                return {"jsonrpc": "2.0", "id": rid, "error": {"code": 3, "message": "execution reverted"}}
+            return {"jsonrpc": "2.0", "id": rid, "result": ret}
+        return {"jsonrpc": "2.0", "id": rid, "error": {"code": -32601, "message": f"method not found: {method}"}}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+    chain: MockChain
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+        if self.chain.latency:
+            time.sleep(self.chain.latency)
+        if not self.chain._admit(len(body) if isinstance(body, list) else 1):
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        if isinstance(body, list):
+            out = [self.chain.handle(r) for r in body]
+        else:
+            out = self.chain.handle(body)
+        data = json.dumps(out).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def serve(chain: MockChain, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"chain": chain})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    ap = argparse.ArgumentParser(description="Local mock JSON-RPC node")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8545)
+    ap.add_argument("--no-multicall", action="store_true")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds per HTTP request")
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="requests/second, then HTTP 429")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with -32000")
+    args = ap.parse_args()
+    chain = MockChain(multicall=not args.no_multicall)
+    chain.latency, chain.rate_limit, chain.error_rate = args.latency, args.rate_limit, args.error_rate
+    server = serve(chain, args.host, args.port)
+    print(f"mock node on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+import argparse, json, platform, sqlite3, subprocess, sys, time
+
+from bench import bench_db, bench_scheduler
+
+# Runs the benchmark scenarios and writes one JSON document, so results can be kept per version
+# and compared:
+#   python -m bench.run --out bench-v1.json
+#   python -m bench.run --quick --compare bench-v1.json   (exit status 1 on regressions)
+# Metrics ending in _s are durations (lower is better); *_per_s are rates (higher is better).
+
+FULL = {
+    "scheduler": [(w, t) for w in (1, 10, 100, 1000) for t in (1, 10, 100)] + [(1, 1000), (10, 1000)],
+    "degraded": [(100, 3)],
+    "db_rows": [10_000, 100_000, 1_000_000],
+}
+QUICK = {
+    "scheduler": [(1, 1), (10, 10), (100, 3)],
+    "degraded": [(10, 3)],
+    "db_rows": [10_000, 100_000],
+}
+# a slow, rate-limited provider that fails 1% of calls
+DEGRADED = {"latency": 0.05, "rate_limit": 20, "error_rate": 0.01}
+
+def _meta() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return {"git": rev, "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+def _scheduler_result(r: dict) -> dict:
+    params = {k: r[k] for k in ("wallets", "tokens", "latency", "rate_limit", "error_rate", "multicall")}
+    metrics = {k: r[k] for k in ("first_cycle_s", "cycle_s", "reads_per_s")}
+    metrics["requests_per_cycle"] = r["cycles"][-1]["requests"]
+    metrics["errors"] = sum(1 for c in r["cycles"] if c["error"])
+    return {"bench": "scheduler", "params": params, "metrics": metrics}
+
+def _db_result(r: dict) -> dict:
+    metrics = {f"{k}_s": v for k, v in r["seconds"].items()}
+    metrics.update({f"{k}_per_s": v for k, v in r["rows_per_second"].items()})
+    return {"bench": "db", "params": {"rows": r["rows"], "indexed": r["indexed"]}, "metrics": metrics}
+
+def run(plan: dict, cycles: int = 3) -> dict:
+    results = []
+    for w, t in plan["scheduler"]:
+        results.append(_scheduler_result(bench_scheduler.run(w, t, cycles)))
+        print(f"scheduler {w}x{t}: {results[-1]['metrics']['cycle_s']:.3f}s", file=sys.stderr)
+    for w, t in plan["degraded"]:
+        results.append(_scheduler_result(bench_scheduler.run(w, t, cycles, **DEGRADED)))
+        print(f"scheduler {w}x{t} (degraded): {results[-1]['metrics']['cycle_s']:.3f}s", file=sys.stderr)
+    for rows in plan["db_rows"]:
+        results.append(_db_result(bench_db.run(rows)))
+        print(f"db {rows} rows", file=sys.stderr)
+    return {"meta": _meta(), "results": results}
+
+def _key(r: dict) -> str:
+    return r["bench"] + " " + json.dumps(r["params"], sort_keys=True)
+
+def compare(baseline: dict, current: dict, threshold: float = 1.25) -> list[str]:
+    # metrics that got worse by more than `threshold`x
+    base = {_key(r): r["metrics"] for r in baseline["results"]}
+    out = []
+    for r in current["results"]:
+        old = base.get(_key(r))
+        if old is None:
+            continue
+        for name, value in r["metrics"].items():
+            prev = old.get(name)
+            if not prev or not value:
+                continue
+            if name.endswith("_per_s"):
+                ratio = prev / value
+            elif name.endswith("_s"):
+                ratio = value / prev
+            else:
+                continue
+            if ratio > threshold:
+                out.append(f"{_key(r)} {name}: {prev:.6g} -> {value:.6g} ({ratio:.2f}x worse)")
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench.run", description="Run the offline benchmark suite")
+    ap.add_argument("--quick", action="store_true", help="small grid (seconds rather than minutes)")
+    ap.add_argument("--cycles", type=int, default=3)
+    ap.add_argument("--out", default="-", help="JSON output file (default: stdout)")
+    ap.add_argument("--compare", default=None, help="baseline JSON from an earlier run")
+    ap.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = ap.parse_args(argv)
+    doc = run(QUICK if args.quick else FULL, args.cycles)
+    text = json.dumps(doc, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), doc, args.threshold)
+        for line in regressions:
+            print("REGRESSION " + line, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,562 @@
 from __future__ import annotations
-import os
+import json, os, random, string, threading, time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 import requests
-from engine.state import get_setting, set_setting
+from requests.adapters import HTTPAdapter
+from typing import Callable
+from urllib.parse import urlsplit
+from engine import metrics
+from engine.state import add_wallet, list_wallets, load_token_meta, upsert_token_meta
 
 DEFAULT_RPC = "https://ethereum.publicnode.com"
 
-def _rpc_url():
-    return os.getenv("RPC_URL", DEFAULT_RPC)
+# Chains with a built-in public endpoint. Any chain id works once RPC_URL_<chainid> is set
+# (RPC_URL stays the mainnet endpoint). Calls go to the chain selected with use_chain(),
+# mainnet by default; worker threads inherit it through contextvars.copy_context().
+CHAINS = {
+    1: {"name": "Ethereum", "rpc": DEFAULT_RPC, "native": "ETH"},
+    10: {"name": "Optimism", "rpc": "https://optimism-rpc.publicnode.com", "native": "ETH"},
+    137: {"name": "Polygon", "rpc": "https://polygon-bor-rpc.publicnode.com", "native": "POL"},
+    8453: {"name": "Base", "rpc": "https://base-rpc.publicnode.com", "native": "ETH"},
+    42161: {"name": "Arbitrum One", "rpc": "https://arbitrum-one-rpc.publicnode.com", "native": "ETH"},
+}
+
+_chain: ContextVar[int] = ContextVar("chain_id", default=1)
+
+class RpcError(RuntimeError):
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+def current_chain() -> int:
+    return _chain.get()
+
+@contextmanager
+def use_chain(chain_id: int | None):
+    token = _chain.set(int(chain_id or 1))
+    try:
+        yield
+    finally:
+        _chain.reset(token)
+
+def chain_name(chain_id: int | None = None) -> str:
+    cid = chain_id or _chain.get()
+    return CHAINS.get(cid, {}).get("name", f"chain {cid}")
+
+def native_symbol(chain_id: int | None = None) -> str:
+    return CHAINS.get(chain_id or _chain.get(), {}).get("native", "ETH")
+
+def _rpc_url(chain_id: int | None = None):
+    cid = chain_id or _chain.get()
+    url = os.getenv(f"RPC_URL_{cid}")
+    if not url and cid == 1:
+        url = os.getenv("RPC_URL", DEFAULT_RPC)
+    url = url or CHAINS.get(cid, {}).get("rpc")
+    if not url:
+        raise ValueError(f"No RPC endpoint for chain {cid}: set RPC_URL_{cid}")
+    return url
+
+def _rpc_urls(chain_id: int | None = None) -> list[str]:
+    # RPC_URL[_<chainid>] first, then the fallbacks in RPC_URLS[_<chainid>]; the built-in
+    # endpoint only when neither is set
+    cid = chain_id or _chain.get()
+    extra = os.getenv(f"RPC_URLS_{cid}") or (os.getenv("RPC_URLS") if cid == 1 else None) or ""
+    urls = [u.strip() for u in extra.split(",") if u.strip()]
+    primary = os.getenv(f"RPC_URL_{cid}") or (os.getenv("RPC_URL") if cid == 1 else None)
+    if primary or not urls:
+        urls.insert(0, primary or _rpc_url(cid))
+    return list(dict.fromkeys(urls))
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def _chain_env(name: str, chain_id: int, default: float) -> float:
+    # NAME_<chainid> overrides NAME for one chain
+    return _env_float(f"{name}_{chain_id}", _env_float(name, default))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# JSON-RPC error codes providers use for throttling (-32029 Infura/others). -32005 "limit
+# exceeded" also covers eth_getLogs result caps, so it only counts when the message is about a rate.
+RATE_LIMIT_CODES = {-32029, 429}
+
+def _is_rate_limited(j) -> bool:
+    items = j if isinstance(j, list) else [j]
+    for item in items:
+        err = item.get("error") if isinstance(item, dict) else None
+        if not isinstance(err, dict):
+            continue
+        msg = str(err.get("message", "")).lower()
+        code = err.get("code")
+        if (code in RATE_LIMIT_CODES or "rate limit" in msg or "too many requests" in msg
+                or (code == -32005 and "rate" in msg)):
+            return True
+    return False
+
+# Errors that say more about the endpoint than about the request: a lagging or pruned node that
+# doesn't have the pinned block (yet), or one failing internally. Another endpoint may answer.
+_ENDPOINT_ERRORS = ("header not found", "missing trie node", "unknown block", "block not found",
+                    "internal error")
+
+def _endpoint_failed(j) -> bool:
+    if _is_rate_limited(j):
+        return True
+    for item in j if isinstance(j, list) else [j]:
+        err = item.get("error") if isinstance(item, dict) else None
+        if not isinstance(err, dict):
+            continue
+        msg = str(err.get("message", "")).lower()
+        if err.get("code") == -32603 or (err.get("code") == -32000 and any(k in msg for k in _ENDPOINT_ERRORS)):
+            return True
+    return False
+
+class RpcTransport:
+    # Keep-alive session with a bounded connection pool, shared by the UI and scheduler threads.
+    # urllib3's pool is thread-safe; pool_block makes extra threads wait for a free socket
+    # instead of opening throwaway connections. Each chain gets its own transport, so pools and
+    # the optional rate limit (requests/second, 0 = off) are per chain.
+    # Each transport also keeps its endpoint's health for RpcPool: an EWMA of the latency of
+    # successful requests, the recent latencies (for the hedging percentile), a failure rate that
+    # decays while the endpoint is idle, and a circuit breaker that ejects the endpoint for
+    # breaker_cooldown seconds after breaker_failures failures in a row. After the cooldown it is
+    # half-open: a single probe request is let through; its failure ejects the endpoint again,
+    # its success closes the breaker.
+    HEALTH_HALFLIFE = 60.0
+    def __init__(self, url: str, pool_size: int = 10, connect_timeout: float = 3.05,
+                 read_timeout: float = 10.0, max_retries: int = 3,
+                 backoff_base: float = 0.25, backoff_max: float = 8.0,
+                 rate_limit: float = 0.0, chain_id: int = 1,
+                 breaker_failures: int = 3, breaker_cooldown: float = 30.0):
+        self.url = url
+        self.label = urlsplit(url).netloc or url  # never the path: it often carries an API key
+        self.chain_id = chain_id
+        self.pool_size = pool_size
+        self.rate_limit = rate_limit
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._health_lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=200)
+        self._latency: float | None = None
+        self._errors = 0.0
+        self._errors_at = 0.0
+        self._fails = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._next_slot = 0.0
+        self._rate_lock = threading.Lock()
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_env(cls, url: str, chain_id: int = 1) -> "RpcTransport":
+        env = lambda name, default: _chain_env(name, chain_id, default)
+        return cls(url,
+                   pool_size=int(env("RPC_POOL_SIZE", 10)),
+                   connect_timeout=env("RPC_CONNECT_TIMEOUT", 3.05),
+                   read_timeout=env("RPC_READ_TIMEOUT", 10.0),
+                   max_retries=int(env("RPC_MAX_RETRIES", 3)),
+                   backoff_base=env("RPC_BACKOFF_BASE", 0.25),
+                   backoff_max=env("RPC_BACKOFF_MAX", 8.0),
+                   rate_limit=env("RPC_RATE_LIMIT", 0.0),
+                   chain_id=chain_id,
+                   breaker_failures=int(env("RPC_BREAKER_FAILURES", 3)),
+                   breaker_cooldown=env("RPC_BREAKER_COOLDOWN", 30.0))
+
+    def _throttle(self):
+        # hands out send slots 1/rate_limit apart across threads; callers sleep until theirs
+        if not self.rate_limit:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate_limit
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _sleep(self, attempt: int, retry_after: str | None = None):
+        delay = self.backoff_base * (2 ** attempt)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        # full jitter
+        time.sleep(random.uniform(0, min(delay, self.backoff_max)))
+
+    def _error_rate(self, now: float) -> float:
+        return self._errors * 0.5 ** ((now - self._errors_at) / self.HEALTH_HALFLIFE)
+
+    def record(self, ok: bool, seconds: float):
+        now = time.monotonic()
+        with self._health_lock:
+            self._errors = self._error_rate(now) * 0.9 + (0.0 if ok else 0.1)
+            self._errors_at = now
+            self._probing = False
+            if ok:
+                self._fails = 0
+                self._open_until = 0.0
+                self._latency = seconds if self._latency is None else 0.8 * self._latency + 0.2 * seconds
+                self._latencies.append(seconds)
+                return
+            self._fails += 1
+            if self._fails >= self.breaker_failures:
+                if self._open_until <= now:
+                    metrics.inc("rpc_breaker_trips_total", chain=str(self.chain_id), endpoint=self.label)
+                self._open_until = now + self.breaker_cooldown
+                self._latencies.clear()
+
+    def available(self, now: float) -> bool:
+        # closed, or half-open with no probe in flight
+        return now >= self._open_until and not self._probing
+
+    def admit(self) -> bool:
+        # claims the single half-open probe; False while ejected or while the probe is in flight
+        with self._health_lock:
+            if not self.available(time.monotonic()):
+                return False
+            if self._fails >= self.breaker_failures:
+                self._probing = True
+            return True
+
+    def score(self, now: float) -> float:
+        # lower is better: latency inflated by the failure rate, failures weighing like read
+        # timeouts; an endpoint that has not been used yet scores 0, so it gets measured
+        errors = self._error_rate(now)
+        return (self._latency or 0.0) * (1 + 10 * errors) + errors * self.timeout[1]
+
+    def hedge_after(self, quantile: float, default: float) -> float:
+        with self._health_lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 20:
+            return default
+        return max(samples[int(quantile * (len(samples) - 1))], 0.005)
+
+    def health(self) -> dict:
+        now = time.monotonic()
+        with self._health_lock:
+            samples = sorted(self._latencies)
+        state = "ok" if self._fails < self.breaker_failures else "ejected" if not self.available(now) else "half-open"
+        return {"chain": self.chain_id, "endpoint": self.label, "state": state,
+                "latency_ms": None if self._latency is None else self._latency * 1000,
+                "p95_ms": samples[int(0.95 * (len(samples) - 1))] * 1000 if samples else None,
+                "error_rate": self._error_rate(now), "failures_in_a_row": self._fails}
+
+    def post(self, payload, max_retries: int | None = None):
+        # max_retries=0 is one attempt (RpcPool fails over to another endpoint instead)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        chain = str(self.chain_id)
+        while True:
+            self._throttle()
+            try:
+                r = self.session.post(self.url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= max_retries:
+                    raise
+                metrics.inc("rpc_retries_total", reason=type(e).__name__, chain=chain)
+                self._sleep(attempt)
+                attempt += 1
+                continue
+            if r.status_code in RETRY_STATUS and attempt < max_retries:
+                metrics.inc("rpc_retries_total", reason=f"http_{r.status_code}", chain=chain)
+                self._sleep(attempt, r.headers.get("Retry-After"))
+                attempt += 1
+                continue
+            r.raise_for_status()
+            j = r.json()
+            if _is_rate_limited(j) and attempt < max_retries:
+                metrics.inc("rpc_retries_total", reason="rate_limited", chain=chain)
+                self._sleep(attempt)
+                attempt += 1
+                continue
+            return j
+
+    def close(self):
+        self.session.close()
+
+_transports: dict[tuple[int, str], RpcTransport] = {}
+_transports_lock = threading.Lock()
+
+def get_transport(url: str | None = None, chain_id: int | None = None) -> RpcTransport:
+    cid = chain_id or _chain.get()
+    key = (cid, url or _rpc_url(cid))
+    t = _transports.get(key)
+    if t is None:
+        with _transports_lock:
+            t = _transports.get(key)
+            if t is None:
+                t = _transports[key] = RpcTransport.from_env(key[1], cid)
+    return t
+
+class RpcPool:
+    # All endpoints of one chain. Requests go to the healthiest endpoint (lowest score; ejected
+    # ones are left out); with more than one endpoint, a request still unanswered after the
+    # primary's hedge_quantile latency is duplicated to the next endpoint and the first good reply
+    # wins, and a failed, rate-limited or lagging (_endpoint_failed) request fails over to the
+    # next endpoint without backoff. Only when every endpoint has failed is the healthiest one
+    # (or, if all are ejected, the one back soonest) retried with the usual backoff.
+    def __init__(self, transports: list[RpcTransport], chain_id: int = 1,
+                 hedge_quantile: float = 0.95, hedge_delay: float = 0.5):
+        self.transports = transports
+        self.chain_id = chain_id
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, urls: list[str], chain_id: int = 1) -> "RpcPool":
+        return cls([get_transport(u, chain_id) for u in urls], chain_id,
+                   hedge_quantile=_chain_env("RPC_HEDGE_QUANTILE", chain_id, 0.95),
+                   hedge_delay=_chain_env("RPC_HEDGE_DELAY", chain_id, 0.5))
+
+    def ranked(self) -> list[RpcTransport]:
+        now = time.monotonic()
+        return sorted((t for t in self.transports if t.available(now)), key=lambda t: t.score(now))
+
+    def _best(self) -> RpcTransport:
+        # never an endpoint whose half-open probe is still out
+        order = self.ranked() or sorted((t for t in self.transports if not t._probing), key=lambda t: t._open_until)
+        if not order:
+            raise RpcError({"code": -32000, "message": f"no RPC endpoint available for chain {self.chain_id}"})
+        return order[0]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    workers = max(4, 2 * sum(t.pool_size for t in self.transports))
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"rpc-{self.chain_id}")
+        return self._executor
+
+    @staticmethod
+    def _send(t: RpcTransport, payload, max_retries: int | None = 0, admit: bool = True):
+        if admit and not t.admit():
+            raise RpcError({"code": -32000, "message": f"{t.label} is ejected"})
+        start = time.perf_counter()
+        try:
+            j = t.post(payload, max_retries)
+        except (requests.RequestException, ValueError):
+            t.record(False, time.perf_counter() - start)
+            raise
+        ok = not _endpoint_failed(j)
+        t.record(ok, time.perf_counter() - start)
+        return j, ok
+
+    def post(self, payload):
+        if len(self.transports) == 1:
+            return self._send(self.transports[0], payload, None, admit=False)[0]
+        order = self.ranked()
+        calls = payload if isinstance(payload, list) else [payload]
+        hedge = self.hedge_quantile > 0 and not any(str(c.get("method", "")).startswith("eth_send") for c in calls)
+        chain = str(self.chain_id)
+        queue, pending, hedged = list(order), {}, None
+        while queue or pending:
+            if not pending:
+                if len(queue) < len(order):
+                    metrics.inc("rpc_failovers_total", chain=chain)
+                t = queue.pop(0)
+                pending[self._pool().submit(self._send, t, payload)] = t
+            timeout = None
+            if hedge and hedged is None and queue and len(pending) == 1:
+                timeout = next(iter(pending.values())).hedge_after(self.hedge_quantile, self.hedge_delay)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                metrics.inc("rpc_hedges_total", chain=chain)
+                t = queue.pop(0)
+                hedged = self._pool().submit(self._send, t, payload)
+                pending[hedged] = t
+                continue
+            for f in done:
+                pending.pop(f)
+                if f.exception() is None and f.result()[1]:
+                    if f is hedged:
+                        metrics.inc("rpc_hedge_wins_total", chain=chain)
+                    return f.result()[0]
+        return self._send(self._best(), payload, None, admit=False)[0]
+
+_pools: dict[tuple[int, tuple[str, ...]], RpcPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(chain_id: int | None = None) -> RpcPool:
+    cid = chain_id or _chain.get()
+    key = (cid, tuple(_rpc_urls(cid)))
+    p = _pools.get(key)
+    if p is None:
+        with _pools_lock:
+            p = _pools.get(key)
+            if p is None:
+                p = _pools[key] = RpcPool.from_env(list(key[1]), cid)
+    return p
+
+def endpoint_health() -> list[dict]:
+    return [t.health() for t in list(_transports.values())]
+
+def _post(payload):
+    calls = payload if isinstance(payload, list) else [payload]
+    methods = {c["id"]: c["method"] for c in calls}
+    kinds = set(methods.values())
+    chain = str(_chain.get())
+    for m in kinds:
+        metrics.inc("rpc_calls_total", sum(1 for c in calls if c["method"] == m), method=m, chain=chain)
+    with metrics.timed("rpc_request_seconds", method=kinds.pop() if len(kinds) == 1 else "batch", chain=chain):
+        j = get_pool().post(payload)
+    for item in (j if isinstance(j, list) else [j]):
+        err = item.get("error") if isinstance(item, dict) else None
+        if err is not None:
+            code = err.get("code") if isinstance(err, dict) else None
+            method = methods.get(item.get("id"), "batch") if isinstance(payload, list) else calls[0]["method"]
+            metrics.inc("rpc_call_errors_total", method=method, code=str(code), chain=chain)
+    return j
 
 def _rpc(method: str, params: list):
-    url = _rpc_url()
-    r = requests.post(url, json={"jsonrpc":"2.0","id":1,"method":method,"params":params}, timeout=10)
-    r.raise_for_status()
-    j = r.json()
+    j = _post({"jsonrpc":"2.0","id":1,"method":method,"params":params})
     if "error" in j:
-        raise RuntimeError(j["error"])
+        raise RpcError(j["error"])
     return j.get("result")
 
+# Replies for reads pinned to a block number never change, so they are memoized.
+_PINNED_CACHE_SIZE = 20000
+_pinned: OrderedDict[str, object] = OrderedDict()
+_pinned_lock = threading.Lock()
+
+def _pinned_key(method: str, params: list) -> str | None:
+    if method not in ("eth_call", "eth_getBalance") or not params:
+        return None
+    tag = params[-1]
+    if not isinstance(tag, str) or not tag.startswith("0x"):
+        return None
+    return _rpc_url() + "|" + method + "|" + json.dumps(params, sort_keys=True)
+
+def batch_call(calls: list[tuple[str, list]]) -> list:
+    # One HTTP round-trip for many calls. Each slot holds the result or an RpcError.
+    if not calls:
+        return []
+    out: list = [None] * len(calls)
+    keys = [_pinned_key(m, p) for m, p in calls]
+    todo = []
+    with _pinned_lock:
+        for i, k in enumerate(keys):
+            if k is not None and k in _pinned:
+                out[i] = _pinned[k]
+            else:
+                todo.append(i)
+    if len(todo) < len(calls):
+        metrics.inc("rpc_pinned_cache_hits_total", len(calls) - len(todo))
+    if not todo:
+        return out
+    payload = [{"jsonrpc":"2.0","id":i,"method":calls[i][0],"params":calls[i][1]} for i in todo]
+    j = _post(payload)
+    if isinstance(j, dict):
+        # Whole batch rejected (e.g. provider without batch support)
+        err = RpcError(j.get("error", j))
+        for i in todo:
+            out[i] = err
+        return out
+    missing = RpcError({"code": -32603, "message": "missing response"})
+    for i in todo:
+        out[i] = missing
+    for item in j:
+        i = item.get("id")
+        if not isinstance(i, int) or not 0 <= i < len(calls):
+            continue
+        out[i] = RpcError(item["error"]) if "error" in item else item.get("result")
+    with _pinned_lock:
+        for i in todo:
+            if keys[i] is not None and not isinstance(out[i], Exception):
+                _pinned[keys[i]] = out[i]
+        while len(_pinned) > _PINNED_CACHE_SIZE:
+            _pinned.popitem(last=False)
+    return out
+
+# Queues calls and sends them as one JSON-RPC array on execute() / leaving the with-block
+class RpcBatch:
+    def __init__(self):
+        self._calls: list[tuple[str, list]] = []
+        self._results: list | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self._results is None:
+            self.execute()
+        return False
+
+    def __len__(self):
+        return len(self._calls)
+
+    def add(self, method: str, params: list) -> Callable[[], object]:
+        if self._results is not None:
+            raise RuntimeError("Batch already executed")
+        idx = len(self._calls)
+        self._calls.append((method, params))
+        return lambda: self.result(idx)
+
+    def execute(self):
+        self._results = batch_call(self._calls)
+        return self._results
+
+    def result(self, idx: int):
+        if self._results is None:
+            raise RuntimeError("Batch not executed yet")
+        r = self._results[idx]
+        if isinstance(r, Exception):
+            raise r
+        return r
+
 def set_wallet_address(addr: str):
-    set_setting("WALLET_ADDRESS", addr.strip())
+    # starts tracking addr; raises ValueError for anything that isn't a 20-byte hex address
+    add_wallet(_to_checksum(addr.strip().lower()))
 
-def get_wallet_address() -> str:
-    return get_setting("WALLET_ADDRESS", "")
+def get_wallet_addresses() -> list[str]:
+    return list_wallets()
 
 def _to_checksum(addr: str) -> str:
-    if not addr or not addr.startswith("0x") or len(addr) != 42:
-        raise ValueError("Invalid address")
+    if not addr or not addr.startswith("0x") or len(addr) != 42 or not all(c in string.hexdigits for c in addr[2:]):
+        raise ValueError(f"Invalid address: {addr!r}")
     return addr
 
 def _hex_to_int(h: str) -> int:
     return int(h, 16) if h else 0
 
-def get_eth_balance(addr: str) -> float:
+@dataclass(frozen=True)
+class BlockRef:
+    number: int
+    timestamp: int
+
+    @property
+    def tag(self) -> str:
+        return hex(self.number)
+
+    @property
+    def day(self) -> str:
+        return datetime.utcfromtimestamp(self.timestamp).date().isoformat()
+
+    @property
+    def iso(self) -> str:
+        return datetime.utcfromtimestamp(self.timestamp).isoformat()
+
+def get_block(tag: str = "latest") -> BlockRef:
+    blk = _rpc("eth_getBlockByNumber", [tag, False])
+    if not blk:
+        raise RpcError({"code": -32000, "message": f"block {tag} not found"})
+    return BlockRef(_hex_to_int(blk["number"]), _hex_to_int(blk["timestamp"]))
+
+def queue_eth_balance(batch: RpcBatch, addr: str, block: str = "latest") -> Callable[[], float]:
     c = _to_checksum(addr)
-    wei_hex = _rpc("eth_getBalance", [c, "latest"])
-    return _hex_to_int(wei_hex) / 10**18
+    wei = batch.add("eth_getBalance", [c, block])
+    return lambda: _hex_to_int(wei()) / 10**18
 
 # --- ERC-20 helpers ---
 SEL_BALANCE_OF = "0x70a08231"  # balanceOf(address)
@@ -66,20 +588,236 @@ KNOWN = {
     "0xae78736Cd615f374D3085123A210448E74Fc6393": ("rETH", 18),
 }
 
-def get_erc20_balance(token_addr: str, owner: str) -> tuple[str, float]:
+def _is_revert(e: Exception) -> bool:
+    err = getattr(e, "error", None)
+    msg = str(err.get("message", "") if isinstance(err, dict) else err).lower()
+    return (isinstance(err, dict) and err.get("code") == 3) or "revert" in msg
+
+class TokenMetaCache:
+    # decimals()/symbol() never change, so each token is resolved once: in-process LRU in front
+    # of the token_meta table, warm-loaded on first use. Contracts whose decimals() reverts or
+    # returns nothing are cached negatively (ok=0, fallback values) and retried after neg_ttl.
+    # The same address can be a different contract on another chain, so entries are keyed by
+    # (chain id, address).
+    def __init__(self, maxsize: int = 4096, neg_ttl: timedelta = timedelta(days=1)):
+        self.maxsize = maxsize
+        self.neg_ttl = neg_ttl
+        self._data: OrderedDict[tuple[int, str], tuple[str, int, bool, datetime]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _warm(self):
+        try:
+            rows = load_token_meta()
+        except Exception:
+            return
+        self._loaded = True
+        for chain_id, address, symbol, decimals, ok, updated_at in rows[-self.maxsize:]:
+            self._data[(chain_id, address)] = (symbol, decimals, bool(ok), datetime.fromisoformat(updated_at))
+
+    @staticmethod
+    def _key(token_addr: str) -> tuple[int, str]:
+        return _chain.get(), token_addr.lower()
+
+    def get(self, token_addr: str) -> tuple[str, int] | None:
+        key = self._key(token_addr)
+        with self._lock:
+            if not self._loaded:
+                self._warm()
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            symbol, decimals, ok, updated_at = hit
+            if not ok and datetime.utcnow() - updated_at > self.neg_ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return symbol, decimals
+
+    def put(self, token_addr: str, symbol: str, decimals: int, ok: bool = True):
+        key = self._key(token_addr)
+        with self._lock:
+            self._data[key] = (symbol, decimals, ok, datetime.utcnow())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        upsert_token_meta(key[1], symbol, decimals, ok, chain_id=key[0])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._loaded = False
+
+token_meta_cache = TokenMetaCache(maxsize=int(_env_float("TOKEN_META_CACHE_SIZE", 4096)))
+
+def _resolve_meta(token_addr: str, dec_hex: str | None, sym_hex: str | None) -> tuple[str, int]:
+    # dec_hex/sym_hex are None when the call failed for a reason other than a revert;
+    # such results are used for this read but not cached.
+    if dec_hex is None or sym_hex is None:
+        dec = _decode_uint(dec_hex or "0x") or 18
+        return (_decode_ascii(sym_hex or "0x") or KNOWN.get(token_addr, ("TOKEN", 18))[0], dec)
+    if dec_hex == "0x":
+        symbol, dec = KNOWN.get(token_addr, (_decode_ascii(sym_hex) or "TOKEN", 18))
+        token_meta_cache.put(token_addr, symbol, dec, ok=False)
+        return symbol, dec
+    dec = _decode_uint(dec_hex) or 18
+    symbol = _decode_ascii(sym_hex) or KNOWN.get(token_addr, ("TOKEN", 18))[0]
+    token_meta_cache.put(token_addr, symbol, dec)
+    return symbol, dec
+
+def _meta_hex(get) -> str | None:
+    try:
+        return get() or "0x"
+    except RpcError as e:
+        return "0x" if _is_revert(e) else None
+
+def queue_erc20_balance(batch: RpcBatch, token_addr: str, owner: str, block: str = "latest") -> Callable[[], tuple[str, float]]:
     owner = _to_checksum(owner)
-    # balanceOf(owner)
     data = SEL_BALANCE_OF + "000000000000000000000000" + owner[2:]
-    bal_hex = _eth_call(token_addr, data)
-    bal = _decode_uint(bal_hex)
-
-    # decimals + symbol
-    dec_hex = _eth_call(token_addr, SEL_DECIMALS)
-    if dec_hex == "0x" and token_addr in KNOWN:
-        symbol, dec = KNOWN[token_addr]
-    else:
-        dec = _decode_uint(dec_hex) or 18
-        sym_hex = _eth_call(token_addr, SEL_SYMBOL)
-        symbol = _decode_ascii(sym_hex) or KNOWN.get(token_addr, ("TOKEN", 18))[0]
-
-    return (symbol, bal / (10 ** dec))
+    bal = batch.add("eth_call", [{"to": token_addr, "data": data}, block])
+    meta = token_meta_cache.get(token_addr)
+    if meta is not None:
+        return lambda: (meta[0], _decode_uint(bal() or "0x") / (10 ** meta[1]))
+    dec = batch.add("eth_call", [{"to": token_addr, "data": SEL_DECIMALS}, block])
+    sym = batch.add("eth_call", [{"to": token_addr, "data": SEL_SYMBOL}, block])
+
+    def _read():
+        raw = _decode_uint(bal() or "0x")
+        symbol, decimals = _resolve_meta(token_addr, _meta_hex(dec), _meta_hex(sym))
+        return (symbol, raw / (10 ** decimals))
+    return _read
+
+def get_erc20_balance(token_addr: str, owner: str, block: str = "latest") -> tuple[str, float]:
+    with RpcBatch() as batch:
+        read = queue_erc20_balance(batch, token_addr, owner, block)
+    return read()
+
+# --- Multicall3 ---
+# Same address on every chain where it is deployed; MULTICALL_ADDRESS="" disables it.
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+SEL_AGGREGATE3 = "0x82ad56cb"       # aggregate3((address,bool,bytes)[])
+SEL_GET_ETH_BALANCE = "0x4d2301cc"  # getEthBalance(address)
+
+def _multicall_address() -> str:
+    return os.getenv("MULTICALL_ADDRESS", MULTICALL3)
+
+_multicall_ok: dict[str, bool] = {}
+
+def has_multicall() -> bool:
+    addr = _multicall_address()
+    if not addr:
+        return False
+    key = f"{_rpc_url()}|{addr}"
+    if key not in _multicall_ok:
+        try:
+            code = _rpc("eth_getCode", [addr, "latest"]) or "0x"
+        except RpcError:
+            code = "0x"
+        _multicall_ok[key] = code not in ("0x", "0x0")
+    return _multicall_ok[key]
+
+def _word(n: int) -> str:
+    return format(n, "064x")
+
+def _encode_aggregate3(calls: list[tuple[str, str]]) -> str:
+    # calls: (target, calldata) with allowFailure=true for all of them
+    heads, tails, offset = [], [], 32 * len(calls)
+    for target, data in calls:
+        body = data[2:] if data.startswith("0x") else data
+        nbytes = len(body) // 2
+        padded = body + "0" * ((-len(body)) % 64)
+        enc = _word(int(target, 16)) + _word(1) + _word(96) + _word(nbytes) + padded
+        heads.append(_word(offset))
+        tails.append(enc)
+        offset += len(enc) // 2
+    return SEL_AGGREGATE3 + _word(32) + _word(len(calls)) + "".join(heads) + "".join(tails)
+
+def _decode_aggregate3(hexdata: str) -> list[tuple[bool, str]]:
+    # returns (success, returnData) per call
+    h = hexdata[2:] if hexdata.startswith("0x") else hexdata
+    word = lambda pos: int(h[pos*2:pos*2+64], 16)
+    base = word(0)
+    n = word(base)
+    start = base + 32
+    out = []
+    for i in range(n):
+        t = start + word(start + 32 * i)
+        ok = word(t) != 0
+        b = t + word(t + 32)
+        length = word(b)
+        out.append((ok, "0x" + h[(b+32)*2:(b+32+length)*2]))
+    return out
+
+def queue_multicall(batch: RpcBatch, calls: list[tuple[str, str]], block: str = "latest") -> Callable[[], list[tuple[bool, str]]]:
+    res = batch.add("eth_call", [{"to": _multicall_address(), "data": _encode_aggregate3(calls)}, block])
+    return lambda: _decode_aggregate3(res() or "0x")
+
+def queue_balances(batch: RpcBatch, tokens: list[str | None], owners: list[str], block: str = "latest",
+                   multicall: bool | None = None) -> Callable[[], dict]:
+    # Every (token, owner) balance, token=None meaning native ETH. With Multicall3 this is a
+    # single eth_call inside the batch; otherwise one call per read (plus decimals/symbol).
+    # multicall=False forces per-call reads (e.g. historical blocks before Multicall3 existed).
+    # The resolver returns {(token, owner): (symbol, amount) | Exception}.
+    owners = [_to_checksum(o) for o in owners]
+    if multicall is None:
+        multicall = has_multicall()
+    if not multicall:
+        reads = {}
+        for t in tokens:
+            for o in owners:
+                if t is None:
+                    eth = queue_eth_balance(batch, o, block)
+                    reads[(t, o)] = (lambda r, sym: lambda: (sym, r()))(eth, native_symbol())
+                else:
+                    reads[(t, o)] = queue_erc20_balance(batch, t, o, block)
+
+        def _resolve_each():
+            out = {}
+            for k, read in reads.items():
+                try:
+                    out[k] = read()
+                except Exception as e:
+                    out[k] = e
+            return out
+        return _resolve_each
+
+    mc = _multicall_address()
+    native = native_symbol()
+    calls, index = [], []
+    cached = {t: token_meta_cache.get(t) for t in tokens if t is not None}
+    for t, meta in cached.items():
+        if meta is None:
+            calls += [(t, SEL_DECIMALS), (t, SEL_SYMBOL)]
+            index += [("dec", t, None), ("sym", t, None)]
+    for t in tokens:
+        for o in owners:
+            if t is None:
+                calls.append((mc, SEL_GET_ETH_BALANCE + "000000000000000000000000" + o[2:]))
+            else:
+                calls.append((t, SEL_BALANCE_OF + "000000000000000000000000" + o[2:]))
+            index.append(("bal", t, o))
+    agg = queue_multicall(batch, calls, block)
+
+    def _resolve():
+        try:
+            results = agg()
+        except Exception as e:
+            return {(t, o): e for t in tokens for o in owners}
+        raw, out = {}, {}
+        for (kind, t, o), (ok, data) in zip(index, results):
+            raw[(kind, t, o)] = data if ok else "0x"
+            if kind == "bal" and not ok:
+                out[(t, o)] = RpcError({"code": 3, "message": "execution reverted"})
+        meta = {t: m or _resolve_meta(t, raw[("dec", t, None)], raw[("sym", t, None)])
+                for t, m in cached.items()}
+        for t in tokens:
+            for o in owners:
+                if (t, o) in out:
+                    continue
+                amount = _decode_uint(raw[("bal", t, o)])
+                if t is None:
+                    out[(t, o)] = (native, amount / 10**18)
+                else:
+                    out[(t, o)] = (meta[t][0], amount / (10 ** meta[t][1]))
+        return out
+    return _resolve
@@ -0,0 +1,56 @@
+from __future__ import annotations
+import argparse
+
+from engine.state import ensure_db, rebuild_rollups, check_rollups, EXPORT_CHUNK
+
+# Maintenance commands: python -m engine.admin <command>
+
+def _rebuild_rollups(args):
+    rebuild_rollups()
+    print("rollups rebuilt")
+
+def _check_rollups(args):
+    drift = check_rollups()
+    for day, source, wallet, chain_id, rolled, raw in drift:
+        where = f"{day} {source} {wallet or '(none)'} chain {chain_id}" if day else f"{wallet or '(none)'} total"
+        print(f"{where}: rollup={rolled:.12f} raw={raw:.12f}")
+    if drift and args.repair:
+        rebuild_rollups()
+        print("rollups rebuilt")
+    elif not drift:
+        print("rollups consistent")
+
+def _export(args):
+    from engine.export import export
+    filters = {"status": args.status} if args.table == "decisions" else \
+        {"since": args.since, "until": args.until, "wallet": args.wallet, "source": args.source,
+         "chain_id": args.chain}
+    n = export(args.table, args.out, args.format, args.chunk_size, **filters)
+    if args.out != "-":
+        print(f"{n} rows written to {args.out}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engine.admin")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild-rollups", help="recompute earnings_daily/earnings_totals from raw earnings").set_defaults(fn=_rebuild_rollups)
+    p = sub.add_parser("check-rollups", help="compare daily rollups and totals with raw earnings")
+    p.add_argument("--repair", action="store_true", help="rebuild when drift is found")
+    p.set_defaults(fn=_check_rollups)
+    p = sub.add_parser("export", help="stream earnings or decisions to CSV/Parquet in chunks")
+    p.add_argument("table", choices=["earnings", "decisions"])
+    p.add_argument("out", help="output file (.csv or .parquet), or - for CSV on stdout")
+    p.add_argument("--format", choices=["csv", "parquet"], default=None, help="default: from the file extension")
+    p.add_argument("--since", default=None, help="earnings: ISO date/time, inclusive")
+    p.add_argument("--until", default=None, help="earnings: ISO date/time, exclusive")
+    p.add_argument("--wallet", default=None)
+    p.add_argument("--source", default=None)
+    p.add_argument("--chain", type=int, default=None, help="earnings: only this chain id")
+    p.add_argument("--status", default=None, help="decisions: only this status")
+    p.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK)
+    p.set_defaults(fn=_export)
+    args = ap.parse_args(argv)
+    ensure_db()
+    args.fn(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+from __future__ import annotations
+import argparse, bisect, logging
+from datetime import date, datetime, timedelta, timezone
+
+from connectors.eth_readonly import RpcBatch, RpcError, get_block, queue_balances, use_chain, _hex_to_int, _to_checksum
+from engine.state import (ensure_db, unit_of_work, get_day_block_index, put_day_blocks, get_prev_balance_row,
+                          get_balance_rows, get_tokens, net_transfers, get_backfill_checkpoint, set_backfill_checkpoint,
+                          insert_earnings, upsert_daily_balances)
+from engine.transfers import index_transfers
+
+log = logging.getLogger(__name__)
+
+# Reconstructs daily balances (and the earnings they imply) for past days from an archive node:
+#   python -m engine.backfill --wallet 0x... --start 2024-01-01 [--end 2024-12-31] [--tokens ETH,stETH] [--chain 1]
+# One chain per run (its archive endpoint is RPC_URL_<chainid>). Each day's balance is read at the last block before the next UTC midnight. Those blocks are
+# found by binary search run for all days in lockstep (one batched round of block lookups per
+# step) and cached in day_blocks. Progress is checkpointed per wallet/token after every chunk.
+# Days the live scanner already recorded are left alone (the day after one is measured against
+# it), and ERC-20 transfers in the window are indexed so deposits aren't booked as yield.
+
+def _midnight_ts(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+def _days(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+def find_day_blocks(days: list[date], head=None, chain_id: int = 1) -> dict[str, tuple[int, int]]:
+    # {day: (block, ts)} for the last block of each UTC day on the selected chain, using the cached
+    # index where possible
+    index = {d: (b, t) for d, b, t in get_day_block_index(chain_id)}
+    out = {d.isoformat(): index[d.isoformat()] for d in days if d.isoformat() in index}
+    todo = [d for d in days if d.isoformat() not in out]
+    if not todo:
+        return out
+    head = head or get_block()
+    known = sorted((b, t) for b, t in index.values())
+    known_ts = [t for _, t in known]
+    ts_cache: dict[int, int] = {b: t for b, t in known}
+    ts_cache[head.number] = head.timestamp
+
+    # per day: lo has ts < target, hi has ts >= target (head + 1 stands for "not yet mined")
+    search = {}
+    for d in todo:
+        target = _midnight_ts(d + timedelta(days=1))
+        if target > head.timestamp:
+            continue  # day not finished yet
+        i = bisect.bisect_left(known_ts, target)
+        lo = known[i - 1][0] if i > 0 else 0
+        hi = known[i][0] if i < len(known) else head.number + 1
+        search[d.isoformat()] = [lo, hi, target]
+
+    while True:
+        pending = {k: v for k, v in search.items() if v[1] - v[0] > 1}
+        if not pending:
+            break
+        probes = sorted({(lo + hi) // 2 for lo, hi, _ in pending.values()} - set(ts_cache))
+        if probes:
+            with RpcBatch() as batch:
+                reads = {n: batch.add("eth_getBlockByNumber", [hex(n), False]) for n in probes}
+            for n, read in reads.items():
+                blk = read()
+                if not blk:
+                    raise RpcError({"code": -32000, "message": f"block {n} not found"})
+                ts_cache[n] = _hex_to_int(blk["timestamp"])
+        for v in pending.values():
+            mid = (v[0] + v[1]) // 2
+            if ts_cache[mid] < v[2]:
+                v[0] = mid
+            else:
+                v[1] = mid
+
+    found = [(d, lo, ts_cache.get(lo, 0)) for d, (lo, _, _) in search.items()]
+    missing_ts = [b for _, b, t in found if b not in ts_cache]
+    if missing_ts:
+        with RpcBatch() as batch:
+            reads = {n: batch.add("eth_getBlockByNumber", [hex(n), False]) for n in missing_ts}
+        for n, read in reads.items():
+            ts_cache[n] = _hex_to_int(read()["timestamp"])
+    rows = [(d, b, ts_cache[b]) for d, b, _ in found]
+    put_day_blocks(rows, chain_id)
+    out.update({d: (b, t) for d, b, t in rows})
+    return out
+
+def _read_days(tokens: list[str | None], wallet: str, day_blocks: list[tuple[str, int]]) -> dict:
+    # {(day, token): (symbol, amount)}; one batch for all days, falling back to per-call reads
+    # for days where the Multicall3 read failed (e.g. blocks before its deployment)
+    with RpcBatch() as batch:
+        reads = {d: queue_balances(batch, tokens, [wallet], hex(b)) for d, b in day_blocks}
+    results = {d: read() for d, read in reads.items()}
+    retry = [(d, b) for d, b in day_blocks if any(isinstance(r, Exception) for r in results[d].values())]
+    if retry:
+        with RpcBatch() as batch:
+            reads = {d: queue_balances(batch, tokens, [wallet], hex(b), multicall=False) for d, b in retry}
+        results.update({d: read() for d, read in reads.items()})
+    out = {}
+    for d, res in results.items():
+        for (t, _), r in res.items():
+            if isinstance(r, Exception):
+                raise r
+            out[(d, t)] = r
+    return out
+
+def backfill(wallet: str, start: date, end: date | None = None, tokens: list[str] | None = None,
+             chunk_days: int = 30, chain_id: int = 1) -> int:
+    wallet = _to_checksum(wallet.strip().lower())
+    known = {k: m for k, m in get_tokens().items() if m["chain_id"] == chain_id}
+    tokens = tokens or [k for k, m in known.items() if m["enabled"]]
+    for t in tokens:
+        if t not in known:
+            raise ValueError(f"Unsupported token on chain {chain_id}: {t}")
+    with use_chain(chain_id):
+        return _backfill(wallet, start, end, tokens, known, chunk_days, chain_id)
+
+def _backfill(wallet: str, start: date, end: date | None, tokens: list[str], known: dict, chunk_days: int,
+              chain_id: int) -> int:
+    end = end or (datetime.utcnow().date() - timedelta(days=1))
+    addr = {t: known[t]["address"] or None for t in tokens}
+
+    # resume each token after its checkpoint
+    resume = {}
+    for t in tokens:
+        cp = get_backfill_checkpoint(wallet, t)
+        resume[t] = max(start, date.fromisoformat(cp) + timedelta(days=1)) if cp else start
+    first = min(resume.values())
+    if first > end:
+        return 0
+
+    head = get_block()
+    written = 0
+    prev: dict[str, tuple | None] = {}  # token -> (amount, block_number) of the day before
+    for chunk_start in range(0, (end - first).days + 1, chunk_days):
+        days = _days(first + timedelta(days=chunk_start), min(end, first + timedelta(days=chunk_start + chunk_days - 1)))
+        blocks = find_day_blocks(days, head, chain_id)
+        day_blocks = [(d.isoformat(), blocks[d.isoformat()][0]) for d in days if d.isoformat() in blocks]
+        if not day_blocks:
+            break
+        values = _read_days(list(dict.fromkeys(addr.values())), wallet, day_blocks)
+        # days the live scanner already recorded are kept as they are (their earnings are booked)
+        live = get_balance_rows(wallet, day_blocks[0][0], day_blocks[-1][0], chain_id)
+
+        balance_rows, earning_rows = [], []
+        for t in tokens:
+            todo = [(d, b) for d, b in day_blocks if date.fromisoformat(d) >= resume[t]]
+            if not todo:
+                continue
+            symbol = values[(todo[0][0], addr[t])][0]
+            if t not in prev:
+                prev[t] = get_prev_balance_row(symbol, todo[0][0], wallet=wallet, chain_id=chain_id)
+            if addr[t]:
+                # deposits and withdrawals in the window are not yield (as in live scans)
+                lo = prev[t][1] if prev[t] and prev[t][1] is not None else todo[0][1]
+                index_transfers(addr[t], [wallet], lo + 1, todo[-1][1], chain_id)
+            for d, b in todo:
+                symbol, bal = values[(d, addr[t])]
+                if (d, symbol) in live:
+                    prev[t] = live[(d, symbol)]
+                    continue
+                balance_rows.append((d, symbol, bal, wallet, b, blocks[d][1], chain_id))
+                if prev[t] is not None:
+                    delta, note = bal - prev[t][0], "Backfilled balance delta vs previous day"
+                    if addr[t] and prev[t][1] is not None:
+                        moved = net_transfers(wallet, addr[t], prev[t][1], b, chain_id)
+                        delta -= moved
+                        note = f"Backfilled yield vs previous day (balance delta net of {moved:+.8f} transferred)"
+                    if delta > 0:
+                        earning_rows.append((datetime.utcfromtimestamp(blocks[d][1]).isoformat(), f"{symbol} yield",
+                                             delta, f"{note}: +{delta:.8f} {symbol}", wallet, chain_id, symbol))
+                prev[t] = (bal, b)
+        with unit_of_work():
+            upsert_daily_balances(balance_rows)
+            insert_earnings(earning_rows)
+            for t in tokens:
+                if date.fromisoformat(day_blocks[-1][0]) >= resume[t]:
+                    set_backfill_checkpoint(wallet, t, day_blocks[-1][0])
+        written += len(balance_rows)
+        log.info("backfilled %s %s..%s (%d rows)", wallet, day_blocks[0][0], day_blocks[-1][0], len(balance_rows))
+    return written
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engine.backfill", description="Backfill daily balances from archive blocks")
+    ap.add_argument("--wallet", required=True)
+    ap.add_argument("--start", required=True, type=date.fromisoformat)
+    ap.add_argument("--end", type=date.fromisoformat, default=None, help="default: yesterday (UTC)")
+    ap.add_argument("--tokens", default="", help="comma-separated token keys, default: all enabled tokens")
+    ap.add_argument("--chunk-days", type=int, default=30)
+    ap.add_argument("--chain", type=int, default=1, help="chain id (default: 1, Ethereum mainnet)")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    ensure_db()
+    n = backfill(args.wallet, args.start, args.end, [t.strip() for t in args.tokens.split(",") if t.strip()] or None,
+                 args.chunk_days, args.chain)
+    print(f"{n} balance rows written")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import csv, os, sys
+
+from engine.state import (EARNINGS_COLUMNS, DECISIONS_COLUMNS, EXPORT_CHUNK, COMPACTED_KEY, iter_earnings,
+                          iter_decisions, get_setting)
+
+# Streams earnings/decisions to CSV or Parquet one chunk at a time (engine.state's keyset
+# readers), so an export of any size runs in constant memory. Parquet needs pyarrow, which is
+# optional: pip install pyarrow. Earnings compacted by engine.retention are read back from the
+# SQLite archive; with a Parquet archive an export reaching into compacted history is refused.
+
+TABLES = {
+    "earnings": (EARNINGS_COLUMNS, iter_earnings),
+    "decisions": (DECISIONS_COLUMNS, iter_decisions),
+}
+FORMATS = ("csv", "parquet")
+
+def _arrow_schema(table: str):
+    import pyarrow as pa
+    types = {"id": pa.int64(), "chain_id": pa.int64(), "amount": pa.float64(), "estimated_value": pa.float64()}
+    return pa.schema([(c, types.get(c, pa.string())) for c in TABLES[table][0]])
+
+def _pyarrow():
+    try:
+        import pyarrow, pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+def _earnings_archive(since: str | None) -> str | None:
+    # the archive to merge when the export starts before RETENTION_EARNINGS_BEFORE
+    before = get_setting(COMPACTED_KEY, "")
+    if not before or (since and since >= before):
+        return None
+    from engine import retention
+    path = retention.archive_path("earnings")
+    if path is None:
+        raise RuntimeError(f"raw earnings before {before} were compacted and there is no SQLite archive in "
+                           f"{retention.ARCHIVE_DIR}; export with --since {before} or read the archive directly")
+    return path
+
+def iter_chunks(table: str, chunk_size: int = EXPORT_CHUNK, **filters):
+    if table not in TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    if table == "earnings":
+        filters["archive"] = _earnings_archive(filters.get("since"))
+    return TABLES[table][1](chunk_size=chunk_size, **filters)
+
+def iter_record_batches(table: str, chunk_size: int = EXPORT_CHUNK, **filters):
+    # the same chunks as Arrow record batches
+    pa = _pyarrow()
+    schema = _arrow_schema(table)
+    for rows in iter_chunks(table, chunk_size, **filters):
+        cols = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays([pa.array(c, type=f.type) for c, f in zip(cols, schema)], schema=schema)
+
+def _write_csv(f, table: str, chunks) -> int:
+    w = csv.writer(f)
+    w.writerow(TABLES[table][0])
+    n = 0
+    for rows in chunks:
+        w.writerows(rows)
+        n += len(rows)
+    return n
+
+def export(table: str, path: str, fmt: str | None = None, chunk_size: int = EXPORT_CHUNK, **filters) -> int:
+    # path "-" writes CSV to stdout; files are written under a temporary name and renamed when
+    # complete, so an interrupted export never leaves a truncated file behind
+    fmt = fmt or ("parquet" if path.endswith(".parquet") else "csv")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if path == "-":
+        if fmt != "csv":
+            raise ValueError("Only CSV can be written to stdout")
+        return _write_csv(sys.stdout, table, iter_chunks(table, chunk_size, **filters))
+    tmp = path + ".part"
+    try:
+        if fmt == "csv":
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                n = _write_csv(f, table, iter_chunks(table, chunk_size, **filters))
+        else:
+            _pyarrow()
+            import pyarrow.parquet as pq
+            n = 0
+            with pq.ParquetWriter(tmp, _arrow_schema(table), compression="zstd") as w:
+                for batch in iter_record_batches(table, chunk_size, **filters):
+                    w.write_batch(batch)
+                    n += batch.num_rows
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return n
@@ -0,0 +1,207 @@
+from __future__ import annotations
+import functools, inspect, os, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process counters and latency histograms for the hot paths (RPC, SQLite, strategy scans,
+# scheduler cycles). Everything is kept in this module's registry; render() produces the
+# Prometheus text format, served on METRICS_PORT by start_http_server(), and snapshot() feeds the
+# Diagnostics panel in app.py. Metrics are per process: the endpoint has to run in the process
+# that runs the scheduler.
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_histograms: dict[tuple, list] = {}  # key -> [bucket counts..., +Inf count, sum]
+_help: dict[str, str] = {}
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+def describe(name: str, text: str):
+    _help[name] = text
+
+def _inc(k: tuple, value: float):
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+def _observe(k: tuple, seconds: float):
+    i = bisect_left(BUCKETS, seconds)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = [0] * (len(BUCKETS) + 2)
+        h[i] += 1
+        h[-1] += seconds
+
+def inc(name: str, value: float = 1, **labels):
+    if ENABLED:
+        _inc(_key(name, labels), value)
+
+def observe(name: str, seconds: float, **labels):
+    if ENABLED:
+        _observe(_key(name, labels), seconds)
+
+@contextmanager
+def timed(name: str, **labels):
+    # observes the block's duration; exceptions are counted in <name without _seconds>_errors_total
+    t = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc(name.removesuffix("_seconds") + "_errors_total", **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - t, **labels)
+
+def instrument_db(fn):
+    # db_call_seconds{fn} per call, db_rows_total{fn} for returned rows (per chunk for iterators).
+    # Keys are built once here; these wrappers sit on every query.
+    labels = {"fn": fn.__name__}
+    seconds_key, rows_key, errors_key = (_key(n, labels) for n in ("db_call_seconds", "db_rows_total", "db_call_errors_total"))
+    clock = time.perf_counter
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def gen_wrapper(*args, **kwargs):
+            it = fn(*args, **kwargs)
+            while True:
+                t = clock()
+                try:
+                    chunk = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    if ENABLED:
+                        _observe(seconds_key, clock() - t)
+                if ENABLED:
+                    _inc(rows_key, len(chunk))
+                yield chunk
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        t = clock()
+        try:
+            value = fn(*args, **kwargs)
+        except BaseException:
+            _inc(errors_key, 1)
+            raise
+        finally:
+            _observe(seconds_key, clock() - t)
+        if value.__class__ is list or hasattr(value, "shape"):
+            _inc(rows_key, len(value))
+        return value
+    return wrapper
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def _quantile(h: list, q: float) -> float | None:
+    total = sum(h[:-1])
+    if not total:
+        return None
+    rank, seen = q * total, 0
+    for i, c in enumerate(h[:-1]):
+        seen += c
+        if seen >= rank:
+            # upper bound of the bucket (the overflow bucket reports the largest bound)
+            return BUCKETS[min(i, len(BUCKETS) - 1)]
+    return BUCKETS[-1]
+
+def snapshot() -> dict:
+    # {"counters": [(name, labels, value)], "histograms": [(name, labels, {count, sum, mean, p50, p95, p99})]}
+    with _lock:
+        counters = [(n, dict(l), v) for (n, l), v in sorted(_counters.items())]
+        hists = [(n, dict(l), list(h)) for (n, l), h in sorted(_histograms.items())]
+    out = []
+    for n, labels, h in hists:
+        count = sum(h[:-1])
+        out.append((n, labels, {"count": count, "sum": h[-1], "mean": h[-1] / count if count else 0.0,
+                                "p50": _quantile(h, 0.5), "p95": _quantile(h, 0.95), "p99": _quantile(h, 0.99)}))
+    return {"counters": counters, "histograms": out}
+
+def _fmt_labels(labels: dict, extra: tuple = ()) -> str:
+    items = list(labels.items()) + list(extra)
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def render() -> str:
+    with _lock:
+        counters = sorted(_counters.items())
+        hists = sorted((k, list(h)) for k, h in _histograms.items())
+    lines, seen = [], set()
+    for (name, labels), v in counters:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_fmt_labels(dict(labels))} {v}")
+    for (name, labels), h in hists:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+        labels, acc = dict(labels), 0
+        for bound, c in zip(BUCKETS + ("+Inf",), h[:-1]):
+            acc += c
+            lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', bound),))} {acc}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-1]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {acc}")
+    return "\n".join(lines) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        data = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+_server = None
+
+def start_http_server(port: int | None = None, host: str | None = None):
+    # idempotent; without a port (argument or METRICS_PORT) nothing is started
+    global _server
+    port = port if port is not None else int(os.getenv("METRICS_PORT", "0") or 0)
+    if _server is not None or not port:
+        return _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host or os.getenv("METRICS_HOST", "127.0.0.1"), port), _Handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics-http").start()
+    return _server
+
+describe("rpc_request_seconds", "HTTP round-trip per JSON-RPC request or batch, by chain and method (mixed batches: batch)")
+describe("rpc_calls_total", "JSON-RPC calls sent, by chain and method")
+describe("rpc_call_errors_total", "JSON-RPC calls answered with an error, by chain, method and code")
+describe("rpc_retries_total", "HTTP-level retries, by chain and reason")
+describe("rpc_failovers_total", "Requests re-sent to another endpoint after a failure or rate limit, by chain")
+describe("rpc_hedges_total", "Duplicate requests sent after the primary endpoint's latency percentile, by chain")
+describe("rpc_hedge_wins_total", "Hedged requests answered first by the duplicate, by chain")
+describe("rpc_breaker_trips_total", "Endpoints ejected by the circuit breaker, by chain and endpoint host")
+describe("rpc_pinned_cache_hits_total", "Block-pinned reads served from the local cache")
+describe("db_call_seconds", "engine.state function duration")
+describe("db_rows_total", "Rows returned by engine.state functions")
+describe("strategy_scan_seconds", "Strategy scan() duration inside a scheduler cycle")
+describe("decisions_auto_approved_total", "Proposals approved by the scheduler's auto-approve pass")
+describe("scheduler_cycle_seconds", "Scheduler cycle duration, by outcome")
+describe("scheduler_phase_seconds", "Scheduler cycle phase duration (block, read, apply)")
@@ -0,0 +1,199 @@
+from __future__ import annotations
+import argparse, logging, os, time
+from datetime import date, datetime, timedelta, timezone
+
+from connectors.eth_readonly import RpcBatch, RpcError, BlockRef, chain_name, current_chain, use_chain, _decode_uint
+from engine.state import (ensure_db, get_tokens, get_prices, upsert_prices, get_unpriced_days, get_day_block_index,
+                          get_price)
+
+log = logging.getLogger(__name__)
+
+# Daily USD prices per token, cached in the prices table (one row per chain, symbol and UTC day,
+# with the block it was read at when the source is on-chain). Sources are tried in PRICE_SOURCES
+# order for whatever the previous ones could not price:
+#   chainlink  the token's price_feed aggregator on mainnet (tokens.price_feed / price_quote)
+#   ccxt       daily close of <SYMBOL>/<PRICE_EXCHANGE_QUOTE> on PRICE_EXCHANGE (needs network access)
+# Past days are fetched once; today's price is refreshed after PRICE_REFRESH_SECONDS. Everything
+# that values earnings reads the cache only:
+#   python -m engine.prices update            (today's prices for all tracked tokens)
+#   python -m engine.prices sync --since 2024-01-01   (every day with earnings but no price)
+
+PRICE_SOURCES = [s.strip() for s in os.getenv("PRICE_SOURCES", "chainlink").split(",") if s.strip()]
+PRICE_REFRESH_SECONDS = float(os.getenv("PRICE_REFRESH_SECONDS", "3600"))
+PRICE_EXCHANGE = os.getenv("PRICE_EXCHANGE", "binance")
+PRICE_EXCHANGE_QUOTE = os.getenv("PRICE_EXCHANGE_QUOTE", "USDT")
+
+SEL_LATEST_ROUND = "0xfeaf968c"  # latestRoundData()
+SEL_DECIMALS = "0x313ce567"      # decimals()
+
+def _int256(word: str) -> int:
+    v = int(word, 16)
+    return v - (1 << 256) if v >> 255 else v
+
+def _feeds(keys: set[tuple[int, str]]) -> dict[tuple[int, str], tuple[str, tuple[int, str] | None]]:
+    # {(chain_id, symbol): (aggregator, quote token or None for USD)} from the tokens table; a
+    # price_quote symbol is the token of that symbol on the same chain, else on mainnet
+    metas = {}
+    for meta in get_tokens().values():
+        if meta["price_feed"]:
+            metas.setdefault((int(meta["chain_id"] or 1), meta["symbol"]), meta)
+    out = {}
+    for key in keys:
+        meta = metas.get(key)
+        if meta is None:
+            continue
+        quote = meta["price_quote"]
+        if quote and quote.upper() != "USD":
+            quote = (key[0], quote) if (key[0], quote) in metas else (1, quote)
+        else:
+            quote = None
+        out[key] = (meta["price_feed"], quote)
+    return out
+
+def _chainlink(keys: set[tuple[int, str]], day: str, block: BlockRef | None) -> dict[tuple[int, str], tuple[float, int | None]]:
+    # one batched read of every needed aggregator (plus the feeds their quotes depend on); feeds
+    # are mainnet contracts, read at `block` when it is a mainnet block, else at the head
+    feeds = _feeds(keys)
+    feeds.update(_feeds({q for _, q in feeds.values() if q and q not in feeds}))
+    if not feeds:
+        return {}
+    with use_chain(1):
+        tag = block.tag if block is not None else "latest"
+        with RpcBatch() as batch:
+            reads = {feed: (batch.add("eth_call", [{"to": feed, "data": SEL_LATEST_ROUND}, tag]),
+                            batch.add("eth_call", [{"to": feed, "data": SEL_DECIMALS}, tag]))
+                     for feed in dict.fromkeys(f for f, _ in feeds.values())}
+    answers = {}
+    for feed, (answer, decimals) in reads.items():
+        try:
+            data = (answer() or "0x")[2:]
+            if len(data) < 128:
+                log.warning("chainlink: no aggregator at %s", feed)
+                continue
+            value = _int256(data[64:128]) / 10 ** _decode_uint(decimals() or "0x")
+        except (RpcError, ValueError) as e:
+            log.warning("chainlink %s: %s", feed, e)
+            continue
+        if value > 0:
+            answers[feed] = value
+    raw = {key: answers[feed] for key, (feed, _) in feeds.items() if feed in answers}
+    out = {}
+    for key, (_, quote) in feeds.items():
+        if key not in raw:
+            continue
+        if quote is None:
+            out[key] = raw[key]
+        elif quote in raw and not feeds[quote][1]:
+            out[key] = raw[key] * raw[quote]
+    number = block.number if block is not None else None
+    return {k: (v, number) for k, v in out.items() if k in keys}
+
+_exchange = None
+
+def _ccxt(keys: set[tuple[int, str]], day: str, block: BlockRef | None) -> dict[tuple[int, str], tuple[float, int | None]]:
+    # exchange markets are per ticker, so every chain's token of a symbol gets its close
+    global _exchange
+    try:
+        import ccxt
+    except ImportError:
+        raise RuntimeError("The ccxt price source needs ccxt (pip install ccxt)") from None
+    if _exchange is None:
+        _exchange = getattr(ccxt, PRICE_EXCHANGE)({"enableRateLimit": True})
+    d = date.fromisoformat(day)
+    since = int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp() * 1000)
+    out = {}
+    for sym in {s for _, s in keys}:
+        try:
+            candles = _exchange.fetch_ohlcv(f"{sym.upper()}/{PRICE_EXCHANGE_QUOTE}", "1d", since=since, limit=1)
+        except Exception as e:
+            log.warning("ccxt %s: %s", sym, e)
+            continue
+        if candles and candles[0][0] == since:
+            out.update({k: (float(candles[0][4]), None) for k in keys if k[1] == sym})
+    return out
+
+SOURCES = {"chainlink": _chainlink, "ccxt": _ccxt}
+
+# ((chain_id, symbol), day) -> monotonic time of the last attempt no source could price; not
+# retried for PRICE_REFRESH_SECONDS, so a token without a feed costs nothing per cycle
+_misses: dict[tuple[tuple[int, str], str], float] = {}
+
+def _token_keys(enabled_only: bool = True) -> list[tuple[int, str]]:
+    return list(dict.fromkeys((int(m["chain_id"] or 1), m["symbol"]) for m in get_tokens(enabled_only).values()))
+
+def update_prices(keys: list[tuple[int, str]] | None = None, day: str | None = None, block: BlockRef | None = None,
+                  sources: list[str] | None = None) -> int:
+    # Fetches the day's price for every (chain_id, symbol) not cached yet (today: or cached
+    # longer than PRICE_REFRESH_SECONDS ago). `block` pins on-chain reads; it is ignored off mainnet.
+    today = datetime.utcnow().date().isoformat()
+    day = day or (block.day if block is not None else today)
+    if block is not None and current_chain() != 1:
+        block = None
+    keys = _token_keys() if keys is None else list(dict.fromkeys(keys))
+    cached = get_prices(keys, day)
+    stale = datetime.utcnow() - timedelta(seconds=PRICE_REFRESH_SECONDS)
+    now = time.monotonic()
+    todo = {k for k in keys
+            if (k not in cached or (day >= today and datetime.fromisoformat(cached[k][1]) < stale))
+            and now - _misses.get((k, day), -PRICE_REFRESH_SECONDS) >= PRICE_REFRESH_SECONDS}
+    rows = []
+    for name in PRICE_SOURCES if sources is None else sources:
+        if not todo:
+            break
+        source = SOURCES.get(name)
+        if source is None:
+            raise ValueError(f"Unknown price source: {name}")
+        for (cid, sym), (usd, number) in source(todo, day, block).items():
+            rows.append((cid, sym, day, usd, number, name))
+            todo.discard((cid, sym))
+    _misses.update({(k, day): now for k in todo})
+    upsert_prices(rows)
+    return len(rows)
+
+def sync_missing(since: str | None = None) -> int:
+    # prices for every (chain, asset, day) that has earnings but no cached price; on-chain sources
+    # read past days at the day's mainnet block from day_blocks (needs an archive node), and are
+    # skipped for days without one, where only sources with price history (ccxt) are used
+    by_day: dict[str, list[tuple[int, str]]] = {}
+    for cid, asset, day in get_unpriced_days(since):
+        by_day.setdefault(day, []).append((cid, asset))
+    blocks = {d: BlockRef(b, ts) for d, b, ts in get_day_block_index(1)}
+    today = datetime.utcnow().date().isoformat()
+    n = 0
+    for day, keys in by_day.items():
+        block = blocks.get(day)
+        sources = PRICE_SOURCES
+        if block is None and day < today:
+            sources = [s for s in PRICE_SOURCES if s != "chainlink"]
+            if not sources:
+                log.info("%s: no mainnet block for this day (run engine.backfill first); skipped", day)
+                continue
+        with use_chain(1):
+            n += update_prices(keys, day, block, sources)
+    return n
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engine.prices", description="Fetch and cache USD prices")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("update", help="today's prices for the enabled tokens")
+    p.add_argument("--symbols", default="", help="comma-separated symbols, default: enabled tokens")
+    p = sub.add_parser("sync", help="prices for every day with earnings but no price")
+    p.add_argument("--since", default=None, help="ISO date")
+    p = sub.add_parser("show", help="latest cached price per token")
+    p.add_argument("--day", default=None)
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    ensure_db()
+    if args.command == "update":
+        symbols = {s.strip() for s in args.symbols.split(",") if s.strip()}
+        n = update_prices([k for k in _token_keys(False) if k[1] in symbols] if symbols else None)
+        print(f"{n} price(s) updated")
+    elif args.command == "sync":
+        print(f"{sync_missing(args.since)} price(s) fetched")
+    else:
+        for cid, sym in _token_keys(False):
+            usd = get_price(sym, args.day, cid)
+            print(f"{sym:<10} {chain_name(cid):<14} {'-' if usd is None else f'{usd:,.4f}'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+from __future__ import annotations
+import argparse, glob, json, logging, os, sqlite3, time
+from datetime import date, datetime, timedelta
+
+from engine import state
+from engine.state import (ensure_db, aged_months, iter_aged, delete_aged, db_stats, incremental_vacuum, optimize,
+                          full_vacuum, get_setting, set_setting, RETENTION_TABLES, COMPACTED_KEY)
+
+log = logging.getLogger(__name__)
+
+# Keeps incomes.db bounded. Rows older than their retention window are written to the archive
+# and then deleted from the live database, a calendar month at a time:
+#   earnings   raw rows; the earnings_daily/earnings_totals rollups keep every day's totals
+#   balances   daily rows thinned to the last one per week or month (RETAIN_BALANCE_PERIOD)
+#   decisions  approved/rejected ones (pending decisions are never touched)
+# Archives go to ARCHIVE_DIR as one SQLite file per table (<table>.sqlite, attachable, rows keyed
+# by id so re-archiving is harmless) or, with ARCHIVE_FORMAT=parquet, one zstd Parquet file per
+# table and month (needs pyarrow). Afterwards the freed pages are released a few at a time with
+# incremental vacuum and stale statistics are re-analyzed. The worker runs this every
+# RETENTION_INTERVAL_HOURS; every step is a short transaction, so scans carry on meanwhile.
+#   python -m engine.retention run [--dry-run]
+#   python -m engine.retention status
+#   python -m engine.retention query "SELECT COUNT(*) FROM earnings_all"
+#   python -m engine.retention vacuum [--full]
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+# days kept in full; 0 keeps the table forever. The dashboard's raw 30-day views need a month.
+RETAIN_DAYS = {
+    "earnings": _env_int("RETAIN_RAW_EARNINGS_DAYS", 365),
+    "balances": _env_int("RETAIN_DAILY_BALANCES_DAYS", 180),
+    "decisions": _env_int("RETAIN_DECISIONS_DAYS", 365),
+}
+RETAIN_BALANCE_PERIOD = os.getenv("RETAIN_BALANCE_PERIOD", "weekly")  # weekly | monthly
+ARCHIVE_FORMAT = os.getenv("ARCHIVE_FORMAT", "sqlite")               # sqlite | parquet
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or os.path.join(os.path.dirname(state.DB_PATH), "archive")
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+VACUUM_STEP_PAGES = 2000
+LAST_RUN_KEY = "RETENTION_LAST_RUN"
+
+def cutoff(days: int, today: date | None = None) -> str:
+    # first day of the month that holds today - days: only whole months age
+    d = (today or datetime.utcnow().date()) - timedelta(days=max(days, 31))
+    return d.replace(day=1).isoformat()
+
+def _archive_sqlite(table: str, chunks) -> tuple[int, int]:
+    cols = RETENTION_TABLES[table][0]
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    con = sqlite3.connect(os.path.join(ARCHIVE_DIR, f"{table}.sqlite"))
+    n, max_id = 0, None
+    try:
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table}(id INTEGER PRIMARY KEY, {', '.join(cols[1:])})")
+        # engine.export reads archived earnings in (ts, id) order alongside the live table
+        col = RETENTION_TABLES[table][1]
+        con.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{col} ON {table}({col}, id)")
+        for rows in chunks:
+            con.executemany(f"INSERT OR IGNORE INTO {table}({', '.join(cols)}) VALUES({','.join('?' * len(cols))})", rows)
+            n += len(rows)
+            max_id = rows[-1][0]
+        con.commit()
+    finally:
+        con.close()
+    return n, max_id
+
+def _archive_parquet(table: str, month: str, chunks) -> tuple[int, int]:
+    try:
+        import pyarrow as pa, pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("ARCHIVE_FORMAT=parquet needs pyarrow (pip install pyarrow)") from None
+    cols = RETENTION_TABLES[table][0]
+    ints = {"id", "chain_id", "block_number", "block_ts"}
+    floats = {"amount", "estimated_value"}
+    schema = pa.schema([(c, pa.int64() if c in ints else pa.float64() if c in floats else pa.string()) for c in cols])
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    # a month archived again (rows that arrived later) gets a new part file next to the first
+    base = os.path.join(ARCHIVE_DIR, f"{table}-{month}")
+    path, part = base + ".parquet", 1
+    while os.path.exists(path):
+        path, part = f"{base}.{part}.parquet", part + 1
+    tmp = path + ".part"
+    n, max_id = 0, None
+    try:
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as w:
+            for rows in chunks:
+                w.write_batch(pa.RecordBatch.from_arrays(
+                    [pa.array(c, type=f.type) for c, f in zip(zip(*rows), schema)], schema=schema))
+                n += len(rows)
+                max_id = rows[-1][0]
+        if n:
+            os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return n, max_id
+
+def compact(table: str, days: int | None = None, dry_run: bool = False, fence=None) -> int:
+    # archives and deletes the table's aged rows; returns how many were removed. fence (the
+    # worker's lease check) runs in every delete transaction and stops the run by raising.
+    days = RETAIN_DAYS[table] if days is None else days
+    if not days:
+        return 0
+    before = cutoff(days)
+    removed = 0
+    for month in aged_months(table, before):
+        chunks = iter_aged(table, month, before, RETAIN_BALANCE_PERIOD)
+        if dry_run:
+            n = sum(len(c) for c in chunks)
+            if n:
+                log.info("%s %s: %d row(s) would be archived and removed", table, month, n)
+            removed += n
+            continue
+        if fence is not None:
+            fence()
+        n, max_id = (_archive_parquet(table, month, chunks) if ARCHIVE_FORMAT == "parquet"
+                     else _archive_sqlite(table, chunks))
+        if not n:
+            continue
+        if table == "earnings":
+            # before deleting: from here on the daily rollups are the record for this month
+            end = min((date.fromisoformat(month + "-01") + timedelta(days=32)).replace(day=1).isoformat(), before)
+            set_setting(COMPACTED_KEY, max(get_setting(COMPACTED_KEY, ""), end))
+        removed += delete_aged(table, month, before, RETAIN_BALANCE_PERIOD, max_id, fence=fence)
+        log.info("%s %s: %d row(s) archived and removed", table, month, n)
+    return removed
+
+def vacuum(max_pages: int | None = None, pause: float = 0.05) -> int:
+    # releases free pages VACUUM_STEP_PAGES at a time, each step its own short transaction
+    if db_stats()["auto_vacuum"] != 2:
+        log.warning("incremental vacuum is off for this database; run `python -m engine.retention vacuum --full` "
+                    "once with the worker stopped")
+        return 0
+    freed = 0
+    while max_pages is None or freed < max_pages:
+        step = VACUUM_STEP_PAGES if max_pages is None else min(VACUUM_STEP_PAGES, max_pages - freed)
+        n = incremental_vacuum(step)
+        freed += n
+        if n < step:
+            break
+        time.sleep(pause)
+    return freed
+
+def run(dry_run: bool = False, fence=None) -> dict:
+    if RETAIN_BALANCE_PERIOD not in ("weekly", "monthly"):
+        raise ValueError(f"RETAIN_BALANCE_PERIOD must be weekly or monthly, not {RETAIN_BALANCE_PERIOD!r}")
+    if ARCHIVE_FORMAT not in ("sqlite", "parquet"):
+        raise ValueError(f"Unknown ARCHIVE_FORMAT: {ARCHIVE_FORMAT}")
+    if dry_run:
+        return {t: compact(t, dry_run=True) for t in RETAIN_DAYS}
+    try:
+        out = {t: compact(t, fence=fence) for t in RETAIN_DAYS}
+        out["pages_freed"] = vacuum()
+        optimize()
+    finally:
+        # a failed run waits for the next interval too, instead of retrying on every poll
+        set_setting(LAST_RUN_KEY, str(time.time()))
+    return out
+
+def due() -> bool:
+    if RETENTION_INTERVAL_HOURS <= 0:
+        return False
+    try:
+        last = float(get_setting(LAST_RUN_KEY, "0"))
+    except ValueError:
+        last = 0.0
+    return time.time() - last >= RETENTION_INTERVAL_HOURS * 3600
+
+def archive_path(table: str) -> str | None:
+    # the table's SQLite archive, if there is one
+    path = os.path.join(ARCHIVE_DIR, f"{table}.sqlite")
+    return path if os.path.exists(path) else None
+
+def attach_archives(con: sqlite3.Connection) -> list[str]:
+    # attaches every SQLite archive and defines temp views <table>_all = live rows + archived rows
+    views = []
+    for table, (cols, _) in RETENTION_TABLES.items():
+        path = archive_path(table)
+        select = f"SELECT {', '.join(cols)} FROM main.{table}"
+        if path:
+            con.execute(f"ATTACH DATABASE ? AS archive_{table}", (path,))
+            select += f" UNION ALL SELECT {', '.join(cols)} FROM archive_{table}.{table}"
+        con.execute(f"CREATE TEMP VIEW IF NOT EXISTS {table}_all AS {select}")
+        views.append(f"{table}_all")
+    return views
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engine.retention", description="Retention, archival and vacuum")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="archive and remove aged rows, then vacuum and analyze")
+    p.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+    sub.add_parser("status", help="database size, row counts and archive files")
+    p = sub.add_parser("query", help="run a read-only query with the SQLite archives attached (<table>_all views)")
+    p.add_argument("sql")
+    p = sub.add_parser("vacuum", help="release free pages (incremental, safe while scanning)")
+    p.add_argument("--full", action="store_true", help="rewrite the whole file and enable incremental vacuum; "
+                                                      "stop the worker first")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    ensure_db()
+    if args.command == "run":
+        print(json.dumps(run(args.dry_run), indent=2))
+    elif args.command == "status":
+        stats = db_stats()
+        stats["archives"] = sorted(os.path.basename(f) for f in glob.glob(os.path.join(ARCHIVE_DIR, "*")))
+        print(json.dumps(stats, indent=2))
+    elif args.command == "query":
+        con = sqlite3.connect(f"file:{state.DB_PATH}?mode=ro", uri=True)
+        try:
+            attach_archives(con)
+            for row in con.execute(args.sql):
+                print("\t".join("" if v is None else str(v) for v in row))
+        finally:
+            con.close()
+    elif args.full:
+        before = db_stats()["bytes"]
+        full_vacuum()
+        print(f"{before:,} -> {db_stats()['bytes']:,} bytes")
+    else:
+        print(f"{vacuum()} page(s) released")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from __future__ import annotations
+import contextvars, logging, os
+from concurrent.futures import ThreadPoolExecutor
+
+from connectors.eth_readonly import RpcBatch, _to_checksum, queue_balances
+
+log = logging.getLogger(__name__)
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+# Wallets per request (each request reads wallets x tokens) and parallel requests in flight
+SCAN_CHUNK_WALLETS = _env_int("SCAN_CHUNK_WALLETS", 50)
+SCAN_MAX_WORKERS = _env_int("SCAN_MAX_WORKERS", 8)
+
+def _read_chunk(tokens: list[str | None], wallets: list[str], block: str) -> dict:
+    with RpcBatch() as batch:
+        read = queue_balances(batch, tokens, wallets, block)
+    return read()
+
+def read_balances(tokens: list[str | None], wallets: list[str], block: str = "latest",
+                  chunk_size: int | None = None, max_workers: int | None = None) -> dict:
+    # Fans wallets x tokens out over a bounded thread pool, one batched request per wallet chunk.
+    # A failing chunk or malformed address only affects its own wallets: their entries hold the
+    # exception instead of (symbol, amount).
+    chunk_size = chunk_size or SCAN_CHUNK_WALLETS
+    out: dict = {}
+    valid = []
+    for w in dict.fromkeys(wallets):
+        try:
+            valid.append(_to_checksum(w))
+        except ValueError as e:
+            out.update({(t, w): e for t in tokens})
+    chunks = [valid[i:i + chunk_size] for i in range(0, len(valid), chunk_size)]
+    if not chunks or not tokens:
+        return out
+    workers = min(max_workers or SCAN_MAX_WORKERS, len(chunks))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as pool:
+        # each task runs in a copy of the caller's context, so the selected chain carries over
+        futures = {pool.submit(contextvars.copy_context().run, _read_chunk, tokens, chunk, block): chunk
+                   for chunk in chunks}
+        for fut, chunk in futures.items():
+            try:
+                out.update(fut.result())
+            except Exception as e:
+                log.warning("balance read failed for %d wallet(s): %s", len(chunk), e)
+                out.update({(t, w): e for t in tokens for w in chunk})
+    return out
@@ -1,39 +1,328 @@
-import threading
-from engine.state import get_setting, insert_earning, insert_decision
-from services.decision_engine import approve_decision
+import asyncio, cProfile, io, logging, os, pstats, statistics, threading, time
+from collections import deque
+from engine import metrics
+from engine import state
+from engine.state import get_setting, get_price, insert_earning, insert_decision, savepoint, unit_of_work
+from services.decision_engine import approve_decisions
 from strategies.registry import get_enabled_strategies
+from engine.transfers import sync_transfers
+from engine.prices import update_prices
+from connectors.eth_readonly import get_block, get_wallet_addresses, use_chain
 
+log = logging.getLogger(__name__)
+
+def _strategy_key(strat) -> str:
+    return type(strat).__name__ + ":" + getattr(strat, "token", "")
+
+def _usd_value(proposal, day: str, chain_id: int = 1) -> float | None:
+    asset = getattr(proposal, "asset", "")
+    if not asset:
+        return proposal.estimated_value
+    price = get_price(asset, day, chain_id)
+    return None if price is None else proposal.estimated_value * price
+
+class CycleStats:
+    def __init__(self, window: int = 200):
+        self.durations = deque(maxlen=window)
+        self.cycles = 0
+        self.skipped = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.coalesced_nudges = 0
+        self.last_started = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.cycles += 1
+            self.durations.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            d = sorted(self.durations)
+            out = {"cycles": self.cycles, "skipped": self.skipped, "failures": self.failures,
+                   "timeouts": self.timeouts, "coalesced_nudges": self.coalesced_nudges,
+                   "last_started": self.last_started}
+            if d:
+                out.update(last=self.durations[-1], mean=statistics.fmean(d), max=d[-1],
+                           p50=d[len(d) // 2], p95=d[min(len(d) - 1, int(len(d) * 0.95))])
+            return out
+
+# Runs scans on an asyncio loop hosted in this thread. Each strategy has its own interval
+# (strategy.interval_seconds, default interval_seconds); reads for all due strategies go out
+# concurrently, one task per chain (strategy.chain_id) with its own pinned block and timeouts, so
+# a slow chain only delays its own strategies. Each chain's scans are then applied on a worker
+# thread in one transaction, under a timeout.
+# A strategy whose previous scan is still running is skipped, and nudges that arrive while a
+# cycle is running collapse into a single follow-up cycle. fence, if given, is called at the end of
+# every apply transaction and aborts it by raising (the worker's lease check).
 class SchedulerThread(threading.Thread):
-    def __init__(self, interval_seconds: int = 300):
+    MIN_IDLE_SECONDS = 5.0  # floor for the wait after a cycle that had nothing to run
+
+    def __init__(self, interval_seconds: int = 300, read_timeout: float | None = None,
+                 scan_timeout: float | None = None, fence=None):
         super().__init__(daemon=True)
+        self.fence = fence
         self.interval_seconds = interval_seconds
-        self._stop = threading.Event()
-        self._nudge = threading.Event()
+        self.read_timeout = read_timeout or float(os.getenv("SCHEDULER_READ_TIMEOUT", "60"))
+        self.scan_timeout = scan_timeout or float(os.getenv("SCHEDULER_SCAN_TIMEOUT", "60"))
+        self.stats = CycleStats()
+        self._stopping = False
+        self._loop = None
+        self._wake = None
+        self._nudged = threading.Event()
+        self._in_cycle = False
+        self._inflight: set[str] = set()
+        self._next_due: dict[str, float] = {}  # enabled strategies only; pruned every cycle
+        self._last_scan: dict[int, tuple] = {}  # chain id -> (block number, strategies, wallets) last applied
+        self._profile_path = None
+        self._profiles: list = []
+        self.last_profile = None  # (path, text summary) of the last profiled cycle
 
     def nudge(self):
-        self._nudge.set()
+        if self._in_cycle:
+            self.stats.coalesced_nudges += 1
+        self._nudged.set()
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._wake.set)
 
     def run(self):
-        import time
-        while not self._stop.is_set():
-            self._cycle()
-            self._nudge.wait(timeout=self.interval_seconds)
-            self._nudge.clear()
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        force = False
+        while not self._stopping:
+            outcome = await self._run_cycle(force)
+            if self._stopping:
+                break
+            # after a failed cycle (e.g. provider down) retry sooner than the interval, not in a hot loop
+            timeout = self._seconds_until_due() if outcome != "failed" else min(self.interval_seconds, 30)
+            if outcome == "skipped":
+                timeout = max(timeout, self.MIN_IDLE_SECONDS)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            force = self._nudged.is_set()
+            self._nudged.clear()
+
+    def _seconds_until_due(self) -> float:
+        # strategies still in flight (a timed-out scan) are waited for by the next cycle, not here
+        pending = [t for k, t in self._next_due.items() if k not in self._inflight]
+        if not pending:
+            return self.interval_seconds
+        return max(0.0, min(pending) - time.monotonic())
+
+    def profile_next_cycle(self, path: str | None = None):
+        # cProfile the worker-thread phases of the next cycle and dump them to `path` (.prof)
+        self._profile_path = path or os.path.join(os.path.dirname(state.DB_PATH), "profiles",
+                                                  time.strftime("cycle-%Y%m%d-%H%M%S.prof"))
+        self.nudge()
+
+    async def _run_cycle(self, force: bool = False) -> str:
+        # "ok", "skipped" (nothing was due) or "failed"
+        self._in_cycle = True
+        started = time.perf_counter()
+        self.stats.last_started = time.time()
+        outcome = "ok"
+        try:
+            ran = await self._acycle(force)
+            outcome = "ok" if ran else "skipped"
+        except Exception:
+            outcome = "failed"
+            self.stats.failures += 1
+            log.exception("scheduler cycle failed")
+            return outcome
+        finally:
+            self._in_cycle = False
+            metrics.observe("scheduler_cycle_seconds", time.perf_counter() - started, outcome=outcome)
+            if self._profiles and outcome != "skipped":
+                self._save_profile()
+        if ran:
+            self.stats.record(time.perf_counter() - started)
+        else:
+            self.stats.skipped += 1
+        return outcome
+
+    def _profiled(self, fn, *args):
+        # runs fn in the calling worker thread, under cProfile while a capture is pending
+        if self._profile_path is None:
+            return fn(*args)
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            return fn(*args)
+        finally:
+            prof.disable()
+            self._profiles.append(prof)
+
+    def _save_profile(self):
+        path, profiles = self._profile_path, self._profiles
+        self._profile_path, self._profiles = None, []
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            stats = pstats.Stats(*profiles)
+            stats.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(*profiles, stream=out).sort_stats("cumulative").print_stats(30)
+            self.last_profile = (path, out.getvalue())
+            log.info("cycle profile written to %s", path)
+        except Exception:
+            log.exception("could not save cycle profile")
+
+    def _defer(self, strategies, seconds: float | None = None):
+        now = time.monotonic()
+        for s in strategies:
+            interval = getattr(s, "interval_seconds", None) or self.interval_seconds
+            self._next_due[_strategy_key(s)] = now + (interval if seconds is None else min(seconds, interval))
 
     def _cycle(self):
-        auto = get_setting("AUTO_APPROVE_ENABLED", "false").lower() == "true"
+        # synchronous single cycle (runs everything that is enabled, regardless of interval)
+        try:
+            return asyncio.run(self._acycle(force=True))
+        finally:
+            if self._profiles:
+                self._save_profile()
+
+    async def _acycle(self, force: bool = False) -> bool:
+        auto = (await asyncio.to_thread(get_setting, "AUTO_APPROVE_ENABLED", "false")).lower() == "true"
         try:
-            cap = float(get_setting("AUTO_APPROVE_THRESHOLD", "1.0"))
+            cap = float(await asyncio.to_thread(get_setting, "AUTO_APPROVE_THRESHOLD", "1.0"))
         except Exception:
             cap = 1.0
-        for strat in get_enabled_strategies():
-            earnings, proposals = strat.scan()
-            for e in earnings:
-                insert_earning(e.source, e.amount, e.note)
-            for p in proposals:
-                insert_decision(p.strategy, p.action, p.payload, p.estimated_value, p.note)
-                if auto and 0 <= p.estimated_value <= cap:
-                    approve_decision(-1, payload_override=p.payload, strategy_name=p.strategy)
+        strategies = await asyncio.to_thread(get_enabled_strategies)
+        wallets = await asyncio.to_thread(get_wallet_addresses)
+        # forget deadlines of strategies that were disabled since they last ran
+        enabled = {_strategy_key(s) for s in strategies}
+        for key in [k for k in self._next_due if k not in enabled]:
+            del self._next_due[key]
+        now = time.monotonic()
+        due = [s for s in strategies
+               if _strategy_key(s) not in self._inflight
+               and (force or now >= self._next_due.get(_strategy_key(s), 0.0))]
+        if not due:
+            return False
+
+        by_chain: dict[int, list] = {}
+        for s in due:
+            by_chain.setdefault(getattr(s, "chain_id", 1), []).append(s)
+        results = await asyncio.gather(*(self._scan_chain(cid, strats, wallets, auto, cap)
+                                         for cid, strats in by_chain.items()), return_exceptions=True)
+        errors = []
+        for (cid, strats), r in zip(by_chain.items(), results):
+            if isinstance(r, BaseException):
+                log.error("chain %s: scan failed: %s", cid, r)
+                errors.append(r)
+                self._defer(strats, 30)
+        if len(errors) == len(results):
+            raise errors[0]
+        return any(r is True for r in results)
+
+    async def _scan_chain(self, chain_id: int, strategies, wallets, auto: bool, cap: float) -> bool:
+        # Reads and applies one chain's strategies. Runs as its own task, so use_chain only
+        # affects this chain's worker threads and a slow chain never delays another's writes.
+        with use_chain(chain_id):
+            try:
+                # every read on the chain is pinned to one block; nothing to do if its head hasn't moved
+                with metrics.timed("scheduler_phase_seconds", phase="block"):
+                    block = await asyncio.wait_for(asyncio.to_thread(get_block), self.read_timeout)
+                scan_key = (block.number, tuple(_strategy_key(s) for s in strategies), tuple(wallets))
+                if scan_key == self._last_scan.get(chain_id):
+                    self._defer(strategies)
+                    return False
+                with metrics.timed("scheduler_phase_seconds", phase="read"):
+                    prefetched = await asyncio.wait_for(
+                        asyncio.to_thread(self._profiled, self._read_phase, strategies, wallets, block), self.read_timeout)
+            except asyncio.TimeoutError:
+                self.stats.timeouts += 1
+                log.warning("chain %s: balance reads timed out after %.0fs", chain_id, self.read_timeout)
+                self._defer(strategies, 30)
+                return True
+
+        # All writes of the chain's scans land in one transaction; this phase is DB-only
+        keys = [_strategy_key(st) for st in strategies]
+        self._inflight.update(keys)
+        try:
+            with metrics.timed("scheduler_phase_seconds", phase="apply"):
+                failed = await asyncio.wait_for(
+                    asyncio.to_thread(self._profiled, self._apply_scans, strategies, prefetched, block, auto, cap, keys),
+                    self.scan_timeout)
+        except asyncio.TimeoutError:
+            # the worker thread keeps running; _inflight stops the next cycle overlapping it
+            self.stats.timeouts += 1
+            log.warning("chain %s: scans timed out after %.0fs", chain_id, self.scan_timeout)
+            self._defer(strategies, 30)
+            return True
+        for strat in strategies:
+            self._defer([strat], 30 if _strategy_key(strat) in failed else None)
+        self.stats.failures += len(failed)
+        self._last_scan[chain_id] = scan_key
+        return True
+
+    def _read_phase(self, strategies, wallets, block) -> dict:
+        # one shared read per strategy class that offers it (TokenDeltaStrategy.prefetch), for the
+        # strategies of the chain selected by the caller
+        prefetched = {}
+        for cls in dict.fromkeys(type(st) for st in strategies):
+            if hasattr(cls, "prefetch"):
+                prefetched.update(cls.prefetch([st for st in strategies if type(st) is cls], wallets, block))
+        tokens = [a for a in dict.fromkeys(getattr(st, "token_address", None) for st in strategies) if a]
+        try:
+            # bring the transfer index up to the pinned block so deltas can exclude deposits/withdrawals
+            sync_transfers(tokens, wallets, block.number)
+        except Exception:
+            log.exception("transfer sync failed; using raw balance deltas this cycle")
+        keys = [(int(m["chain_id"] or 1), m["symbol"]) for m in (getattr(st, "meta", None) for st in strategies) if m]
+        try:
+            # cached per day (today's refreshed hourly), so this is usually one cache lookup
+            update_prices(keys, block.day, block)
+        except Exception:
+            log.exception("price update failed; USD values use the last cached prices")
+        return prefetched
+
+    def _apply_scans(self, strategies, prefetched, block, auto, cap, keys) -> set:
+        failed = set()
+        priced = []  # new decisions valued in USD, candidates for auto-approval
+        try:
+            with unit_of_work():
+                for strat in strategies:
+                    key = _strategy_key(strat)
+                    try:
+                        new = []
+                        # a failing strategy only rolls back its own writes
+                        with savepoint("strategy"), metrics.timed("strategy_scan_seconds", strategy=key):
+                            earnings, proposals = strat.scan(prefetched, block)
+                            for e in earnings:
+                                # stamped with the pinned block, the same day as the balance it came from
+                                insert_earning(e.source, e.amount, e.note, wallet=e.wallet, ts=block.iso,
+                                               chain_id=getattr(e, "chain_id", 1), asset=getattr(e, "asset", ""))
+                            for p in proposals:
+                                usd = _usd_value(p, block.day, getattr(strat, "chain_id", 1))
+                                # stored unpriced (NULL) rather than in token units
+                                id_ = insert_decision(p.strategy, p.action, p.payload, usd, p.note)
+                                if usd is not None:
+                                    new.append(id_)
+                        priced += new
+                        metrics.inc("strategy_earnings_total", len(earnings), strategy=key)
+                    except Exception:
+                        failed.add(key)
+                        log.exception("%s failed", key)
+                if auto and priced:
+                    # one set-based pass; the cap is in USD, unpriced proposals are left for review
+                    n = approve_decisions(priced, max_value=cap, marker="Auto-approved marker")
+                    metrics.inc("decisions_auto_approved_total", n)
+                if self.fence is not None:
+                    self.fence()
+        finally:
+            self._inflight.difference_update(keys)
+        return failed
 
     def stop(self):
-        self._stop.set()
+        self._stopping = True
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._wake.set)
@@ -1,15 +1,140 @@
 from __future__ import annotations
-import os, sqlite3, json
-from datetime import datetime, timedelta
+import os, sqlite3, json, threading, time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from engine import metrics
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "incomes.db")
 
+# Query and write functions carry @metrics.instrument_db (db_call_seconds / db_rows_total per
+# function); the connection and transaction helpers don't.
+
+# Connections are long-lived and pooled: a thread borrows one for the duration of a `with
+# _conn()` block (nested blocks reuse it) and hands it back afterwards. All writes go through
+# unit_of_work(), which serializes writers in this process behind _WRITE_LOCK and takes the
+# SQLite write lock up front (BEGIN IMMEDIATE); WAL keeps readers from blocking on it, and
+# busy_timeout covers writers in other processes.
+POOL_SIZE = 8
+_pool: list[tuple[str, sqlite3.Connection]] = []
+_pool_lock = threading.Lock()
+_WRITE_LOCK = threading.RLock()
+_local = threading.local()
+
+# Per-table write counters. Readers that cache query results (services.dashboard_data) key
+# them on these, so a committed write in this process invalidates them immediately.
+_generations: dict[str, int] = {}
+_gen_lock = threading.Lock()
+
+def _touch(*tables: str):
+    if getattr(_local, "tx_depth", 0):
+        # published once the surrounding transaction commits
+        _local.dirty = getattr(_local, "dirty", set()) | set(tables)
+        return
+    with _gen_lock:
+        for t in tables:
+            _generations[t] = _generations.get(t, 0) + 1
+
+def generation(*tables: str) -> tuple:
+    with _gen_lock:
+        return tuple(_generations.get(t, 0) for t in tables)
+
+def _connect(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    con = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+    # takes effect only on a new database (existing ones: python -m engine.retention vacuum --full)
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA busy_timeout=30000")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA cache_size=-16000")
+    return con
+
+def _acquire() -> sqlite3.Connection:
+    path = DB_PATH
+    with _pool_lock:
+        while _pool:
+            p, con = _pool.pop()
+            if p == path:
+                return con
+            con.close()
+    return _connect(path)
+
+def _release(con: sqlite3.Connection):
+    if con.in_transaction:
+        con.rollback()
+    with _pool_lock:
+        if len(_pool) < POOL_SIZE:
+            _pool.append((DB_PATH, con))
+            return
+    con.close()
+
+@contextmanager
 def _conn():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    con = getattr(_local, "con", None)
+    if con is not None:
+        yield con
+        return
+    con = _local.con = _acquire()
+    try:
+        yield con
+    finally:
+        _local.con = None
+        _release(con)
 
-def ensure_db():
+@contextmanager
+def unit_of_work():
+    # One transaction for everything inside the block; nested calls join the outer one.
     with _conn() as con:
+        if getattr(_local, "tx_depth", 0):
+            _local.tx_depth += 1
+            try:
+                yield con
+            finally:
+                _local.tx_depth -= 1
+            return
+        with _WRITE_LOCK:
+            con.execute("BEGIN IMMEDIATE")
+            _local.tx_depth = 1
+            _local.dirty = set()
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            else:
+                con.execute("COMMIT")
+            finally:
+                _local.tx_depth = 0
+            _touch(*_local.dirty)
+
+@contextmanager
+def savepoint(name: str = "sp"):
+    # Partial rollback inside a unit_of_work: a failure only undoes the writes made in this block.
+    with unit_of_work() as con:
+        con.execute(f"SAVEPOINT {name}")
+        try:
+            yield con
+        except BaseException:
+            con.execute(f"ROLLBACK TO {name}")
+            con.execute(f"RELEASE {name}")
+            raise
+        con.execute(f"RELEASE {name}")
+
+def close_connections():
+    with _pool_lock:
+        while _pool:
+            _pool.pop()[1].close()
+
+def _add_column(cur, table: str, column: str, decl: str):
+    cols = [r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+@metrics.instrument_db
+def ensure_db():
+    with unit_of_work() as con:
         cur = con.cursor()
         cur.execute("""
         CREATE TABLE IF NOT EXISTS earnings(
@@ -42,54 +167,763 @@ def ensure_db():
             token TEXT NOT NULL,
             amount REAL NOT NULL
         );""")
-        con.commit()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS token_meta(
+            address TEXT PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            decimals INTEGER NOT NULL,
+            ok INTEGER NOT NULL DEFAULT 1,
+            updated_at TEXT NOT NULL
+        );""")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS wallets(
+            address TEXT PRIMARY KEY,
+            label TEXT NOT NULL DEFAULT '',
+            enabled INTEGER NOT NULL DEFAULT 1,
+            added_at TEXT NOT NULL
+        );""")
+        migrate(con)
+
+def _m1_wallets(cur):
+    _add_column(cur, "balances", "wallet", "TEXT NOT NULL DEFAULT ''")
+    _add_column(cur, "earnings", "wallet", "TEXT NOT NULL DEFAULT ''")
+    # Single-wallet installs: adopt WALLET_ADDRESS and attribute its history to it
+    row = cur.execute("SELECT value FROM settings WHERE key='WALLET_ADDRESS'").fetchone()
+    if row and row[0]:
+        legacy = row[0].strip().lower()
+        cur.execute("INSERT OR IGNORE INTO wallets(address, added_at) VALUES(?,?)",
+                    (legacy, datetime.utcnow().isoformat()))
+        cur.execute("UPDATE balances SET wallet=? WHERE wallet=''", (legacy,))
+        cur.execute("UPDATE earnings SET wallet=? WHERE wallet=''", (legacy,))
+
+def _m2_block_pins(cur):
+    _add_column(cur, "balances", "block_number", "INTEGER")
+    _add_column(cur, "balances", "block_ts", "INTEGER")
+
+def _m3_indexes(cur):
+    # keep the newest row per (wallet, day, token) before enforcing uniqueness
+    cur.execute("""
+        DELETE FROM balances WHERE id NOT IN (
+            SELECT MAX(id) FROM balances GROUP BY wallet, day, token)""")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_balances_wallet_day_token ON balances(wallet, day, token)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_earnings_ts ON earnings(ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_earnings_source_ts ON earnings(source, ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_earnings_wallet_ts ON earnings(wallet, ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_decisions_status_id ON decisions(status, id)")
+
+def _m4_rollups(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS earnings_daily(
+        day TEXT NOT NULL,
+        source TEXT NOT NULL,
+        wallet TEXT NOT NULL DEFAULT '',
+        amount REAL NOT NULL DEFAULT 0.0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, source, wallet)
+    );""")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_earnings_daily_wallet_day ON earnings_daily(wallet, day)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS earnings_totals(
+        wallet TEXT PRIMARY KEY,
+        amount REAL NOT NULL DEFAULT 0.0,
+        count INTEGER NOT NULL DEFAULT 0
+    );""")
+    cur.execute("""
+        INSERT INTO earnings_daily(day, source, wallet, amount, count)
+        SELECT substr(ts, 1, 10), source, wallet, SUM(amount), COUNT(*) FROM earnings
+        GROUP BY substr(ts, 1, 10), source, wallet""")
+    cur.execute("""
+        INSERT INTO earnings_totals(wallet, amount, count)
+        SELECT wallet, SUM(amount), SUM(count) FROM earnings_daily GROUP BY wallet""")
+
+def _m5_backfill(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS day_blocks(
+        day TEXT PRIMARY KEY,
+        block INTEGER NOT NULL,
+        ts INTEGER NOT NULL
+    );""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS backfill_checkpoints(
+        wallet TEXT NOT NULL,
+        token TEXT NOT NULL,
+        last_day TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY(wallet, token)
+    );""")
+
+def _m6_transfers(cur):
+    # one row per tracked-wallet side of an ERC-20 Transfer; amount is signed (in > 0, out < 0)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS transfers(
+        wallet TEXT NOT NULL,
+        token TEXT NOT NULL,
+        block INTEGER NOT NULL,
+        log_index INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY(wallet, token, block, log_index)
+    ) WITHOUT ROWID;""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS transfer_checkpoints(
+        wallet TEXT NOT NULL,
+        token TEXT NOT NULL,
+        block INTEGER NOT NULL,
+        PRIMARY KEY(wallet, token)
+    );""")
+
+def _m7_registry(cur):
+    # Tracked tokens and the strategies built from them (see strategies.registry). Seeded with
+    # the tokens and toggles that used to be hard-coded; an address of NULL is the native coin.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS tokens(
+        key TEXT PRIMARY KEY,
+        symbol TEXT NOT NULL,
+        address TEXT,
+        chain_id INTEGER NOT NULL DEFAULT 1,
+        decimals INTEGER,
+        enabled INTEGER NOT NULL DEFAULT 1
+    );""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS strategies(
+        name TEXT PRIMARY KEY,
+        plugin TEXT NOT NULL,
+        label TEXT NOT NULL DEFAULT '',
+        params_json TEXT NOT NULL DEFAULT '{}',
+        setting_key TEXT,
+        interval_seconds INTEGER
+    );""")
+    cur.executemany("INSERT OR IGNORE INTO tokens(key, symbol, address, chain_id, decimals) VALUES(?,?,?,1,?)", [
+        ("ETH", "ETH", None, 18),
+        ("stETH", "stETH", "0xae7ab96520DE3A18E5e111B5EaAb095312D7fE84", 18),
+        ("rETH", "rETH", "0xae78736Cd615f374D3085123A210448E74Fc6393", 18),
+    ])
+    cur.executemany("INSERT OR IGNORE INTO strategies(name, plugin, label, params_json, setting_key) VALUES(?,?,?,?,?)", [
+        ("eth_delta", "token_delta", "ETH Balance Delta", '{"token": "ETH"}', "STRAT_ETH_DELTA"),
+        ("steth_delta", "token_delta", "stETH Yield Delta", '{"token": "stETH"}', "STRAT_STETH_DELTA"),
+        ("reth_delta", "token_delta", "rETH Yield Delta", '{"token": "rETH"}', "STRAT_RETH_DELTA"),
+    ])
+
+def _rebuild_table(cur, table: str, create: str, columns: str, select: str):
+    # SQLite can't change a primary key in place: copy into a new table and swap it in
+    cur.execute(create.replace(f" {table}(", f" {table}_new(", 1))
+    cur.execute(f"INSERT INTO {table}_new({columns}) SELECT {select} FROM {table}")
+    cur.execute(f"DROP TABLE {table}")
+    cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+def _m8_chains(cur):
+    # Everything read from a chain is keyed by its chain id; existing rows are mainnet (1).
+    # Token symbols repeat across chains (ETH on mainnet and on L2s), so they are in every key.
+    _add_column(cur, "balances", "chain_id", "INTEGER NOT NULL DEFAULT 1")
+    _add_column(cur, "earnings", "chain_id", "INTEGER NOT NULL DEFAULT 1")
+    cur.execute("DROP INDEX IF EXISTS ux_balances_wallet_day_token")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_balances_wallet_chain_day_token ON balances(wallet, chain_id, day, token)")
+    _rebuild_table(cur, "earnings_daily", """
+    CREATE TABLE earnings_daily(
+        day TEXT NOT NULL,
+        source TEXT NOT NULL,
+        wallet TEXT NOT NULL DEFAULT '',
+        chain_id INTEGER NOT NULL DEFAULT 1,
+        amount REAL NOT NULL DEFAULT 0.0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, source, wallet, chain_id)
+    );""", "day, source, wallet, chain_id, amount, count", "day, source, wallet, 1, amount, count")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_earnings_daily_wallet_day ON earnings_daily(wallet, day)")
+    _rebuild_table(cur, "earnings_totals", """
+    CREATE TABLE earnings_totals(
+        wallet TEXT NOT NULL,
+        chain_id INTEGER NOT NULL DEFAULT 1,
+        amount REAL NOT NULL DEFAULT 0.0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(wallet, chain_id)
+    );""", "wallet, chain_id, amount, count", "wallet, 1, amount, count")
+    _rebuild_table(cur, "transfers", """
+    CREATE TABLE transfers(
+        wallet TEXT NOT NULL,
+        chain_id INTEGER NOT NULL DEFAULT 1,
+        token TEXT NOT NULL,
+        block INTEGER NOT NULL,
+        log_index INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY(wallet, chain_id, token, block, log_index)
+    ) WITHOUT ROWID;""", "wallet, chain_id, token, block, log_index, amount", "wallet, 1, token, block, log_index, amount")
+    _rebuild_table(cur, "transfer_checkpoints", """
+    CREATE TABLE transfer_checkpoints(
+        wallet TEXT NOT NULL,
+        chain_id INTEGER NOT NULL DEFAULT 1,
+        token TEXT NOT NULL,
+        block INTEGER NOT NULL,
+        PRIMARY KEY(wallet, chain_id, token)
+    );""", "wallet, chain_id, token, block", "wallet, 1, token, block")
+    _rebuild_table(cur, "day_blocks", """
+    CREATE TABLE day_blocks(
+        chain_id INTEGER NOT NULL DEFAULT 1,
+        day TEXT NOT NULL,
+        block INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        PRIMARY KEY(chain_id, day)
+    );""", "chain_id, day, block, ts", "1, day, block, ts")
+
+def _m9_prices(cur):
+    # Daily USD prices per token symbol (see engine.prices). Earnings record the asset they are
+    # denominated in, so rollups can be valued with a join instead of per-row lookups.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS prices(
+        symbol TEXT NOT NULL,
+        day TEXT NOT NULL,
+        usd REAL NOT NULL,
+        block INTEGER,
+        source TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY(symbol, day)
+    ) WITHOUT ROWID;""")
+    # price_feed: Chainlink aggregator on mainnet; price_quote: the symbol its answer is quoted in
+    # (NULL = USD), e.g. rETH/ETH is multiplied by the ETH price
+    _add_column(cur, "tokens", "price_feed", "TEXT")
+    _add_column(cur, "tokens", "price_quote", "TEXT")
+    cur.executemany("UPDATE tokens SET price_feed=?, price_quote=? WHERE key=? AND chain_id=1 AND price_feed IS NULL", [
+        ("0x5f4eC3Df9cbd43714FE2740f5E3616155c5b8419", None, "ETH"),
+        ("0xCfE54B5cD566aB89272946F602D76Ea879CAb4a8", None, "stETH"),
+        ("0x536218f9E9Eb48863970252233c8F271f554C2d0", "ETH", "rETH"),
+    ])
+    _add_column(cur, "earnings", "asset", "TEXT NOT NULL DEFAULT ''")
+    _add_column(cur, "earnings_daily", "asset", "TEXT NOT NULL DEFAULT ''")
+    # yield rows so far were all "<symbol> yield"
+    for table in ("earnings", "earnings_daily"):
+        cur.execute(f"UPDATE {table} SET asset=substr(source, 1, length(source) - 6) WHERE source LIKE '% yield'")
+    # covers the all-wallet per-(asset, day) grouping that USD totals are valued from
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_earnings_daily_asset_day ON earnings_daily(asset, day, amount)")
+
+def _m10_worker(cur):
+    # engine.worker: a lease row per role (only its owner runs the scheduler; heartbeat and
+    # status ride on the renewals) and a queue of commands from the UI ("scan", "profile")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS workers(
+        role TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        heartbeat_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        status_json TEXT
+    );""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS worker_commands(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        command TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        taken_at REAL,
+        taken_by TEXT
+    );""")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_worker_commands_pending ON worker_commands(taken_at, id)")
+
+def _m11_retention(cur):
+    # engine.retention selects aged rows by date
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_balances_day ON balances(day)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_decisions_created_at ON decisions(created_at)")
+
+def _m12_decision_value(cur):
+    # decisions.estimated_value is USD; NULL for proposals whose asset has no price. Older rows
+    # mixed USD with token units and can't be told apart, so their values are dropped (shown as
+    # unpriced, never auto-approved). The AUTOINCREMENT counter is carried over, so ids of
+    # archived decisions (engine.retention) are never handed out again.
+    seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name='decisions'").fetchone()
+    _rebuild_table(cur, "decisions", """
+    CREATE TABLE decisions(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        strategy TEXT NOT NULL,
+        action TEXT NOT NULL,
+        payload_json TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        estimated_value REAL,
+        note TEXT
+    );""", "id, created_at, strategy, action, payload_json, status, estimated_value, note",
+       "id, created_at, strategy, action, payload_json, status, NULL, note")
+    if seq:
+        cur.execute("UPDATE sqlite_sequence SET seq=MAX(seq, ?) WHERE name='decisions'", (seq[0],))
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_decisions_status_id ON decisions(status, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_decisions_created_at ON decisions(created_at)")
+
+def _m13_price_chains(cur):
+    # Prices are per chain: the same ticker can be a different token on another chain. Until now
+    # every token with a symbol shared its price, so each chain's tokens start with a copy.
+    _rebuild_table(cur, "prices", """
+    CREATE TABLE prices(
+        chain_id INTEGER NOT NULL DEFAULT 1,
+        symbol TEXT NOT NULL,
+        day TEXT NOT NULL,
+        usd REAL NOT NULL,
+        block INTEGER,
+        source TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY(chain_id, symbol, day)
+    ) WITHOUT ROWID;""", "chain_id, symbol, day, usd, block, source, updated_at",
+       "1, symbol, day, usd, block, source, updated_at")
+    cur.execute("""
+        INSERT OR IGNORE INTO prices(chain_id, symbol, day, usd, block, source, updated_at)
+        SELECT t.chain_id, p.symbol, p.day, p.usd, p.block, p.source, p.updated_at
+        FROM prices p JOIN (SELECT DISTINCT chain_id, symbol FROM tokens WHERE chain_id != 1) t ON t.symbol = p.symbol""")
+    # USD valuation now groups earnings_daily per (chain_id, asset, day)
+    cur.execute("DROP INDEX IF EXISTS ix_earnings_daily_asset_day")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_earnings_daily_chain_asset_day ON earnings_daily(chain_id, asset, day, amount)")
+
+def _m14_token_meta_chains(cur):
+    # token_meta is keyed per chain like every other chain-read table; entries off mainnet used
+    # to be stored under "<chainid>:<address>"
+    split = "instr(address, ':')"
+    _rebuild_table(cur, "token_meta", """
+    CREATE TABLE token_meta(
+        chain_id INTEGER NOT NULL DEFAULT 1,
+        address TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        decimals INTEGER NOT NULL,
+        ok INTEGER NOT NULL DEFAULT 1,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY(chain_id, address)
+    );""", "chain_id, address, symbol, decimals, ok, updated_at",
+       f"""CASE WHEN {split} THEN CAST(substr(address, 1, {split} - 1) AS INTEGER) ELSE 1 END,
+           substr(address, {split} + 1), symbol, decimals, ok, updated_at""")
 
-def insert_earning(source: str, amount: float, note: str = ""):
+# Schema version N is reached by applying MIGRATIONS[N-1]; the version lives in PRAGMA user_version.
+MIGRATIONS = [_m1_wallets, _m2_block_pins, _m3_indexes, _m4_rollups, _m5_backfill, _m6_transfers, _m7_registry,
+              _m8_chains, _m9_prices, _m10_worker, _m11_retention, _m12_decision_value,
+              _m13_price_chains, _m14_token_meta_chains]
+
+@metrics.instrument_db
+def schema_version(con) -> int:
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+@metrics.instrument_db
+def migrate(con):
+    with unit_of_work():
+        version = schema_version(con)
+        for n, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            step(con)
+            con.execute(f"PRAGMA user_version={n}")
+
+@metrics.instrument_db
+def add_wallet(address: str, label: str = ""):
+    with unit_of_work() as con:
+        con.execute("""
+            INSERT INTO wallets(address, label, enabled, added_at) VALUES(?,?,1,?)
+            ON CONFLICT(address) DO UPDATE SET enabled=1, label=CASE WHEN excluded.label='' THEN label ELSE excluded.label END
+        """, (address.strip().lower(), label, datetime.utcnow().isoformat()))
+        _touch("wallets")
+
+@metrics.instrument_db
+def remove_wallet(address: str):
+    with unit_of_work() as con:
+        con.execute("DELETE FROM wallets WHERE address=?", (address.strip().lower(),))
+        _touch("wallets")
+
+@metrics.instrument_db
+def set_wallet_enabled(address: str, enabled: bool):
+    with unit_of_work() as con:
+        con.execute("UPDATE wallets SET enabled=? WHERE address=?", (int(enabled), address.strip().lower()))
+        _touch("wallets")
+
+@metrics.instrument_db
+def list_wallets(enabled_only: bool = True) -> list[str]:
     with _conn() as con:
-        con.execute("INSERT INTO earnings(ts, source, amount, note) VALUES(?,?,?,?)",
-                    (datetime.utcnow().isoformat(), source, amount, note))
-        con.commit()
+        sql = "SELECT address FROM wallets"
+        if enabled_only:
+            sql += " WHERE enabled=1"
+        return [r[0] for r in con.execute(sql + " ORDER BY added_at, address").fetchall()]
 
-def upsert_daily_balance(token: str, amount: float, day: str):
+@metrics.instrument_db
+def fetch_wallets():
     with _conn() as con:
-        row = con.execute("SELECT id FROM balances WHERE day=? AND token=?", (day, token)).fetchone()
-        if row:
-            con.execute("UPDATE balances SET amount=? WHERE id=?", (amount, row[0]))
-        else:
-            con.execute("INSERT INTO balances(day, token, amount) VALUES(?,?,?)", (day, token, amount))
-        con.commit()
+        return con.execute("SELECT address, label, enabled, added_at FROM wallets ORDER BY added_at, address").fetchall()
+
+TOKEN_COLUMNS = ["key", "symbol", "address", "chain_id", "decimals", "enabled", "price_feed", "price_quote"]
+
+@metrics.instrument_db
+def get_tokens(enabled_only: bool = False) -> dict[str, dict]:
+    with _conn() as con:
+        sql = f"SELECT {', '.join(TOKEN_COLUMNS)} FROM tokens" + (" WHERE enabled=1" if enabled_only else "")
+        return {r[0]: dict(zip(TOKEN_COLUMNS, r)) for r in con.execute(sql + " ORDER BY rowid").fetchall()}
+
+@metrics.instrument_db
+def get_token(key: str) -> dict | None:
+    with _conn() as con:
+        r = con.execute(f"SELECT {', '.join(TOKEN_COLUMNS)} FROM tokens WHERE key=?", (key,)).fetchone()
+    return dict(zip(TOKEN_COLUMNS, r)) if r else None
+
+@metrics.instrument_db
+def upsert_tokens(rows: list[dict], delta: bool = True):
+    # rows: {key, symbol?, address?, chain_id?, decimals?, enabled?, price_feed?, price_quote?}; with
+    # delta=True every token also gets a "<key>_delta" strategy (toggle STRAT_<KEY>_DELTA) unless
+    # one already exists. A row without price_feed keeps the feed already stored.
+    if not rows:
+        return
+    with unit_of_work() as con:
+        con.executemany("""
+            INSERT INTO tokens(key, symbol, address, chain_id, decimals, enabled, price_feed, price_quote)
+            VALUES(?,?,?,?,?,?,?,?)
+            ON CONFLICT(key) DO UPDATE SET symbol=excluded.symbol, address=excluded.address,
+                chain_id=excluded.chain_id, decimals=excluded.decimals, enabled=excluded.enabled,
+                price_feed=COALESCE(excluded.price_feed, price_feed),
+                price_quote=CASE WHEN excluded.price_feed IS NULL THEN price_quote ELSE excluded.price_quote END
+        """, [(r["key"], r.get("symbol") or r["key"], r.get("address") or None, int(r.get("chain_id") or 1),
+               r.get("decimals"), int(r.get("enabled", True)), r.get("price_feed") or None,
+               r.get("price_quote") or None) for r in rows])
+        if delta:
+            con.executemany("""
+                INSERT OR IGNORE INTO strategies(name, plugin, label, params_json, setting_key)
+                SELECT ?, 'token_delta', ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM strategies WHERE plugin='token_delta' AND json_extract(params_json, '$.token')=?)
+            """, [(f"{r['key'].lower()}_delta", f"{r.get('symbol') or r['key']} Balance Delta",
+                   json.dumps({"token": r["key"]}), f"STRAT_{r['key'].upper()}_DELTA", r["key"]) for r in rows])
+        _touch("tokens", "strategies")
+
+@metrics.instrument_db
+def set_token_enabled(key: str, enabled: bool):
+    with unit_of_work() as con:
+        con.execute("UPDATE tokens SET enabled=? WHERE key=?", (int(enabled), key))
+        _touch("tokens")
+
+@metrics.instrument_db
+def upsert_strategies(rows: list[dict]):
+    # rows: {name, plugin, label?, params?, setting_key?, interval_seconds?}
+    if not rows:
+        return
+    with unit_of_work() as con:
+        con.executemany("""
+            INSERT INTO strategies(name, plugin, label, params_json, setting_key, interval_seconds) VALUES(?,?,?,?,?,?)
+            ON CONFLICT(name) DO UPDATE SET plugin=excluded.plugin, label=excluded.label, params_json=excluded.params_json,
+                setting_key=excluded.setting_key, interval_seconds=excluded.interval_seconds
+        """, [(r["name"], r["plugin"], r.get("label") or r["name"], json.dumps(r.get("params") or {}),
+               r.get("setting_key"), r.get("interval_seconds")) for r in rows])
+        _touch("strategies")
+
+STRATEGY_COLUMNS = ["name", "plugin", "label", "params_json", "setting_key", "interval_seconds", "toggle", "enabled"]
+
+@metrics.instrument_db
+def list_strategies() -> list[dict]:
+    # every strategy with its resolved enablement (settings toggle, default on, and its token's
+    # enabled flag) and token row, in one query
+    with _conn() as con:
+        rows = con.execute(f"""
+            SELECT s.name, s.plugin, s.label, s.params_json, s.setting_key, s.interval_seconds,
+                   LOWER(COALESCE(st.value, 'true')) = 'true',
+                   LOWER(COALESCE(st.value, 'true')) = 'true' AND COALESCE(t.enabled, 1) = 1,
+                   {', '.join('t.' + c for c in TOKEN_COLUMNS)}
+            FROM strategies s
+            LEFT JOIN settings st ON st.key = s.setting_key
+            LEFT JOIN tokens t ON t.key = json_extract(s.params_json, '$.token')
+            ORDER BY s.rowid""").fetchall()
+    return [dict(zip(STRATEGY_COLUMNS, r[:8]), toggle=bool(r[6]), enabled=bool(r[7]),
+                 token=dict(zip(TOKEN_COLUMNS, r[8:])) if r[8] is not None else None) for r in rows]
+
+# earnings_daily (per day/source/wallet/chain) and earnings_totals (per wallet and chain, all
+# time) are kept in step with the raw earnings table inside the same transaction; the dashboard
+# only reads these, summing over chains unless it filters on one. Amounts are in token units
+# (`asset`); USD values come from joining earnings_daily with prices at read time.
+def _rollup_add(con, day: str, source: str, wallet: str, amount: float, count: int = 1, chain_id: int = 1,
+                asset: str = ""):
+    con.execute("""
+        INSERT INTO earnings_daily(day, source, wallet, chain_id, asset, amount, count) VALUES(?,?,?,?,?,?,?)
+        ON CONFLICT(day, source, wallet, chain_id) DO UPDATE SET amount=amount+excluded.amount, count=count+excluded.count
+    """, (day, source, wallet, chain_id, asset, amount, count))
+    con.execute("""
+        INSERT INTO earnings_totals(wallet, chain_id, amount, count) VALUES(?,?,?,?)
+        ON CONFLICT(wallet, chain_id) DO UPDATE SET amount=amount+excluded.amount, count=count+excluded.count
+    """, (wallet, chain_id, amount, count))
+
+# Raw earnings before this day have been compacted away by engine.retention; from then on the
+# earnings_daily rows before it are the only record, so rebuilds and checks leave them alone.
+COMPACTED_KEY = "RETENTION_EARNINGS_BEFORE"
+
+def _compacted_before(con) -> str:
+    row = con.execute("SELECT value FROM settings WHERE key=?", (COMPACTED_KEY,)).fetchone()
+    return row[0] if row and row[0] else ""
+
+def _rebuild_rollups(con):
+    before = _compacted_before(con)
+    con.execute("DELETE FROM earnings_daily WHERE day >= ?", (before,))
+    con.execute("DELETE FROM earnings_totals")
+    con.execute("""
+        INSERT INTO earnings_daily(day, source, wallet, chain_id, asset, amount, count)
+        SELECT substr(ts, 1, 10), source, wallet, chain_id, MAX(asset), SUM(amount), COUNT(*) FROM earnings
+        WHERE ts >= ? GROUP BY substr(ts, 1, 10), source, wallet, chain_id""", (before,))
+    con.execute("""
+        INSERT INTO earnings_totals(wallet, chain_id, amount, count)
+        SELECT wallet, chain_id, SUM(amount), SUM(count) FROM earnings_daily GROUP BY wallet, chain_id""")
+
+@metrics.instrument_db
+def rebuild_rollups():
+    with unit_of_work() as con:
+        _rebuild_rollups(con)
+        _touch("earnings")
+
+@metrics.instrument_db
+def check_rollups(tolerance: float = 1e-9) -> list:
+    # (day, source, wallet, chain_id, rollup amount, raw amount) for every earnings_daily row that
+    # drifted from the raw rows, then (None, None, wallet, None, ...) for every wallet whose totals
+    # drifted from them (plus the compacted daily rollups, which stand in for raw rows that no
+    # longer exist; before the compaction date the daily rows themselves aren't checked)
+    with _conn() as con:
+        before = _compacted_before(con)
+        daily = con.execute("""
+            SELECT day, source, wallet, chain_id, SUM(rolled), SUM(raw) FROM (
+                SELECT day, source, wallet, chain_id, amount rolled, 0 raw FROM earnings_daily WHERE day >= ?
+                UNION ALL SELECT substr(ts, 1, 10), source, wallet, chain_id, 0, amount FROM earnings WHERE ts >= ?)
+            GROUP BY day, source, wallet, chain_id HAVING ABS(SUM(rolled) - SUM(raw)) > ?
+            ORDER BY day, source, wallet, chain_id""", (before, before, tolerance)).fetchall()
+        totals = con.execute("""
+            SELECT NULL, NULL, w.wallet, NULL, COALESCE(t.amount, 0), COALESCE(r.amount, 0)
+            FROM (SELECT wallet FROM earnings_totals UNION SELECT DISTINCT wallet FROM earnings) w
+            LEFT JOIN (SELECT wallet, SUM(amount) amount FROM earnings_totals GROUP BY wallet) t ON t.wallet=w.wallet
+            LEFT JOIN (SELECT wallet, SUM(amount) amount FROM (
+                           SELECT wallet, amount FROM earnings WHERE ts >= ?
+                           UNION ALL SELECT wallet, amount FROM earnings_daily WHERE day < ?)
+                       GROUP BY wallet) r ON r.wallet=w.wallet
+            WHERE ABS(COALESCE(t.amount, 0) - COALESCE(r.amount, 0)) > ?""", (before, before, tolerance)).fetchall()
+    return daily + totals
+
+@metrics.instrument_db
+def insert_earning(source: str, amount: float, note: str = "", wallet: str = "", ts: str | None = None,
+                   chain_id: int = 1, asset: str = ""):
+    # asset: symbol the amount is denominated in ("" = not a priced token amount)
+    ts = ts or datetime.utcnow().isoformat()
+    with unit_of_work() as con:
+        con.execute("INSERT INTO earnings(ts, source, amount, note, wallet, chain_id, asset) VALUES(?,?,?,?,?,?,?)",
+                    (ts, source, amount, note, wallet, chain_id, asset))
+        _rollup_add(con, ts[:10], source, wallet, amount, chain_id=chain_id, asset=asset)
+        _touch("earnings")
+
+@metrics.instrument_db
+def insert_earnings(rows: list[tuple]):
+    # rows: (ts, source, amount, note, wallet, chain_id, asset)
+    if not rows:
+        return
+    with unit_of_work() as con:
+        con.executemany("INSERT INTO earnings(ts, source, amount, note, wallet, chain_id, asset) VALUES(?,?,?,?,?,?,?)", rows)
+        agg: dict = {}
+        for ts, source, amount, _, wallet, chain_id, asset in rows:
+            a = agg.setdefault((ts[:10], source, wallet, chain_id, asset), [0.0, 0])
+            a[0] += amount
+            a[1] += 1
+        for (day, source, wallet, chain_id, asset), (amount, count) in agg.items():
+            _rollup_add(con, day, source, wallet, amount, count, chain_id, asset)
+        _touch("earnings")
+
+@metrics.instrument_db
+def upsert_daily_balance(token: str, amount: float, day: str, wallet: str = "",
+                         block_number: int | None = None, block_ts: int | None = None, chain_id: int = 1):
+    with unit_of_work() as con:
+        con.execute("""
+            INSERT INTO balances(day, token, amount, wallet, block_number, block_ts, chain_id) VALUES(?,?,?,?,?,?,?)
+            ON CONFLICT(wallet, chain_id, day, token) DO UPDATE SET amount=excluded.amount,
+                block_number=excluded.block_number, block_ts=excluded.block_ts
+        """, (day, token, amount, wallet, block_number, block_ts, chain_id))
+        _touch("balances")
+
+@metrics.instrument_db
+def upsert_daily_balances(rows: list[tuple]):
+    # rows: (day, token, amount, wallet, block_number, block_ts, chain_id)
+    if not rows:
+        return
+    with unit_of_work() as con:
+        con.executemany("""
+            INSERT INTO balances(day, token, amount, wallet, block_number, block_ts, chain_id) VALUES(?,?,?,?,?,?,?)
+            ON CONFLICT(wallet, chain_id, day, token) DO UPDATE SET amount=excluded.amount,
+                block_number=excluded.block_number, block_ts=excluded.block_ts
+        """, rows)
+        _touch("balances")
 
-def get_prev_balance(token: str, day: str):
-    from datetime import datetime, timedelta
+@metrics.instrument_db
+def get_prev_balance(token: str, day: str, wallet: str = "", chain_id: int = 1):
     prev_day = (datetime.fromisoformat(day) - timedelta(days=1)).date().isoformat()
     with _conn() as con:
-        row = con.execute("SELECT amount FROM balances WHERE day=? AND token=?", (prev_day, token)).fetchone()
+        row = con.execute("SELECT amount FROM balances WHERE wallet=? AND chain_id=? AND day=? AND token=?",
+                          (wallet, chain_id, prev_day, token)).fetchone()
         return row[0] if row else None
 
-def insert_decision(strategy: str, action: str, payload: dict, estimated_value: float, note: str = ""):
+@metrics.instrument_db
+def get_prev_balance_row(token: str, day: str, wallet: str = "", chain_id: int = 1):
+    # (amount, block_number) of the previous day's balance, or None
+    prev_day = (datetime.fromisoformat(day) - timedelta(days=1)).date().isoformat()
     with _conn() as con:
-        con.execute("""
+        return con.execute("SELECT amount, block_number FROM balances WHERE wallet=? AND chain_id=? AND day=? AND token=?",
+                           (wallet, chain_id, prev_day, token)).fetchone()
+
+@metrics.instrument_db
+def get_balance_rows(wallet: str, since: str, until: str, chain_id: int = 1) -> dict:
+    # {(day, token): (amount, block_number)} for days since..until inclusive
+    with _conn() as con:
+        rows = con.execute("SELECT day, token, amount, block_number FROM balances "
+                           "WHERE wallet=? AND chain_id=? AND day >= ? AND day <= ?",
+                           (wallet, chain_id, since, until)).fetchall()
+    return {(d, t): (a, b) for d, t, a, b in rows}
+
+@metrics.instrument_db
+def get_first_balance_block(wallet: str, chain_id: int = 1) -> int | None:
+    with _conn() as con:
+        return con.execute("SELECT MIN(block_number) FROM balances WHERE wallet=? AND chain_id=?",
+                           (wallet, chain_id)).fetchone()[0]
+
+@metrics.instrument_db
+def insert_transfers(rows: list[tuple], chain_id: int = 1):
+    # rows: (wallet, token, block, log_index, amount)
+    if not rows:
+        return
+    with unit_of_work() as con:
+        con.executemany("INSERT OR IGNORE INTO transfers(wallet, chain_id, token, block, log_index, amount) VALUES(?,?,?,?,?,?)",
+                        [(w, chain_id, t, b, i, a) for w, t, b, i, a in rows])
+        _touch("transfers")
+
+@metrics.instrument_db
+def net_transfers(wallet: str, token: str, after_block: int, to_block: int, chain_id: int = 1) -> float:
+    # net amount moved into the wallet in blocks (after_block, to_block]
+    with _conn() as con:
+        return con.execute("""
+            SELECT COALESCE(SUM(amount), 0) FROM transfers
+            WHERE wallet=? AND chain_id=? AND token=? AND block > ? AND block <= ?""",
+            (wallet, chain_id, token.lower(), after_block, to_block)).fetchone()[0]
+
+@metrics.instrument_db
+def get_transfer_checkpoints(token: str, wallets: list[str], chain_id: int = 1) -> dict:
+    # primary-key lookups for just these wallets (the scanner asks for one wallet at a time)
+    out = {}
+    with _conn() as con:
+        for i in range(0, len(wallets), 500):
+            chunk = wallets[i:i + 500]
+            out.update(con.execute(
+                f"SELECT wallet, block FROM transfer_checkpoints WHERE chain_id=? AND token=? "
+                f"AND wallet IN ({','.join('?' * len(chunk))})",
+                [chain_id, token.lower()] + chunk).fetchall())
+    return out
+
+@metrics.instrument_db
+def set_transfer_checkpoints(token: str, wallets: list[str], block: int, chain_id: int = 1):
+    with unit_of_work() as con:
+        con.executemany("""
+            INSERT INTO transfer_checkpoints(wallet, chain_id, token, block) VALUES(?,?,?,?)
+            ON CONFLICT(wallet, chain_id, token) DO UPDATE SET block=excluded.block
+        """, [(w, chain_id, token.lower(), block) for w in wallets])
+
+@metrics.instrument_db
+def insert_decision(strategy: str, action: str, payload: dict, estimated_value: float | None, note: str = "") -> int:
+    # estimated_value in USD, None when it can't be priced
+    with unit_of_work() as con:
+        cur = con.execute("""
             INSERT INTO decisions(created_at, strategy, action, payload_json, status, estimated_value, note)
             VALUES(?,?,?,?, 'pending', ?, ?)
         """, (datetime.utcnow().isoformat(), strategy, action, json.dumps(payload), estimated_value, note))
-        con.commit()
+        _touch("decisions")
+        return cur.lastrowid
 
-def fetch_decisions(status: str | None = None):
+@metrics.instrument_db
+def fetch_decisions(status: str | None = None, before_id: int | None = None, limit: int | None = None):
+    # newest first; a page is `limit` rows, the next one starts before its last id (keyset on
+    # ix_decisions_status_id, so deep pages cost the same as the first)
     with _conn() as con:
         sql = "SELECT id, created_at, strategy, action, payload_json, status, estimated_value, note FROM decisions"
-        args = []
+        conds, args = [], []
         if status:
-            sql += " WHERE status=?"
+            conds.append("status=?")
             args.append(status)
+        if before_id is not None:
+            conds.append("id<?")
+            args.append(before_id)
+        if conds:
+            sql += " WHERE " + " AND ".join(conds)
         sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
         rows = con.execute(sql, args).fetchall()
         return rows
 
-def update_decision_status(decision_id: int, status: str):
+@metrics.instrument_db
+def set_decisions_status(ids: list[int], status: str, max_value: float | None = None) -> list[tuple]:
+    # Moves the still-pending decisions among `ids` to `status` (with max_value: only those valued
+    # 0..max_value) and returns their (id, strategy, payload_json). One transaction; the ids go
+    # in chunks of 500 to stay under SQLite's parameter limit.
+    out = []
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    with unit_of_work() as con:
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            sql = f"SELECT id, strategy, payload_json FROM decisions WHERE status='pending' AND id IN ({','.join('?' * len(chunk))})"
+            args = list(chunk)
+            if max_value is not None:
+                sql += " AND estimated_value BETWEEN 0 AND ?"
+                args.append(max_value)
+            rows = con.execute(sql, args).fetchall()
+            if rows:
+                con.execute(f"UPDATE decisions SET status=? WHERE id IN ({','.join('?' * len(rows))})",
+                            [status] + [r[0] for r in rows])
+                out += rows
+        if out:
+            _touch("decisions")
+    return out
+
+@metrics.instrument_db
+def acquire_lease(role: str, owner: str, ttl: float, status: dict | None = None) -> bool:
+    # Takes or renews the role's lease for ttl seconds. Succeeds when the row is free, expired
+    # or already ours; the heartbeat (and status, if given) are written in the same statement.
+    now = time.time()
+    with unit_of_work() as con:
+        cur = con.execute("""
+            INSERT INTO workers(role, owner, started_at, heartbeat_at, expires_at, status_json) VALUES(?,?,?,?,?,?)
+            ON CONFLICT(role) DO UPDATE SET
+                started_at=CASE WHEN owner=excluded.owner THEN started_at ELSE excluded.started_at END,
+                owner=excluded.owner, heartbeat_at=excluded.heartbeat_at, expires_at=excluded.expires_at,
+                status_json=COALESCE(excluded.status_json, status_json)
+            WHERE owner=excluded.owner OR expires_at < excluded.heartbeat_at
+        """, (role, owner, now, now, now + ttl, None if status is None else json.dumps(status)))
+        return cur.rowcount == 1
+
+@metrics.instrument_db
+def check_lease(role: str, owner: str):
+    # Write fence: raises unless owner still holds an unexpired lease. Call it inside the
+    # unit_of_work to protect; its write lock keeps a standby from taking the lease over before
+    # the transaction commits.
+    with unit_of_work() as con:
+        row = con.execute("SELECT 1 FROM workers WHERE role=? AND owner=? AND expires_at > ?",
+                          (role, owner, time.time())).fetchone()
+    if row is None:
+        raise RuntimeError(f"{owner} no longer holds the {role} lease")
+
+@metrics.instrument_db
+def release_lease(role: str, owner: str):
+    with unit_of_work() as con:
+        con.execute("UPDATE workers SET expires_at=0 WHERE role=? AND owner=?", (role, owner))
+
+@metrics.instrument_db
+def get_worker(role: str) -> dict | None:
+    # {owner, started_at, heartbeat_at, expires_at, alive, status} of the role's last leader
+    with _conn() as con:
+        row = con.execute("SELECT owner, started_at, heartbeat_at, expires_at, status_json FROM workers WHERE role=?",
+                          (role,)).fetchone()
+    if row is None:
+        return None
+    return {"owner": row[0], "started_at": row[1], "heartbeat_at": row[2], "expires_at": row[3],
+            "alive": row[3] >= time.time(), "status": json.loads(row[4] or "{}")}
+
+@metrics.instrument_db
+def enqueue_command(command: str) -> int:
+    with unit_of_work() as con:
+        return con.execute("INSERT INTO worker_commands(command, created_at) VALUES(?,?)",
+                           (command, time.time())).lastrowid
+
+@metrics.instrument_db
+def take_commands(owner: str, max_age: float = 300.0) -> list[str]:
+    # claims every queued command; ones older than max_age (queued while no worker ran) are
+    # dropped rather than replayed
+    now = time.time()
     with _conn() as con:
-        con.execute("UPDATE decisions SET status=? WHERE id=?", (status, decision_id))
-        con.commit()
+        if con.execute("SELECT 1 FROM worker_commands WHERE taken_at IS NULL LIMIT 1").fetchone() is None:
+            return []
+    with unit_of_work() as con:
+        rows = con.execute("SELECT id, command, created_at FROM worker_commands WHERE taken_at IS NULL ORDER BY id").fetchall()
+        con.execute("UPDATE worker_commands SET taken_at=?, taken_by=? WHERE taken_at IS NULL AND id <= ?",
+                    (now, owner, rows[-1][0] if rows else 0))
+        con.execute("DELETE FROM worker_commands WHERE taken_at < ?", (now - 86400,))
+    return [c for _, c, created in rows if now - created <= max_age]
 
+@metrics.instrument_db
 def get_setting(key: str, default: str = "") -> str:
     with _conn() as con:
         row = con.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
@@ -97,36 +931,331 @@ def get_setting(key: str, default: str = "") -> str:
             return row[0]
         return default
 
-def set_setting(key: str, value: str):
+@metrics.instrument_db
+def get_settings(keys: list[str] | None = None) -> dict:
     with _conn() as con:
+        if keys is None:
+            rows = con.execute("SELECT key, value FROM settings").fetchall()
+        else:
+            marks = ",".join("?" * len(keys))
+            rows = con.execute(f"SELECT key, value FROM settings WHERE key IN ({marks})", list(keys)).fetchall()
+    return {k: v for k, v in rows if v is not None}
+
+@metrics.instrument_db
+def set_setting(key: str, value: str):
+    with unit_of_work() as con:
         con.execute("INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
                     (key, value))
-        con.commit()
+        _touch("settings")
 
-def get_totals():
-    from_date = datetime.utcnow() - timedelta(days=7)
+@metrics.instrument_db
+def load_token_meta():
     with _conn() as con:
-        all_time = (con.execute("SELECT COALESCE(SUM(amount),0) FROM earnings").fetchone()[0]) or 0.0
-        last_7 = (con.execute("SELECT COALESCE(SUM(amount),0) FROM earnings WHERE ts >= ?", (from_date.isoformat(),)).fetchone()[0]) or 0.0
-        pending = con.execute("SELECT COUNT(*) FROM decisions WHERE status='pending'").fetchone()[0]
-    return {"all_time": all_time, "last_7": last_7, "pending": pending}
+        return con.execute("SELECT chain_id, address, symbol, decimals, ok, updated_at FROM token_meta").fetchall()
 
-def get_earnings_df(days: int = 30):
-    import pandas as pd
-    since = datetime.utcnow() - timedelta(days=days)
+@metrics.instrument_db
+def upsert_token_meta(address: str, symbol: str, decimals: int, ok: bool = True, chain_id: int = 1):
+    with unit_of_work() as con:
+        con.execute("""
+            INSERT INTO token_meta(chain_id, address, symbol, decimals, ok, updated_at) VALUES(?,?,?,?,?,?)
+            ON CONFLICT(chain_id, address) DO UPDATE SET symbol=excluded.symbol, decimals=excluded.decimals,
+                ok=excluded.ok, updated_at=excluded.updated_at
+        """, (chain_id, address.lower(), symbol, int(decimals), int(ok), datetime.utcnow().isoformat()))
+
+@metrics.instrument_db
+def get_day_block_index(chain_id: int = 1) -> list:
+    with _conn() as con:
+        return con.execute("SELECT day, block, ts FROM day_blocks WHERE chain_id=? ORDER BY day", (chain_id,)).fetchall()
+
+@metrics.instrument_db
+def put_day_blocks(rows: list[tuple], chain_id: int = 1):
+    # rows: (day, block, ts)
+    with unit_of_work() as con:
+        con.executemany("INSERT OR REPLACE INTO day_blocks(chain_id, day, block, ts) VALUES(?,?,?,?)",
+                        [(chain_id, d, b, t) for d, b, t in rows])
+
+@metrics.instrument_db
+def get_backfill_checkpoint(wallet: str, token: str) -> str | None:
+    with _conn() as con:
+        row = con.execute("SELECT last_day FROM backfill_checkpoints WHERE wallet=? AND token=?", (wallet, token)).fetchone()
+        return row[0] if row else None
+
+@metrics.instrument_db
+def set_backfill_checkpoint(wallet: str, token: str, last_day: str):
+    with unit_of_work() as con:
+        con.execute("""
+            INSERT INTO backfill_checkpoints(wallet, token, last_day, updated_at) VALUES(?,?,?,?)
+            ON CONFLICT(wallet, token) DO UPDATE SET last_day=excluded.last_day, updated_at=excluded.updated_at
+        """, (wallet, token, last_day, datetime.utcnow().isoformat()))
+
+def _wallet_chain_filter(wallet: str | None, chain_id: int | None) -> tuple[list[str], list]:
+    conds, args = [], []
+    if wallet:
+        conds.append("wallet=?")
+        args.append(wallet)
+    if chain_id:
+        conds.append("chain_id=?")
+        args.append(chain_id)
+    return conds, args
+
+# USD value of an asset on a chain and day: the latest cached price at or before that day (a
+# primary-key seek per row; rows are aggregated per chain/asset/day before it is applied)
+_PRICE_AT = """(SELECT usd FROM prices p WHERE p.chain_id = g.chain_id AND p.symbol = g.asset AND p.day <= g.day
+               ORDER BY p.day DESC LIMIT 1)"""
+
+@metrics.instrument_db
+def get_totals(wallet: str | None = None, chain_id: int | None = None):
+    # last_7 covers the current UTC day plus the six before it (rollups are day-granular);
+    # without chain_id the totals are summed across chains. all_time/last_7 are token units
+    # summed as-is; the *_usd values price each asset per day, and unpriced counts asset-days
+    # with earnings but no price yet.
+    from_day = (datetime.utcnow() - timedelta(days=6)).date().isoformat()
+    conds, args = _wallet_chain_filter(wallet, chain_id)
+    where = "WHERE " + " AND ".join(conds) if conds else ""
     with _conn() as con:
-        rows = con.execute("SELECT ts, source, amount, note FROM earnings WHERE ts >= ? ORDER BY ts ASC",
-                           (since.isoformat(),)).fetchall()
+        all_time = (con.execute(f"SELECT COALESCE(SUM(amount),0) FROM earnings_totals {where}", args).fetchone()[0]) or 0.0
+        last_7 = (con.execute(f"SELECT COALESCE(SUM(amount),0) FROM earnings_daily {where or 'WHERE 1=1'} AND day >= ?",
+                              args + [from_day]).fetchone()[0]) or 0.0
+        usd, usd_7, unpriced = con.execute(f"""
+            SELECT COALESCE(SUM(g.amount * g.usd), 0.0), COALESCE(SUM(CASE WHEN g.day >= ? THEN g.amount * g.usd END), 0.0),
+                   SUM(g.usd IS NULL AND g.asset != '')
+            FROM (SELECT g.day, g.asset, g.amount, {_PRICE_AT} usd FROM
+                  (SELECT day, chain_id, asset, SUM(amount) amount FROM earnings_daily {where}
+                   GROUP BY chain_id, asset, day) g) g""",
+            [from_day] + args).fetchone()
+        pending = con.execute("SELECT COUNT(*) FROM decisions WHERE status='pending'").fetchone()[0]
+    return {"all_time": all_time, "last_7": last_7, "all_time_usd": usd, "last_7_usd": usd_7,
+            "unpriced": unpriced or 0, "pending": pending}
+
+@metrics.instrument_db
+def upsert_prices(rows: list[tuple]):
+    # rows: (chain_id, symbol, day, usd, block, source)
     if not rows:
-        return pd.DataFrame(columns=["ts","source","amount","note"])
-    df = pd.DataFrame(rows, columns=["ts","source","amount","note"])
-    df["ts"] = pd.to_datetime(df["ts"])
-    return df
+        return
+    now = datetime.utcnow().isoformat()
+    with unit_of_work() as con:
+        con.executemany("""
+            INSERT INTO prices(chain_id, symbol, day, usd, block, source, updated_at) VALUES(?,?,?,?,?,?,?)
+            ON CONFLICT(chain_id, symbol, day) DO UPDATE SET usd=excluded.usd, block=excluded.block,
+                source=excluded.source, updated_at=excluded.updated_at
+        """, [r + (now,) for r in rows])
+        _touch("prices")
+
+@metrics.instrument_db
+def get_prices(keys: list[tuple[int, str]], day: str) -> dict:
+    # {(chain_id, symbol): (usd, updated_at)} cached for exactly this day
+    if not keys:
+        return {}
+    with _conn() as con:
+        rows = con.execute(f"""SELECT chain_id, symbol, usd, updated_at FROM prices
+                               WHERE day=? AND (chain_id, symbol) IN (VALUES {','.join(['(?,?)'] * len(keys))})""",
+                           [day] + [v for k in keys for v in k]).fetchall()
+    return {(c, s): (usd, at) for c, s, usd, at in rows}
+
+@metrics.instrument_db
+def get_price(symbol: str, day: str | None = None, chain_id: int = 1) -> float | None:
+    # latest cached USD price at or before `day` (default: today)
+    day = day or datetime.utcnow().date().isoformat()
+    with _conn() as con:
+        row = con.execute("SELECT usd FROM prices WHERE chain_id=? AND symbol=? AND day<=? ORDER BY day DESC LIMIT 1",
+                          (chain_id, symbol, day)).fetchone()
+    return row[0] if row else None
+
+@metrics.instrument_db
+def get_unpriced_days(since: str | None = None) -> list[tuple]:
+    # (chain_id, asset, day) with earnings but no cached price for that exact day
+    with _conn() as con:
+        return con.execute("""
+            SELECT DISTINCT e.chain_id, e.asset, e.day FROM earnings_daily e
+            LEFT JOIN prices p ON p.chain_id = e.chain_id AND p.symbol = e.asset AND p.day = e.day
+            WHERE e.asset != '' AND p.usd IS NULL AND e.day >= ? ORDER BY e.day""", (since or "",)).fetchall()
+
+# Chunked, keyset-paginated readers for exports. Each chunk is a separate short query that
+# resumes after the last key of the previous one, so memory stays at one chunk and no read
+# snapshot is held open between chunks.
+EARNINGS_COLUMNS = ["id", "ts", "source", "amount", "note", "wallet", "chain_id", "asset"]
+DECISIONS_COLUMNS = ["id", "created_at", "strategy", "action", "payload_json", "status", "estimated_value", "note"]
+EXPORT_CHUNK = 50_000
+
+@metrics.instrument_db
+def iter_earnings(since: str | None = None, until: str | None = None, wallet: str | None = None,
+                  source: str | None = None, chain_id: int | None = None, chunk_size: int = EXPORT_CHUNK,
+                  archive: str | None = None):
+    # yields lists of EARNINGS_COLUMNS tuples in (ts, id) order; since inclusive, until exclusive.
+    # archive: an engine.retention SQLite archive merged in, so compacted history is exported too
+    # (UNION drops rows that were archived but not yet deleted)
+    where, args = [], []
+    for cond, val in (("ts >= ?", since), ("ts < ?", until), ("wallet = ?", wallet), ("source = ?", source),
+                      ("chain_id = ?", chain_id)):
+        if val:
+            where.append(cond)
+            args.append(val)
+    tables = ["main.earnings"] + (["arc.earnings"] if archive else [])
+    con = None
+    if archive:
+        con = sqlite3.connect(DB_PATH, timeout=30)
+        con.execute("ATTACH DATABASE ? AS arc", (archive,))
+    try:
+        last = None
+        while True:
+            conds = where + (["(ts, id) > (?, ?)"] if last else [])
+            sides = [f"SELECT * FROM (SELECT {', '.join(EARNINGS_COLUMNS)} FROM {t}"
+                     + (" WHERE " + " AND ".join(conds) if conds else "") + " ORDER BY ts, id LIMIT ?)"
+                     for t in tables]
+            sql = " UNION ".join(sides) + " ORDER BY ts, id LIMIT ?"
+            params = (args + list(last or ()) + [chunk_size]) * len(tables) + [chunk_size]
+            if con is not None:
+                rows = con.execute(sql, params).fetchall()
+            else:
+                with _conn() as c:
+                    rows = c.execute(sql, params).fetchall()
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            last = (rows[-1][1], rows[-1][0])
+    finally:
+        if con is not None:
+            con.close()
 
-def get_decisions_df(status: str | None = None):
+@metrics.instrument_db
+def iter_decisions(status: str | None = None, chunk_size: int = EXPORT_CHUNK):
+    # yields lists of DECISIONS_COLUMNS tuples in id order
+    last = 0
+    while True:
+        sql = f"SELECT {', '.join(DECISIONS_COLUMNS)} FROM decisions WHERE id > ?"
+        args = [last]
+        if status:
+            sql += " AND status = ?"
+            args.append(status)
+        with _conn() as con:
+            rows = con.execute(sql + " ORDER BY id LIMIT ?", args + [chunk_size]).fetchall()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+# Retention (engine.retention): rows past a table's retention window, one calendar month at a
+# time. `before` is the first day kept in full (a month start). Decisions only age once they are
+# no longer pending; balances keep the last row of each period (weekly/monthly) per
+# wallet/chain/token, so only the rows in between age.
+BALANCE_COLUMNS = ["id", "day", "token", "amount", "wallet", "block_number", "block_ts", "chain_id"]
+RETENTION_TABLES = {"earnings": (EARNINGS_COLUMNS, "ts"), "balances": (BALANCE_COLUMNS, "day"),
+                    "decisions": (DECISIONS_COLUMNS, "created_at")}
+# weeks are keyed by their Monday, so one spanning New Year stays a single week
+_PERIODS = {"weekly": "date(day, 'weekday 0', '-6 days')", "monthly": "substr(day, 1, 7)"}
+
+def _aged_filter(table: str, month: str, before: str, period: str) -> tuple[str, list]:
+    col = RETENTION_TABLES[table][1]
+    start = date.fromisoformat(month + "-01")
+    end = min((start + timedelta(days=32)).replace(day=1).isoformat(), before)
+    where, args = f"{col} >= ? AND {col} < ?", [start.isoformat(), end]
+    if table == "decisions":
+        where += " AND status != 'pending'"
+    elif table == "balances":
+        # weeks reach up to 6 days past either end of the month
+        where += f""" AND id NOT IN (SELECT id FROM (SELECT id, MAX(day) FROM balances WHERE day >= ? AND day < ?
+                      GROUP BY wallet, chain_id, token, {_PERIODS[period]}))"""
+        args += [(start - timedelta(days=6)).isoformat(), min((date.fromisoformat(end) + timedelta(days=6)).isoformat(), before)]
+    return where, args
+
+@metrics.instrument_db
+def aged_months(table: str, before: str) -> list[str]:
+    col = RETENTION_TABLES[table][1]
+    extra = " AND status != 'pending'" if table == "decisions" else ""
+    with _conn() as con:
+        return [r[0] for r in con.execute(
+            f"SELECT DISTINCT substr({col}, 1, 7) FROM {table} WHERE {col} < ?{extra} ORDER BY 1", (before,)).fetchall()]
+
+@metrics.instrument_db
+def iter_aged(table: str, month: str, before: str, period: str = "weekly", chunk_size: int = EXPORT_CHUNK):
+    # yields lists of RETENTION_TABLES[table] column tuples in id order
+    cols = RETENTION_TABLES[table][0]
+    where, args = _aged_filter(table, month, before, period)
+    last = 0
+    while True:
+        with _conn() as con:
+            rows = con.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE {where} AND id > ? ORDER BY id LIMIT ?",
+                               args + [last, chunk_size]).fetchall()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+@metrics.instrument_db
+def delete_aged(table: str, month: str, before: str, period: str = "weekly", max_id: int | None = None,
+                chunk_size: int = 5000, pause: float = 0.01, fence=None) -> int:
+    # Deletes in short transactions of chunk_size rows, pausing in between so scheduler writes
+    # get the write lock; max_id keeps rows added after the archive was read. fence (see
+    # check_lease) runs in every transaction.
+    where, args = _aged_filter(table, month, before, period)
+    if max_id is not None:
+        where += " AND id <= ?"
+        args.append(max_id)
+    n = 0
+    while True:
+        with unit_of_work() as con:
+            if fence is not None:
+                fence()
+            deleted = con.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {where} LIMIT ?)",
+                                  args + [chunk_size]).rowcount
+            _touch(table)
+        n += deleted
+        if deleted < chunk_size:
+            return n
+        time.sleep(pause)
+
+@metrics.instrument_db
+def db_stats() -> dict:
+    with _conn() as con:
+        pragma = lambda name: con.execute(f"PRAGMA {name}").fetchone()[0]
+        out = {name: pragma(name) for name in ("page_size", "page_count", "freelist_count", "auto_vacuum")}
+        out["rows"] = {t: con.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                       for t in ("earnings", "earnings_daily", "balances", "decisions", "transfers")}
+        out["compacted_before"] = _compacted_before(con)
+    out["bytes"] = out["page_size"] * out["page_count"]
+    return out
+
+@metrics.instrument_db
+def incremental_vacuum(pages: int) -> int:
+    # returns the number of free pages released (0 unless auto_vacuum is INCREMENTAL). The
+    # pragma only runs to completion through executescript, which needs its own transaction.
+    with _WRITE_LOCK, _conn() as con:
+        free = con.execute("PRAGMA freelist_count").fetchone()[0]
+        con.executescript(f"BEGIN IMMEDIATE; PRAGMA incremental_vacuum({int(pages)}); COMMIT;")
+        return free - con.execute("PRAGMA freelist_count").fetchone()[0]
+
+@metrics.instrument_db
+def optimize():
+    # bounded ANALYZE of the tables whose statistics are stale, then shrink the WAL file
+    with _conn() as con:
+        con.execute("PRAGMA analysis_limit=1000")
+        con.execute("PRAGMA optimize")
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+@metrics.instrument_db
+def full_vacuum():
+    # rewrites the whole file and switches it to incremental auto-vacuum; blocks every writer
+    # for the duration, so run it with the worker stopped
+    with _WRITE_LOCK, _conn() as con:
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.execute("VACUUM")
+
+@metrics.instrument_db
+def get_earnings_daily_df(days: int = 30, wallet: str | None = None, chain_id: int | None = None):
+    # usd is NaN where the asset has no price yet
     import pandas as pd
-    rows = fetch_decisions(status)
-    if not rows:
-        return pd.DataFrame(columns=["id","created_at","strategy","action","payload_json","status","estimated_value","note"])
-    df = pd.DataFrame(rows, columns=["id","created_at","strategy","action","payload_json","status","estimated_value","note"])
+    since = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+    conds, args = _wallet_chain_filter(wallet, chain_id)
+    with _conn() as con:
+        rows = con.execute(f"""
+            SELECT g.day, g.source, SUM(g.amount), SUM(g.count), SUM(g.amount * {_PRICE_AT})
+            FROM (SELECT day, source, chain_id, asset, SUM(amount) amount, SUM(count) count FROM earnings_daily
+                  WHERE day >= ?{''.join(' AND ' + c for c in conds)} GROUP BY day, source, chain_id, asset) g
+            GROUP BY g.day, g.source ORDER BY g.day ASC""", [since] + args).fetchall()
+    df = pd.DataFrame(rows, columns=["date","source","amount","count","usd"])
+    df["usd"] = df["usd"].astype(float)
+    df["date"] = pd.to_datetime(df["date"]).dt.date
     return df
@@ -0,0 +1,158 @@
+from __future__ import annotations
+import argparse, logging, os
+
+from connectors.eth_readonly import (RpcBatch, RpcError, current_chain, get_block, token_meta_cache, get_erc20_balance,
+                                     use_chain, _hex_to_int, _is_rate_limited)
+from engine.state import (ensure_db, unit_of_work, get_first_balance_block, get_transfer_checkpoints,
+                          set_transfer_checkpoints, insert_transfers, list_wallets, get_tokens)
+
+log = logging.getLogger(__name__)
+
+# Incremental ERC-20 Transfer indexer for tracked wallets. Each token/wallet pair has a
+# high-water mark in transfer_checkpoints; a sync scans only the blocks after it with
+# eth_getLogs, shrinking the block range whenever the provider refuses a query as too large
+# and growing it again after successes. A wallet seen for the first time starts at its
+# earliest stored balance (that's as far back as deltas need correcting). Tokens are indexed on
+# the chain selected with use_chain() unless a chain_id is given.
+
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+LOGS_MIN_RANGE = 1
+LOGS_START_RANGE = int(os.getenv("LOGS_START_RANGE", "2000"))
+LOGS_MAX_RANGE = int(os.getenv("LOGS_MAX_RANGE", "100000"))
+WALLETS_PER_QUERY = 100
+
+# result-size and block-range caps, which a smaller window gets under; anything else (bad
+# params, timeouts, throttling) is raised as is rather than shrinking the window to one block
+_TOO_MANY = ("too many results", "too many logs", "more than", "response size", "range too large",
+             "range is too large", "range is too wide", "exceed maximum block range", "block range limit")
+
+def _too_many_results(e: Exception) -> bool:
+    err = getattr(e, "error", None)
+    if not isinstance(err, dict) or _is_rate_limited({"error": err}):
+        return False
+    msg = str(err.get("message", "")).lower()
+    return err.get("code") == -32005 or any(k in msg for k in _TOO_MANY)
+
+def _topic(addr: str) -> str:
+    return "0x" + "0" * 24 + addr[2:].lower()
+
+def _fetch_logs(token: str, wallets: list[str], from_block: int, to_block: int) -> list[dict]:
+    # incoming and outgoing transfers for all wallets, as one batched request
+    topics = [_topic(w) for w in wallets]
+    base = {"address": token, "fromBlock": hex(from_block), "toBlock": hex(to_block)}
+    with RpcBatch() as batch:
+        outgoing = batch.add("eth_getLogs", [dict(base, topics=[TRANSFER_TOPIC, topics])])
+        incoming = batch.add("eth_getLogs", [dict(base, topics=[TRANSFER_TOPIC, None, topics])])
+    return (outgoing() or []) + (incoming() or [])
+
+def _to_rows(token: str, logs: list[dict], wallets: set[str], decimals: int) -> list[tuple]:
+    rows = {}
+    for lg in logs:
+        t = lg.get("topics") or []
+        if len(t) < 3 or lg.get("removed"):
+            continue
+        src, dst = "0x" + t[1][-40:], "0x" + t[2][-40:]
+        amount = _hex_to_int(lg.get("data") or "0x0") / (10 ** decimals)
+        block, idx = _hex_to_int(lg["blockNumber"]), _hex_to_int(lg["logIndex"])
+        # keyed per wallet side so a log returned by both queries is counted once
+        if src in wallets:
+            rows[(src, block, idx, "out")] = (src, token.lower(), block, idx, -amount)
+        if dst in wallets:
+            key = (dst, block, idx, "in")
+            prev = rows.pop((dst, block, idx, "out"), None)
+            # self-transfer: net zero, stored as one row
+            rows[key] = (dst, token.lower(), block, idx, amount + (prev[4] if prev else 0.0))
+    return list(rows.values())
+
+def _scan(token: str, wallets: list[str], from_block: int, to_block: int, decimals: int, chain_id: int,
+          checkpoint: bool = True) -> int:
+    step, start, found = LOGS_START_RANGE, from_block, 0
+    tracked = set(wallets)
+    while start <= to_block:
+        end = min(to_block, start + step - 1)
+        try:
+            logs = _fetch_logs(token, wallets, start, end)
+        except RpcError as e:
+            if not _too_many_results(e) or step <= LOGS_MIN_RANGE:
+                raise
+            step = max(LOGS_MIN_RANGE, step // 2)
+            continue
+        rows = _to_rows(token, logs, tracked, decimals)
+        with unit_of_work():
+            insert_transfers(rows, chain_id)
+            if checkpoint:
+                set_transfer_checkpoints(token, wallets, end, chain_id)
+        found += len(rows)
+        start = end + 1
+        step = min(LOGS_MAX_RANGE, step * 2)
+    return found
+
+def _meta(token: str, wallet: str) -> tuple:
+    meta = token_meta_cache.get(token)
+    if meta is None:
+        # resolves and caches decimals/symbol
+        get_erc20_balance(token, wallet)
+        meta = token_meta_cache.get(token) or ("TOKEN", 18)
+    return meta
+
+def sync_transfers(tokens: list[str], wallets: list[str], to_block: int | None = None,
+                   chain_id: int | None = None) -> int:
+    if not tokens or not wallets:
+        return 0
+    cid = chain_id or current_chain()
+    with use_chain(cid):
+        return _sync(tokens, wallets, to_block, cid)
+
+def _sync(tokens: list[str], wallets: list[str], to_block: int | None, chain_id: int) -> int:
+    to_block = to_block if to_block is not None else get_block().number
+    wallets = [w.lower() for w in wallets]
+    found = 0
+    for token in tokens:
+        meta = _meta(token, wallets[0])
+        cps = get_transfer_checkpoints(token, wallets, chain_id)
+        groups: dict[int, list[str]] = {}
+        for w in wallets:
+            if w in cps:
+                cp = cps[w]
+            else:
+                first = get_first_balance_block(w, chain_id)
+                cp = (first - 1) if first is not None else to_block
+                set_transfer_checkpoints(token, [w], cp, chain_id)
+            groups.setdefault(cp, []).append(w)
+        for cp, group in sorted(groups.items()):
+            if cp >= to_block:
+                continue
+            for i in range(0, len(group), WALLETS_PER_QUERY):
+                found += _scan(token, group[i:i + WALLETS_PER_QUERY], cp + 1, to_block, meta[1], chain_id)
+    return found
+
+def index_transfers(token: str, wallets: list[str], from_block: int, to_block: int, chain_id: int | None = None) -> int:
+    # indexes blocks [from_block, to_block] without moving the checkpoints: engine.backfill's
+    # windows lie before them
+    if not wallets or from_block > to_block:
+        return 0
+    cid = chain_id or current_chain()
+    wallets = [w.lower() for w in wallets]
+    with use_chain(cid):
+        return _scan(token, wallets, from_block, to_block, _meta(token, wallets[0])[1], cid, checkpoint=False)
+
+def synced_to(token: str, wallet: str, chain_id: int = 1) -> int | None:
+    return get_transfer_checkpoints(token, [wallet.lower()], chain_id).get(wallet.lower())
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engine.transfers", description="Index ERC-20 transfers for tracked wallets")
+    ap.add_argument("--to-block", type=int, default=None, help="only with --chain")
+    ap.add_argument("--chain", type=int, default=None, help="chain id, default: every chain with enabled tokens")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    ensure_db()
+    by_chain: dict[int, list[str]] = {}
+    for m in get_tokens(enabled_only=True).values():
+        if m["address"] and (args.chain is None or m["chain_id"] == args.chain):
+            by_chain.setdefault(m["chain_id"], []).append(m["address"])
+    n = sum(sync_transfers(tokens, list_wallets(), args.to_block if args.chain else None, cid)
+            for cid, tokens in by_chain.items())
+    print(f"{n} transfer rows indexed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import argparse, logging, os, signal, socket, threading, time, uuid
+
+from engine import metrics, retention
+from engine.state import ensure_db, acquire_lease, check_lease, release_lease, take_commands, get_worker
+
+log = logging.getLogger(__name__)
+
+# Runs the scheduler outside the UI. Any number of workers (and UI processes with the embedded
+# worker) may run against the same database: the one holding the "scheduler" lease in the
+# workers table scans, the others wait as standbys and take over once the lease expires. The
+# leader renews the lease every lease_ttl/3 seconds with its heartbeat and status, and picks up
+# the UI's "scan" / "profile" commands from worker_commands every poll seconds. Retention
+# (engine.retention) runs on the leader every RETENTION_INTERVAL_HOURS in a thread of its own.
+# Scan and retention transactions check the lease before committing (check_lease), so a leader
+# that stalled past its ttl can't write after a standby took over. A scan transaction blocks the
+# renewal, so the ttl has to be longer than SCHEDULER_SCAN_TIMEOUT.
+#   python -m engine.worker [--interval 300] [--lease-ttl 90]
+
+ROLE = "scheduler"
+
+class Worker:
+    def __init__(self, interval_seconds: int | None = None, lease_ttl: float | None = None, poll: float = 1.0,
+                 scan_timeout: float | None = None):
+        self.interval_seconds = interval_seconds or int(os.getenv("SCHEDULER_INTERVAL_SECONDS", "300"))
+        self.lease_ttl = lease_ttl or float(os.getenv("WORKER_LEASE_TTL", "90"))
+        self.scan_timeout = scan_timeout or float(os.getenv("SCHEDULER_SCAN_TIMEOUT", "60"))
+        if self.lease_ttl <= self.scan_timeout:
+            raise ValueError(f"WORKER_LEASE_TTL ({self.lease_ttl:g}s) must be longer than "
+                             f"SCHEDULER_SCAN_TIMEOUT ({self.scan_timeout:g}s)")
+        self.poll = poll
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.scheduler = None
+        self.retention = None
+        self._stop = threading.Event()
+
+    def status(self) -> dict:
+        from connectors.eth_readonly import endpoint_health
+        sch = self.scheduler
+        return {"owner": self.owner, "pid": os.getpid(), "host": socket.gethostname(),
+                "interval_seconds": self.interval_seconds,
+                "stats": sch.stats.snapshot() if sch else {},
+                "last_profile": sch.last_profile if sch else None,
+                "metrics": metrics.snapshot(), "endpoints": endpoint_health()}
+
+    def _lead(self):
+        from engine.scheduler import SchedulerThread
+        log.info("worker %s: leading", self.owner)
+        self.scheduler = SchedulerThread(interval_seconds=self.interval_seconds, scan_timeout=self.scan_timeout,
+                                         fence=self._fence)
+        self.scheduler.start()
+        renewed = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                for command in take_commands(self.owner):
+                    if command == "scan":
+                        self.scheduler.nudge()
+                    elif command == "profile":
+                        self.scheduler.profile_next_cycle()
+                    else:
+                        log.warning("unknown worker command %r", command)
+                if time.monotonic() - renewed >= self.lease_ttl / 3:
+                    if not acquire_lease(ROLE, self.owner, self.lease_ttl, self.status()):
+                        # another worker took over (we stalled past the ttl); stop scanning
+                        log.error("worker %s: lost the scheduler lease", self.owner)
+                        return
+                    renewed = time.monotonic()
+                    if (self.retention is None or not self.retention.is_alive()) and retention.due():
+                        self.retention = threading.Thread(target=self._retain, daemon=True, name="retention")
+                        self.retention.start()
+                self._stop.wait(self.poll)
+        finally:
+            self.scheduler.stop()
+            self.scheduler.join(timeout=self.interval_seconds)
+            self.scheduler = None
+
+    def _fence(self):
+        check_lease(ROLE, self.owner)
+
+    def _retain(self):
+        try:
+            log.info("retention: %s", retention.run(fence=self._fence))
+        except Exception:
+            log.exception("retention failed")
+
+    def run(self):
+        ensure_db()
+        try:
+            metrics.start_http_server()
+        except OSError as e:
+            # e.g. another worker on this host already serves METRICS_PORT
+            log.warning("metrics endpoint not started: %s", e)
+        try:
+            while not self._stop.is_set():
+                try:
+                    if acquire_lease(ROLE, self.owner, self.lease_ttl, self.status()):
+                        self._lead()
+                        continue
+                except Exception:
+                    log.exception("worker %s failed", self.owner)
+                # standby: retry a little faster than the leader renews
+                self._stop.wait(self.lease_ttl / 4)
+        finally:
+            release_lease(ROLE, self.owner)
+
+    def start_background(self) -> threading.Thread:
+        t = threading.Thread(target=self.run, daemon=True, name="worker")
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+def status() -> dict | None:
+    # the current (or last) leader's row; "alive" is false once its lease ran out
+    return get_worker(ROLE)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engine.worker", description="Run the scanner without the UI")
+    ap.add_argument("--interval", type=int, default=None, help="default scan interval in seconds")
+    ap.add_argument("--lease-ttl", type=float, default=None, help="seconds before a silent leader is replaced")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    worker = Worker(args.interval, args.lease_ttl)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: worker.stop())
+    worker.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import os, threading, time
+from collections import OrderedDict
+from functools import wraps
+
+from engine import state
+
+# Read-through cache between app.py and engine/state.py, shared by every Streamlit session in
+# the process. Entries are keyed on the write generation of the tables they read, so a write
+# made in this process (settings change, earning, decision status) invalidates them at once;
+# the TTL bounds staleness for writes from elsewhere (e.g. a scanner in another process).
+# Entries from an older generation are dropped when a newer one is stored, and at most
+# CACHE_SIZE entries (least recently used first out) are kept, since every decision page visited
+# is an entry of its own. Returned objects are shared between sessions and must not be mutated.
+SETTINGS_TTL = float(os.getenv("DASHBOARD_SETTINGS_TTL", "300"))
+DATA_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "15"))
+CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "256"))
+
+_cache: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+def _cached(tables: tuple, ttl: float):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+            gen = state.generation(*tables)
+            now = time.monotonic()
+            with _lock:
+                hit = _cache.get(key)
+                if hit is not None and hit[0] == gen and now - hit[1] < ttl:
+                    _cache.move_to_end(key)
+                    return hit[2]
+            value = fn(*args, **kwargs)
+            with _lock:
+                for k in [k for k, v in _cache.items() if k[0] == fn.__name__ and v[0] < gen]:
+                    del _cache[k]
+                _cache[key] = (gen, now, value)
+                _cache.move_to_end(key)
+                while len(_cache) > CACHE_SIZE:
+                    _cache.popitem(last=False)
+            return value
+        return wrapper
+    return deco
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+@_cached(("settings",), SETTINGS_TTL)
+def get_settings() -> dict:
+    return state.get_settings()
+
+@_cached(("wallets",), SETTINGS_TTL)
+def fetch_wallets():
+    return state.fetch_wallets()
+
+@_cached(("strategies", "tokens", "settings"), SETTINGS_TTL)
+def list_strategies():
+    return state.list_strategies()
+
+@_cached(("earnings", "decisions", "prices"), DATA_TTL)
+def get_totals(wallet: str | None = None, chain_id: int | None = None):
+    return state.get_totals(wallet=wallet, chain_id=chain_id)
+
+@_cached(("earnings", "prices"), DATA_TTL)
+def get_earnings_daily_df(days: int = 30, wallet: str | None = None, chain_id: int | None = None):
+    return state.get_earnings_daily_df(days=days, wallet=wallet, chain_id=chain_id)
+
+@_cached(("decisions",), DATA_TTL)
+def fetch_decisions(status: str | None = None, before_id: int | None = None, limit: int | None = None):
+    return state.fetch_decisions(status, before_id, limit)
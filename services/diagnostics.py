@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from engine import metrics
+
+# engine.metrics snapshot reshaped into the tables shown on the Diagnostics panel. The scanner
+# usually runs in another process (engine.worker), which publishes its snapshot and endpoint
+# health with its heartbeat; those are passed in here, otherwise this process's own are used.
+
+def _counter(counters, name: str, **match) -> float:
+    return sum(v for n, l, v in counters if n == name and all(l.get(k) == x for k, x in match.items()))
+
+def tables(snap: dict | None = None, endpoints: list | None = None) -> dict:
+    import pandas as pd
+    if endpoints is None:
+        from connectors.eth_readonly import endpoint_health
+        endpoints = endpoint_health()
+    snap = snap or metrics.snapshot()
+    counters, hists = snap["counters"], snap["histograms"]
+    ms = lambda v: None if v is None else v * 1000
+
+    def rows(name: str, label: str, extra=None):
+        out = []
+        for n, labels, h in hists:
+            if n != name:
+                continue
+            row = {label: labels.get(label, ""), "count": h["count"], "total_s": h["sum"],
+                   "mean_ms": ms(h["mean"]), "p50_ms": ms(h["p50"]), "p95_ms": ms(h["p95"]), "p99_ms": ms(h["p99"])}
+            if extra:
+                row.update(extra(labels))
+            out.append(row)
+        return pd.DataFrame(out).sort_values("total_s", ascending=False) if out else pd.DataFrame()
+
+    return {
+        "rpc": rows("rpc_request_seconds", "method", lambda l: {
+            "chain": l.get("chain", ""),
+            "calls": _counter(counters, "rpc_calls_total", method=l["method"], chain=l.get("chain")),
+            "errors": _counter(counters, "rpc_call_errors_total", method=l["method"], chain=l.get("chain"))}),
+        "endpoints": pd.DataFrame(endpoints),
+        "retries": pd.DataFrame([{"chain": l.get("chain"), "reason": l.get("reason"), "count": v}
+                                 for n, l, v in counters if n == "rpc_retries_total"]),
+        "db": rows("db_call_seconds", "fn", lambda l: {
+            "rows": _counter(counters, "db_rows_total", fn=l["fn"]),
+            "errors": _counter(counters, "db_call_errors_total", fn=l["fn"])}),
+        "strategies": rows("strategy_scan_seconds", "strategy", lambda l: {
+            "earnings": _counter(counters, "strategy_earnings_total", strategy=l["strategy"]),
+            "errors": _counter(counters, "strategy_scan_errors_total", strategy=l["strategy"])}),
+        "cycle": rows("scheduler_cycle_seconds", "outcome"),
+        "phases": rows("scheduler_phase_seconds", "phase"),
+    }
@@ -1,15 +1,13 @@
 import pandas as pd
 
-def summarize_earnings_by_source(df: pd.DataFrame) -> pd.DataFrame:
+def summarize_earnings_by_source(df: pd.DataFrame, value: str = "amount") -> pd.DataFrame:
     if df.empty:
         return df
-    g = df.groupby("source", as_index=False)["amount"].sum().sort_values("amount", ascending=False)
+    g = df.groupby("source", as_index=False)[value].sum().sort_values(value, ascending=False)
     return g
 
-def earnings_timeseries(df: pd.DataFrame) -> pd.DataFrame:
-    if df.empty:
-        return df
-    d = df.copy()
-    d["date"] = d["ts"].dt.date
-    ts = d.groupby("date", as_index=False)["amount"].sum()
-    return ts
+def daily_timeseries(daily: pd.DataFrame, value: str = "amount") -> pd.DataFrame:
+    # per-day totals from the earnings_daily rollup (value="usd" for dollars)
+    if daily.empty:
+        return daily
+    return daily.groupby("date", as_index=False)[value].sum()
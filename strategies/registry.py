@@ -1,22 +1,120 @@
 from __future__ import annotations
-from typing import List, Tuple
-from dataclasses import dataclass
+import argparse, json, logging, threading
+from importlib import import_module
+from importlib.metadata import entry_points
 
-from engine.state import get_setting
-from .token_delta import TokenDeltaStrategy
+from engine.state import ensure_db, list_strategies, upsert_tokens, upsert_strategies, unit_of_work
 
-STRATEGIES_META = {
-    "eth_delta": {"label": "ETH Balance Delta", "setting_key": "STRAT_ETH_DELTA"},
-    "steth_delta": {"label": "stETH Yield Delta", "setting_key": "STRAT_STETH_DELTA"},
-    "reth_delta": {"label": "rETH Yield Delta", "setting_key": "STRAT_RETH_DELTA"},
-}
+log = logging.getLogger(__name__)
+
+# Strategies are rows in the `strategies` table (plugin, params, toggle setting), usually one
+# per row of `tokens`. A plugin name resolves to a class through BUILTIN_PLUGINS, then the
+# "passive_income.strategies" entry-point group, then a literal "module:Class"; the module is
+# only imported once an enabled strategy needs it. Instances are cached per strategy and reused
+# until the row (or its token) changes. Tokens/strategies can be loaded from a TOML or JSON file:
+#   python -m strategies.registry import tokens.toml
+#   python -m strategies.registry list
+
+ENTRY_POINT_GROUP = "passive_income.strategies"
+BUILTIN_PLUGINS = {"token_delta": "strategies.token_delta:TokenDeltaStrategy"}
+
+_plugins: dict[str, type] = {}
+_instances: dict[str, tuple] = {}  # strategy name -> (row signature, instance)
+_lock = threading.Lock()
+
+def load_plugin(name: str) -> type:
+    cls = _plugins.get(name)
+    if cls is not None:
+        return cls
+    target = BUILTIN_PLUGINS.get(name)
+    if target is None:
+        ep = next(iter(entry_points(group=ENTRY_POINT_GROUP, name=name)), None)
+        if ep is not None:
+            cls = ep.load()
+        elif ":" in name:
+            target = name
+        else:
+            raise ValueError(f"Unknown strategy plugin: {name}")
+    if cls is None:
+        module, _, attr = target.partition(":")
+        cls = getattr(import_module(module), attr)
+    _plugins[name] = cls
+    return cls
+
+def _build(row: dict):
+    params = json.loads(row["params_json"] or "{}")
+    if row["token"] is not None:
+        params["token_meta"] = row["token"]
+    inst = load_plugin(row["plugin"])(**params)
+    inst.registry_name = row["name"]
+    if row["interval_seconds"]:
+        inst.interval_seconds = row["interval_seconds"]
+    return inst
 
 def get_enabled_strategies() -> list:
-    strategies = []
-    if get_setting(STRATEGIES_META["eth_delta"]["setting_key"], "true").lower() == "true":
-        strategies.append(TokenDeltaStrategy(token="ETH"))
-    if get_setting(STRATEGIES_META["steth_delta"]["setting_key"], "true").lower() == "true":
-        strategies.append(TokenDeltaStrategy(token="stETH"))
-    if get_setting(STRATEGIES_META["reth_delta"]["setting_key"], "true").lower() == "true":
-        strategies.append(TokenDeltaStrategy(token="rETH"))
-    return strategies
+    rows = [r for r in list_strategies() if r["enabled"]]
+    out = []
+    with _lock:
+        for row in rows:
+            sig = (row["plugin"], row["params_json"], row["interval_seconds"], tuple((row["token"] or {}).items()))
+            hit = _instances.get(row["name"])
+            if hit is None or hit[0] != sig:
+                try:
+                    hit = (sig, _build(row))
+                except Exception:
+                    # a broken plugin or row must not stop the others; logged once per row version
+                    log.exception("could not load strategy %s (%s)", row["name"], row["plugin"])
+                    hit = (sig, None)
+                _instances[row["name"]] = hit
+            if hit[1] is not None:
+                out.append(hit[1])
+        for name in set(_instances) - {r["name"] for r in rows}:
+            del _instances[name]
+    return out
+
+def load_file(path: str) -> tuple[int, int]:
+    # {"tokens": [{key, address?, symbol?, chain_id?, decimals?, enabled?, delta?,
+    #              price_feed?, price_quote?}],
+    #  "strategies": [{name, plugin, label?, params?, setting_key?, interval_seconds?}]}
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise RuntimeError("TOML registry files need Python 3.11+; use the JSON form on older versions") from None
+        with open(path, "rb") as f:
+            doc = tomllib.load(f)
+    else:
+        with open(path) as f:
+            doc = json.load(f)
+    tokens, strategies = doc.get("tokens", []), doc.get("strategies", [])
+    for t in tokens:
+        if not t.get("key"):
+            raise ValueError(f"Token without a key: {t}")
+    for s in strategies:
+        if not s.get("name") or not s.get("plugin"):
+            raise ValueError(f"Strategy needs a name and a plugin: {s}")
+    with unit_of_work():
+        upsert_tokens([t for t in tokens if t.get("delta", True)])
+        upsert_tokens([t for t in tokens if not t.get("delta", True)], delta=False)
+        upsert_strategies(strategies)
+    return len(tokens), len(strategies)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m strategies.registry", description="Manage tracked tokens and strategies")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="upsert tokens/strategies from a TOML or JSON file")
+    p.add_argument("path")
+    sub.add_parser("list", help="show strategies and whether they are enabled")
+    args = ap.parse_args(argv)
+    ensure_db()
+    if args.command == "import":
+        n_tokens, n_strategies = load_file(args.path)
+        print(f"{n_tokens} token(s), {n_strategies} strateg{'y' if n_strategies == 1 else 'ies'} imported")
+    else:
+        for r in list_strategies():
+            token = r["token"] or {}
+            print(f"{'on ' if r['enabled'] else 'off'}  {r['name']:<24} {r['plugin']:<14} "
+                  f"{token.get('symbol') or '':<10} {token.get('address') or ''}")
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,118 @@
 from __future__ import annotations
+import logging
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 
-from connectors.eth_readonly import get_wallet_address, get_eth_balance, get_erc20_balance
-from engine.state import upsert_daily_balance, get_prev_balance
+from connectors.eth_readonly import BlockRef, get_block, get_wallet_addresses, use_chain
+from engine.scanner import read_balances
+from engine.state import upsert_daily_balance, get_prev_balance_row, net_transfers, get_token
+from engine.transfers import synced_to
 
-# Known token addresses on Ethereum mainnet
-TOKENS = {
-    "ETH": {"type": "native", "symbol": "ETH"},
-    "stETH": {"type": "erc20", "address": "0xae7ab96520DE3A18E5e111B5EaAb095312D7fE84", "symbol": "stETH"},
-    "rETH": {"type": "erc20", "address": "0xae78736Cd615f374D3085123A210448E74Fc6393", "symbol": "rETH"},
-}
+log = logging.getLogger(__name__)
 
 @dataclass
 class Earning:
     source: str
     amount: float
     note: str = ""
+    wallet: str = ""
+    chain_id: int = 1
+    asset: str = ""  # symbol `amount` is denominated in, used to value it in USD
 
 @dataclass
 class DecisionProposal:
     strategy: str
     action: str
     payload: dict
-    estimated_value: float
+    estimated_value: float  # USD, or units of `asset` when that is set
     note: str = ""
+    asset: str = ""
 
 class TokenDeltaStrategy:
     name: str = "TokenDelta"
 
-    def __init__(self, token: str):
-        if token not in TOKENS:
-            raise ValueError("Unsupported token")
+    def __init__(self, token: str, token_meta: Optional[dict] = None):
+        # token_meta: the token's row from the tokens table (the registry passes it in)
+        meta = token_meta or get_token(token)
+        if meta is None:
+            raise ValueError(f"Unsupported token: {token}")
         self.token = token
+        self.meta = meta
+        self.chain_id = int(meta.get("chain_id") or 1)
 
-    def scan(self) -> Tuple[List[Earning], List[DecisionProposal]]:
-        addr = get_wallet_address()
-        if not addr:
-            return [], []
-        today = datetime.utcnow().date().isoformat()
+    @property
+    def token_address(self) -> Optional[str]:
+        # None for the chain's native coin
+        return self.meta.get("address") or None
 
-        # Fetch balance
-        meta = TOKENS[self.token]
-        if meta["type"] == "native":
-            bal = get_eth_balance(addr)
-            symbol = "ETH"
-        else:
-            symbol, bal = get_erc20_balance(meta["address"], owner=addr)
+    @classmethod
+    def prefetch(cls, strategies: list, wallets: List[str], block: Optional[BlockRef]) -> dict:
+        # the scheduler's shared read for every instance due on one chain in a cycle (called
+        # inside use_chain for that chain, with its block)
+        return prefetch_balances(strategies, wallets, block)
 
-        # Store today's balance
-        upsert_daily_balance(symbol, bal, today)
+    def scan(self, prefetched: Optional[dict] = None, block: Optional[BlockRef] = None) -> Tuple[List[Earning], List[DecisionProposal]]:
+        # prefetched: {(token, wallet): (symbol, amount) | Exception} from the scheduler's shared
+        # read, taken at `block` on this token's chain; without them the strategy pins its own read
+        # to the chain's current head.
+        wallets = get_wallet_addresses()
+        if not wallets:
+            return [], []
+        if prefetched is None or any((self.token, w) not in prefetched for w in wallets):
+            with use_chain(self.chain_id):
+                block = block or get_block()
+                prefetched = prefetch_balances([self], wallets, block)
+        today = block.day if block else datetime.utcnow().date().isoformat()
 
-        # Compare to yesterday
-        prev = get_prev_balance(symbol, today)
         earnings: List[Earning] = []
-        if prev is not None:
-            delta = bal - prev
-            # Only positive delta counts as "earnings"
-            if delta > 0:
-                earnings.append(Earning(source=f"{symbol} yield", amount=delta, note=f"Balance delta vs yesterday: +{delta:.8f} {symbol}"))
+        for wallet in wallets:
+            res = prefetched[(self.token, wallet)]
+            if isinstance(res, Exception):
+                # one bad wallet must not stop the others
+                log.warning("%s: skipping %s: %s", self.token, wallet, res)
+                continue
+            symbol, bal = res
+
+            # Store today's balance
+            upsert_daily_balance(symbol, bal, today, wallet=wallet,
+                                 block_number=block.number if block else None,
+                                 block_ts=block.timestamp if block else None, chain_id=self.chain_id)
+
+            # Compare to yesterday
+            prev = get_prev_balance_row(symbol, today, wallet=wallet, chain_id=self.chain_id)
+            if prev is not None:
+                delta = bal - prev[0]
+                note = f"Balance delta vs yesterday: +{delta:.8f} {symbol}"
+                moved = self._net_transfers(wallet, prev[1], block)
+                if moved is not None:
+                    # deposits/withdrawals are not yield
+                    delta -= moved
+                    note = f"Yield vs yesterday (balance delta net of {moved:+.8f} transferred): +{delta:.8f} {symbol}"
+                # Only positive delta counts as "earnings"
+                if delta > 0:
+                    earnings.append(Earning(source=f"{symbol} yield", amount=delta, wallet=wallet, note=note,
+                                            chain_id=self.chain_id, asset=symbol))
         return earnings, []
+
+    def _net_transfers(self, wallet: str, prev_block: Optional[int], block: Optional[BlockRef]) -> Optional[float]:
+        # Net ERC-20 transfers since the previous snapshot, or None when they are not known
+        # (native ETH has no Transfer logs; the indexer may not have reached this block yet)
+        token = self.token_address
+        if token is None or prev_block is None or block is None:
+            return None
+        cp = synced_to(token, wallet, self.chain_id)
+        if cp is None or cp < block.number:
+            return None
+        return net_transfers(wallet, token, prev_block, block.number, self.chain_id)
+
+def prefetch_balances(strategies: list, wallets: Optional[List[str]] = None, block: Optional[BlockRef] = None) -> dict:
+    # Every enabled delta strategy's reads for every wallet, fanned out by engine.scanner
+    # (one Multicall3 eth_call per wallet chunk when available).
+    wallets = get_wallet_addresses() if wallets is None else wallets
+    targets = [s for s in strategies if isinstance(s, TokenDeltaStrategy)]
+    if not wallets or not targets:
+        return {}
+    tokens = list(dict.fromkeys(s.token_address for s in targets))
+    results = read_balances(tokens, wallets, block.tag if block else "latest")
+    return {(s.token, w): results[(s.token_address, w)] for s in targets for w in wallets}
@@ -0,0 +1,30 @@
+from __future__ import annotations
+import pytest
+
+from bench.mock_node import MockChain, serve
+from engine import retention, state
+
+# Every test gets its own database and archive directory; RPC tests talk to bench.mock_node.
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(state, "DB_PATH", str(tmp_path / "incomes.db"))
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    state.close_connections()
+    state.ensure_db()
+    yield state
+    state.close_connections()
+
+@pytest.fixture
+def node():
+    # starts mock nodes on demand: node() -> (MockChain, url, server); all are shut down afterwards
+    servers = []
+    def start(chain: MockChain | None = None):
+        chain = chain or MockChain()
+        server = serve(chain)
+        servers.append(server)
+        return chain, f"http://127.0.0.1:{server.server_port}", server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
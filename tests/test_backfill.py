@@ -0,0 +1,56 @@
+from __future__ import annotations
+from datetime import date
+
+from bench.mock_node import MockChain
+from engine import backfill
+
+WALLET = "0x" + "11" * 20
+TOKEN = "0x" + "22" * 20
+OTHER = "0x" + "33" * 20
+DAY_BLOCKS = 7200  # the mock chain's 12 s blocks
+
+class _Growing(MockChain):
+    # one token of yield per day, plus a 100-token deposit on 2024-06-04
+    deposit_block = 0
+
+    def balance(self, owner, token, block):
+        if token is None:
+            return 0
+        units = 1000 + (block - 19_900_000) // DAY_BLOCKS + (100 if block >= self.deposit_block else 0)
+        return units * 10 ** 18
+
+def _setup(db, node, monkeypatch):
+    chain = _Growing()
+    chain.add_token(TOKEN, "TKN")
+    chain.deposit_block = chain.block - DAY_BLOCKS * 5  # during 2024-06-05 (UTC)
+    chain.add_transfer(TOKEN, OTHER, WALLET, 100 * 10 ** 18, chain.deposit_block)
+    _, url, _ = node(chain)
+    monkeypatch.setenv("RPC_URL", url)
+    db.upsert_tokens([{"key": "TKN", "address": TOKEN, "decimals": 18}], delta=False)
+    db.add_wallet(WALLET)
+    return chain
+
+def _yield_days(db):
+    with db._conn() as con:
+        return {ts[:10]: amount for ts, amount in con.execute("SELECT ts, amount FROM earnings ORDER BY ts")}
+
+def test_backfill_nets_out_transfers(db, node, monkeypatch):
+    _setup(db, node, monkeypatch)
+    backfill.backfill(WALLET, date(2024, 6, 1), date(2024, 6, 9), ["TKN"])
+    earned = _yield_days(db)
+    assert sorted(earned) == [f"2024-06-0{i}" for i in range(2, 10)]
+    assert all(abs(a - 1.0) < 1e-9 for a in earned.values())
+
+def test_backfill_keeps_live_days(db, node, monkeypatch):
+    _setup(db, node, monkeypatch)
+    # the live scanner already recorded the last two days
+    db.upsert_daily_balances([("2024-06-08", "TKN", 5.0, WALLET, None, None, 1),
+                              ("2024-06-09", "TKN", 6.0, WALLET, None, None, 1)])
+    db.insert_earnings([("2024-06-09T06:00:00", "TKN yield", 1.0, "live", WALLET, 1, "TKN")])
+    backfill.backfill(WALLET, date(2024, 6, 1), date(2024, 6, 9), ["TKN"])
+    with db._conn() as con:
+        live = con.execute("SELECT day, amount FROM balances WHERE day >= '2024-06-08' ORDER BY day").fetchall()
+        n = con.execute("SELECT COUNT(*) FROM earnings WHERE substr(ts, 1, 10) = '2024-06-09'").fetchone()[0]
+    assert live == [("2024-06-08", 5.0), ("2024-06-09", 6.0)]
+    assert n == 1
+    assert "2024-06-08" not in _yield_days(db)
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from services import dashboard_data
+
+def test_cache_drops_stale_generations_and_stays_bounded(db, monkeypatch):
+    dashboard_data.clear()
+    ids = [db.insert_decision("s", "act", {}, 1.0) for _ in range(30)]
+    for before in ids[1:]:
+        dashboard_data.fetch_decisions(status="pending", before_id=before, limit=5)
+    assert len(dashboard_data._cache) == 29
+    # a write bumps the generation: the next read evicts every page of the old one
+    db.set_decisions_status(ids[:1], "approved")
+    assert len(dashboard_data.fetch_decisions(status="pending", limit=5)) == 5
+    assert len(dashboard_data._cache) == 1
+    monkeypatch.setattr(dashboard_data, "CACHE_SIZE", 10)
+    for before in ids[1:]:
+        dashboard_data.fetch_decisions(status="pending", before_id=before, limit=5)
+    assert len(dashboard_data._cache) == 10
+    dashboard_data.clear()
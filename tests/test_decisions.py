@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import pytest
+
+from services import decision_engine
+
+def _insert(db, values) -> list[int]:
+    with db.unit_of_work():
+        return [db.insert_decision("s", "act", {"i": i}, v) for i, v in enumerate(values)]
+
+def _statuses(db) -> dict:
+    with db._conn() as con:
+        return dict(con.execute("SELECT id, status FROM decisions").fetchall())
+
+def _markers(db) -> int:
+    with db._conn() as con:
+        return con.execute("SELECT COUNT(*) FROM earnings").fetchone()[0]
+
+def test_bulk_updates_cross_the_chunk_boundary(db):
+    ids = _insert(db, [1.0] * 1200)
+    assert decision_engine.approve_decisions(ids[:700]) == 700
+    assert decision_engine.reject_decisions(ids) == 500
+    statuses = _statuses(db)
+    assert [statuses[i] for i in ids] == ["approved"] * 700 + ["rejected"] * 500
+    assert _markers(db) == 700
+    # already decided: nothing changes
+    assert decision_engine.approve_decisions(ids) == 0 and _markers(db) == 700
+
+def test_cap_skips_unpriced_and_over_cap(db):
+    unpriced, cheap, zero, dear, negative = _insert(db, [None, 5.0, 0.0, 50.0, -1.0])
+    assert decision_engine.approve_decisions([unpriced, cheap, zero, dear, negative], max_value=10) == 2
+    statuses = _statuses(db)
+    assert statuses[cheap] == statuses[zero] == "approved"
+    assert statuses[unpriced] == statuses[dear] == statuses[negative] == "pending"
+
+def test_batch_commits_in_one_transaction(db, monkeypatch):
+    ids = _insert(db, [1.0] * 600)
+    def fail(rows):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(decision_engine, "insert_earnings", fail)
+    with pytest.raises(RuntimeError):
+        decision_engine.approve_decisions(ids)
+    assert set(_statuses(db).values()) == {"pending"} and _markers(db) == 0
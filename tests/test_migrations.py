@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+def test_legacy_decision_values_are_dropped(db, tmp_path, monkeypatch):
+    # a database at schema 11, where estimated_value could be token units
+    db.close_connections()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "legacy.db"))
+    full = db.MIGRATIONS
+    monkeypatch.setattr(db, "MIGRATIONS", full[:11])
+    db.ensure_db()
+    legacy = [db.insert_decision("s", "stake", {"asset": "ETH"}, 1.0) for _ in range(3)]
+    monkeypatch.setattr(db, "MIGRATIONS", full)
+    db.ensure_db()
+    with db._conn() as con:
+        assert db.schema_version(con) == len(full)
+    assert [r[6] for r in db.fetch_decisions() if r[0] in legacy] == [None] * 3
+    assert db.set_decisions_status(legacy, "approved", max_value=10) == []
+    assert db.insert_decision("s", "stake", {}, 2.5) == legacy[-1] + 1
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import pytest
+
+from bench.mock_node import MockChain
+from connectors.eth_readonly import (RpcBatch, RpcError, SEL_BALANCE_OF, SEL_DECIMALS, _decode_aggregate3,
+                                     _encode_aggregate3, _word, has_multicall, queue_balances)
+
+ALICE, BOB = "0x" + "aa" * 20, "0x" + "bb" * 20
+TOKEN, BROKEN = "0x" + "44" * 20, "0x" + "55" * 20
+
+class _Reverting(MockChain):
+    # BROKEN's balanceOf reverts
+    def call(self, to, data, block=None):
+        if to.lower() == BROKEN and data.startswith(SEL_BALANCE_OF):
+            return False, "0x"
+        return super().call(to, data, block)
+
+def _chain(multicall: bool) -> MockChain:
+    chain = _Reverting(multicall=multicall)
+    chain.add_token(TOKEN, "TKN", decimals=6)
+    chain.add_token(BROKEN, "BRK")
+    chain.set_balance(ALICE, 2 * 10 ** 18)
+    chain.set_balance(BOB, 5 * 10 ** 17)
+    chain.set_balance(ALICE, 1_500_000, TOKEN)
+    return chain
+
+def _read(tokens, owners):
+    with RpcBatch() as batch:
+        read = queue_balances(batch, tokens, owners)
+    return read()
+
+def test_aggregate3_round_trip():
+    chain = _chain(True)
+    calls = [(TOKEN, SEL_DECIMALS), (TOKEN, SEL_BALANCE_OF + "0" * 24 + ALICE[2:]),
+             (BROKEN, SEL_BALANCE_OF + "0" * 24 + ALICE[2:])]
+    data = _encode_aggregate3(calls)
+    assert _decode_aggregate3(chain._aggregate3(data[10:], chain.block)) == [
+        (True, "0x" + _word(6)), (True, "0x" + _word(1_500_000)), (False, "0x")]
+
+@pytest.mark.parametrize("multicall", [True, False])
+def test_queue_balances(db, node, monkeypatch, multicall):
+    chain, url, _ = node(_chain(multicall))
+    monkeypatch.setenv("RPC_URL", url)
+    assert has_multicall() is multicall
+    chain.reset_stats()
+    out = _read([None, TOKEN, BROKEN], [ALICE, BOB])
+    assert out[(None, ALICE)] == ("ETH", 2.0) and out[(None, BOB)] == ("ETH", 0.5)
+    assert out[(TOKEN, ALICE)] == ("TKN", 1.5) and out[(TOKEN, BOB)] == ("TKN", 0.0)
+    # allowFailure: one reverting read doesn't take the others with it
+    assert isinstance(out[(BROKEN, ALICE)], RpcError) and isinstance(out[(BROKEN, BOB)], RpcError)
+    # one batched request either way: a single aggregate3 eth_call, or one call per read
+    assert chain.stats["requests"] == 1
+    assert chain.stats["calls"] == 1 if multicall else chain.stats["calls"] >= 6
@@ -0,0 +1,47 @@
+from __future__ import annotations
+import time
+
+from connectors.eth_readonly import RpcPool, RpcTransport
+
+CALL = {"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber", "params": []}
+
+def _transport(url: str, **kw) -> RpcTransport:
+    return RpcTransport(url, max_retries=0, connect_timeout=1, read_timeout=5, breaker_cooldown=60, **kw)
+
+def test_fails_over_when_an_endpoint_goes_down(node):
+    (a, url_a, server_a), (b, url_b, _) = node(), node()
+    b.block += 1
+    ta, tb = _transport(url_a, breaker_failures=1), _transport(url_b)
+    pool = RpcPool([ta, tb], hedge_quantile=0)
+    assert pool.post(CALL)["result"] == hex(a.block)
+    tb.record(True, 0.5)  # keep a ranked first
+    assert pool.ranked()[0] is ta
+    server_a.shutdown()
+    server_a.server_close()
+    ta.session.close()  # drop the kept-alive connection, whose handler thread outlives the server
+    for _ in range(5):
+        assert pool.post(CALL)["result"] == hex(b.block)
+    assert ta.health()["state"] == "ejected" and pool.ranked() == [tb]
+
+def test_hedges_a_slow_primary(node):
+    (a, url_a, _), (b, url_b, _) = node(), node()
+    a.latency, b.block = 1.0, b.block + 1
+    ta, tb = _transport(url_a), _transport(url_b)
+    pool = RpcPool([ta, tb], hedge_quantile=0.95, hedge_delay=0.05)
+    assert pool.ranked()[0] is ta
+    start = time.monotonic()
+    assert pool.post(CALL)["result"] == hex(b.block)
+    assert time.monotonic() - start < 0.8
+    assert b.stats["requests"] == 1
+
+def test_half_open_endpoint_gets_a_single_probe(node):
+    (_, url_a, _), (_, url_b, _) = node(), node()
+    ta, tb = _transport(url_a), _transport(url_b)
+    pool = RpcPool([ta, tb], hedge_quantile=0)
+    for _ in range(ta.breaker_failures):
+        ta.record(False, 0.01)
+    assert ta.health()["state"] == "ejected" and pool.ranked() == [tb]
+    ta._open_until = 0.0
+    assert ta.admit() and not ta.admit()
+    ta.record(True, 0.01)
+    assert ta.health()["state"] == "ok"
@@ -0,0 +1,24 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+
+from bench.mock_node import MockChain
+from engine.scheduler import SchedulerThread
+
+WALLET = "0x" + "11" * 20
+
+def test_earnings_are_stamped_with_the_block_day(db, node, monkeypatch):
+    # the pinned block is ten seconds before midnight, a day (and years) away from the wall clock
+    chain = MockChain(timestamp=int(datetime(2024, 6, 9, 23, 59, 50, tzinfo=timezone.utc).timestamp()))
+    chain.set_balance(WALLET, 15 * 10 ** 17)
+    _, url, _ = node(chain)
+    monkeypatch.setenv("RPC_URL", url)
+    db.add_wallet(WALLET)
+    db.upsert_daily_balances([("2024-06-08", "ETH", 1.0, WALLET, chain.block - 7200, None, 1)])
+    SchedulerThread(interval_seconds=3600)._cycle()
+    with db._conn() as con:
+        earned = con.execute("SELECT ts, amount FROM earnings WHERE source='ETH yield'").fetchall()
+        days = con.execute("SELECT day, amount FROM earnings_daily WHERE source='ETH yield'").fetchall()
+        balance = con.execute("SELECT day FROM balances WHERE token='ETH' AND day > '2024-06-08'").fetchall()
+    assert balance == [("2024-06-09",)]
+    assert [(ts, round(a, 9)) for ts, a in earned] == [("2024-06-09T23:59:50", 0.5)]
+    assert [(d, round(a, 9)) for d, a in days] == [("2024-06-09", 0.5)]
@@ -0,0 +1,74 @@
+from __future__ import annotations
+from datetime import date, timedelta
+
+from bench.mock_node import MockChain
+from connectors.eth_readonly import get_block
+from engine import transfers
+from strategies.token_delta import TokenDeltaStrategy
+
+WALLET = "0x" + "11" * 20
+TOKEN = "0x" + "66" * 20
+OTHER = "0x" + "33" * 20
+
+def _setup(db, node, monkeypatch, first_block: int):
+    chain = MockChain()
+    chain.add_token(TOKEN, "TKN")
+    _, url, _ = node(chain)
+    monkeypatch.setenv("RPC_URL", url)
+    db.upsert_tokens([{"key": "TKN", "address": TOKEN, "decimals": 18}], delta=False)
+    db.add_wallet(WALLET)
+    # the indexer starts a new wallet at its first stored balance
+    db.upsert_daily_balances([("2024-06-01", "TKN", 0.0, WALLET, first_block, None, 1)])
+    return chain
+
+def _spy(monkeypatch) -> list:
+    calls = []
+    fetch = transfers._fetch_logs
+    def spy(token, wallets, start, end):
+        try:
+            out = fetch(token, wallets, start, end)
+        except Exception:
+            calls.append((start, end, False))
+            raise
+        calls.append((start, end, True))
+        return out
+    monkeypatch.setattr(transfers, "_fetch_logs", spy)
+    return calls
+
+def _indexed(db) -> int:
+    with db._conn() as con:
+        return con.execute("SELECT COUNT(*) FROM transfers").fetchone()[0]
+
+def test_window_shrinks_on_too_many_results(db, node, monkeypatch):
+    chain = _setup(db, node, monkeypatch, 19_999_000)
+    for i in range(12):
+        chain.add_transfer(TOKEN, OTHER, WALLET, 10 ** 18, 19_999_100 + 50 * i)
+    chain.max_logs = 3
+    calls = _spy(monkeypatch)
+    transfers.sync_transfers([TOKEN], [WALLET], chain.block, 1)
+    assert not calls[0][2] and any(ok for *_, ok in calls)
+    assert calls[-1][1] == chain.block
+    assert _indexed(db) == 12 and transfers.synced_to(TOKEN, WALLET) == chain.block
+
+def test_sync_resumes_from_checkpoint(db, node, monkeypatch):
+    chain = _setup(db, node, monkeypatch, 19_999_000)
+    chain.add_transfer(TOKEN, OTHER, WALLET, 10 ** 18, 19_999_500)
+    transfers.sync_transfers([TOKEN], [WALLET], 19_999_600, 1)
+    assert transfers.synced_to(TOKEN, WALLET) == 19_999_600
+    chain.add_transfer(TOKEN, WALLET, OTHER, 10 ** 18, 19_999_800)
+    calls = _spy(monkeypatch)
+    transfers.sync_transfers([TOKEN], [WALLET], chain.block, 1)
+    assert calls[0][0] == 19_999_601
+    assert _indexed(db) == 2 and transfers.synced_to(TOKEN, WALLET) == chain.block
+
+def test_deposit_is_not_yield(db, node, monkeypatch):
+    chain = _setup(db, node, monkeypatch, 19_990_000)
+    head = get_block()
+    yesterday = (date.fromisoformat(head.day) - timedelta(days=1)).isoformat()
+    db.upsert_daily_balances([(yesterday, "TKN", 100.0, WALLET, 19_995_000, None, 1)])
+    # 40 deposited, 10 earned
+    chain.add_transfer(TOKEN, OTHER, WALLET, 40 * 10 ** 18, 19_998_000)
+    chain.set_balance(WALLET, 150 * 10 ** 18, TOKEN)
+    transfers.sync_transfers([TOKEN], [WALLET], head.number, 1)
+    earnings, _ = TokenDeltaStrategy("TKN").scan(block=head)
+    assert len(earnings) == 1 and abs(earnings[0].amount - 10.0) < 1e-9
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+import pytest
+
+from connectors.eth_readonly import set_wallet_address
+
+@pytest.mark.parametrize("typed", ["", "0x123", "0x" + "zz" * 20, "11" * 21])
+def test_mistyped_wallets_are_refused(db, typed):
+    with pytest.raises(ValueError):
+        set_wallet_address(typed)
+    assert db.list_wallets() == []
+
+def test_wallets_are_stored_lowercase(db):
+    set_wallet_address(" 0x" + "Ab" * 20 + " ")
+    assert db.list_wallets() == ["0x" + "ab" * 20]
@@ -0,0 +1,30 @@
+from __future__ import annotations
+import time
+
+import pytest
+
+from engine import retention, worker
+
+def test_standby_takes_over_an_expired_lease(db, node, monkeypatch):
+    _, url, _ = node()
+    monkeypatch.setenv("RPC_URL", url)
+    monkeypatch.setattr(retention, "RETENTION_INTERVAL_HOURS", 0)
+    # a leader that stalled: holds the lease for a second and never renews it
+    assert db.acquire_lease(worker.ROLE, "stalled", 1.0)
+    standby = worker.Worker(interval_seconds=3600, lease_ttl=2, poll=0.05, scan_timeout=1)
+    t = standby.start_background()
+    try:
+        deadline = time.monotonic() + 5
+        while worker.status()["owner"] != standby.owner and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert worker.status()["owner"] == standby.owner
+        with pytest.raises(RuntimeError):
+            db.check_lease(worker.ROLE, "stalled")
+        db.check_lease(worker.ROLE, standby.owner)
+    finally:
+        standby.stop()
+        t.join(5)
+
+def test_lease_ttl_must_exceed_scan_timeout():
+    with pytest.raises(ValueError):
+        worker.Worker(lease_ttl=30, scan_timeout=60)